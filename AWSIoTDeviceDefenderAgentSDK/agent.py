@@ -15,9 +15,18 @@
 from awscrt import io, mqtt5, auth, http
 from awsiot import mqtt5_client_builder
 from AWSIoTDeviceDefenderAgentSDK import collector
+from AWSIoTDeviceDefenderAgentSDK import connections
+from AWSIoTDeviceDefenderAgentSDK import metrics
+from AWSIoTDeviceDefenderAgentSDK.scheduler import Scheduler
+from AWSIoTDeviceDefenderAgentSDK import async_agent
+from AWSIoTDeviceDefenderAgentSDK import spool
+from AWSIoTDeviceDefenderAgentSDK import publisher
+from AWSIoTDeviceDefenderAgentSDK.router import TopicRouter
+import asyncio
 import logging
+import threading
 import argparse
-from time import sleep
+from time import monotonic
 from socket import gethostname
 import cbor2 as cbor
 import sys
@@ -25,6 +34,32 @@ import sys
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# CRT event loop group, host resolver and bootstrap shared by every client of the process, see shared_client_bootstrap
+_crt_lock = threading.Lock()
+_client_bootstrap = None
+
+
+def shared_client_bootstrap(event_loop_threads=1):
+    """
+    Returns the process-wide CRT client bootstrap, created on first use.
+
+    Creating an event loop group and host resolver costs a thread and a DNS cache each, so every client and
+    every reconnection of the process reuses the same ones, and resolved endpoint addresses stay cached.
+
+    Parameters
+    ----------
+    event_loop_threads : int
+            Threads of the event loop group, only used when the bootstrap is created.
+    """
+    global _client_bootstrap
+    with _crt_lock:
+        if _client_bootstrap is None:
+            logger.debug("Creating AWS CRT resources")
+            event_loop_group = io.EventLoopGroup(event_loop_threads)
+            host_resolver = io.DefaultHostResolver(event_loop_group)
+            _client_bootstrap = io.ClientBootstrap(event_loop_group, host_resolver)
+        return _client_bootstrap
+
 
 class IoTClientWrapper(object):
     """
@@ -47,7 +82,18 @@ class IoTClientWrapper(object):
         proxy_host,
         proxy_port,
         use_websocket,
+        client_bootstrap=None,
+        callback_workers=2,
     ):
+        """
+        Parameters
+        ----------
+        client_bootstrap : awscrt.io.ClientBootstrap
+                Event loop group and host resolver to connect with, may be shared by many clients.
+                The process-wide shared_client_bootstrap if omitted.
+        callback_workers : int
+                Threads running the callbacks of received messages, see TopicRouter.
+        """
         self.host = endpoint
         self.root_ca_path = root_ca_path
         self.certificate_path = certificate_path
@@ -57,8 +103,28 @@ class IoTClientWrapper(object):
         self.proxy_host = proxy_host
         self.proxy_port = proxy_port
         self.use_websocket = use_websocket
+        self.client_bootstrap = client_bootstrap
         self.iot_client = None
-        self.topic_callbacks = {}
+        # Callbacks of subscribed topic filters, run off the client's event loop thread
+        self.router = TopicRouter(callback_workers)
+        # Set while the client is connected, tracked from the client's lifecycle events
+        self.connected = threading.Event()
+        self.connection_error = None
+
+    def on_lifecycle_connection_success(self, lifecycle_connect_success_data):
+        logger.info("Connected to AWS IoT")
+        self.connected.set()
+
+    def on_lifecycle_connection_failure(self, lifecycle_connect_failure_data):
+        self.connection_error = lifecycle_connect_failure_data.exception
+        logger.warning(f"Connection attempt to AWS IoT failed: {self.connection_error}")
+
+    def on_lifecycle_disconnection(self, lifecycle_disconnect_data):
+        logger.warning(f"Disconnected from AWS IoT: {lifecycle_disconnect_data.exception}")
+        self.connected.clear()
+
+    def on_lifecycle_stopped(self, lifecycle_stopped_data):
+        self.connected.clear()
 
     def on_publish_received(self, publish_packet_data):
         """Handle incoming MQTT 5.0 messages"""
@@ -68,31 +134,17 @@ class IoTClientWrapper(object):
         logger.debug(f"Received message on topic: {topic}")
         logger.debug(f"Payload size: {len(payload) if payload else 0} bytes")
 
-        # Find matching callback for this topic
-        callback_found = False
-        for subscribed_topic, callback in self.topic_callbacks.items():
-            if topic == subscribed_topic:
-                logger.debug(
-                    f"Routing message to callback for topic: {subscribed_topic}"
-                )
-                try:
-                    callback(topic, payload)
-                    callback_found = True
-                except Exception as e:
-                    logger.error(f"Error in callback for topic {topic}: {e}")
-                break
-
-        if not callback_found:
+        if not self.router.dispatch(topic, payload):
             logger.warning(f"No callback found for topic: {topic}")
 
-    def publish(self, publish_to_topic, payload):
+    def publish(self, publish_to_topic, payload, qos=mqtt5.QoS.AT_MOST_ONCE):
         """Publish to MQTT 5.0"""
         logger.debug(f"Publishing to topic: {publish_to_topic}")
         logger.debug(f"Payload size: {len(payload) if payload else 0} bytes")
 
         try:
             publish_packet = mqtt5.PublishPacket(
-                topic=publish_to_topic, payload=payload, qos=mqtt5.QoS.AT_MOST_ONCE
+                topic=publish_to_topic, payload=payload, qos=qos
             )
             publish_future = self.iot_client.publish(publish_packet)
             logger.debug(f"Publish request sent for topic: {publish_to_topic}")
@@ -106,8 +158,8 @@ class IoTClientWrapper(object):
         logger.info(f"Subscribing to topic: {subscribe_to_topic}")
 
         try:
-            # Store callback for this topic
-            self.topic_callbacks[subscribe_to_topic] = callback
+            # Store callback for this topic filter
+            self.router.subscribe(subscribe_to_topic, callback)
             logger.debug(f"Callback registered for topic: {subscribe_to_topic}")
 
             subscribe_packet = mqtt5.SubscribePacket(
@@ -133,8 +185,18 @@ class IoTClientWrapper(object):
             logger.error(f"Failed to subscribe to topic {subscribe_to_topic}: {e}")
             raise
 
-    def connect(self):
-        """Connect to AWS IoT"""
+    def connect(self, timeout=30, wait=True):
+        """
+        Connect to AWS IoT
+
+        Parameters
+        ----------
+        timeout : float
+                Seconds to wait for the connection to succeed, raises TimeoutError beyond it.
+        wait : bool
+                Wait for the connection to succeed, otherwise return once the client started connecting,
+                see wait_connected.
+        """
         logger.info(f"Initiating connection to AWS IoT endpoint: {self.host}")
         logger.info(f"Client ID: {self.client_id}")
         logger.debug(f"Using websocket: {self.use_websocket}")
@@ -148,15 +210,13 @@ class IoTClientWrapper(object):
         logger.debug("Private key path: %s", self.private_key_path)
         logger.debug("Root CA path: %s", self.root_ca_path)
 
-        try:
-            # Spin up resources
-            logger.debug("Creating AWS CRT resources")
-            event_loop_group = io.EventLoopGroup(1)
-            host_resolver = io.DefaultHostResolver(event_loop_group)
-            client_bootstrap = io.ClientBootstrap(event_loop_group, host_resolver)
-        except Exception as e:
-            logger.error(f"Failed to create AWS CRT resources: {e}")
-            raise
+        client_bootstrap = self.client_bootstrap
+        if client_bootstrap is None:
+            try:
+                client_bootstrap = shared_client_bootstrap()
+            except Exception as e:
+                logger.error(f"Failed to create AWS CRT resources: {e}")
+                raise
 
         if self.use_websocket is True:
             logger.info("Using WebSocket connection with AWS Signature V4")
@@ -184,6 +244,10 @@ class IoTClientWrapper(object):
                         http_proxy_options=proxy_options,
                         ca_filepath=self.root_ca_path,
                         on_publish_received=self.on_publish_received,
+                        on_lifecycle_connection_success=self.on_lifecycle_connection_success,
+                        on_lifecycle_connection_failure=self.on_lifecycle_connection_failure,
+                        on_lifecycle_disconnection=self.on_lifecycle_disconnection,
+                        on_lifecycle_stopped=self.on_lifecycle_stopped,
                         client_id=self.client_id,
                         clean_start=False,
                         keep_alive_interval_seconds=30,
@@ -204,6 +268,10 @@ class IoTClientWrapper(object):
                     client_bootstrap=client_bootstrap,
                     ca_filepath=self.root_ca_path,
                     on_publish_received=self.on_publish_received,
+                    on_lifecycle_connection_success=self.on_lifecycle_connection_success,
+                    on_lifecycle_connection_failure=self.on_lifecycle_connection_failure,
+                    on_lifecycle_disconnection=self.on_lifecycle_disconnection,
+                    on_lifecycle_stopped=self.on_lifecycle_stopped,
                     client_id=self.client_id,
                     clean_start=False,
                     keep_alive_interval_seconds=30,
@@ -217,14 +285,122 @@ class IoTClientWrapper(object):
 
         try:
             # Start the MQTT 5.0 client
+            self.connected.clear()
+            self.connection_error = None
             self.iot_client.start()
             logger.debug("MQTT 5.0 client started successfully")
-            sleep(2)
-            logger.info("Connection established successfully")
         except Exception as e:
             logger.error(f"Failed to start MQTT client: {e}")
             raise
 
+        if wait:
+            self.wait_connected(timeout)
+
+    def wait_connected(self, timeout=30):
+        """Block until the client is connected, raises TimeoutError if it is not within timeout seconds."""
+        if not self.connected.wait(timeout):
+            logger.error(f"Not connected to AWS IoT after {timeout} seconds")
+            raise TimeoutError(
+                f"Connection to {self.host} not established within {timeout} seconds, "
+                f"last error: {self.connection_error}"
+            )
+        logger.info("Connection established successfully")
+
+    def stop(self):
+        """Disconnect from AWS IoT and stop running callbacks of received messages."""
+        if self.iot_client is not None:
+            self.iot_client.stop()
+        self.router.close()
+
+
+class ChangePublishFilter(object):
+    """
+    Decides whether a metrics report needs to be published, skipping reports whose listening ports and
+    connections are the same as in the last published one.
+
+    A report is always published once max_silence seconds have passed since the last publish, so Device Defender
+    keeps receiving regular reports. The network stats of a report to be published are counted from the last
+    report that was, so the traffic of the reports skipped in between is carried over rather than lost.
+    """
+
+    def __init__(self, max_silence, clock=monotonic):
+        """
+        Parameters
+        ----------
+        max_silence : float
+                Longest time in seconds between published reports.
+        clock : callable
+                Monotonic clock returning seconds.
+        """
+        self.max_silence = max_silence
+        self._clock = clock
+        self._last_fingerprint = None
+        self._last_publish = None
+        # Cumulative network counts of the last report handed over for publishing, and when they were read
+        self._baseline = None
+        self.skipped = 0
+
+    def should_publish(self, metric):
+        """
+        Returns True if the report differs from the last published one, or max_silence has passed.
+        The network stats deltas of a report to be published are then rebased on the last report to be published.
+        """
+        if not self._changed(metric):
+            self.skipped += 1
+            return False
+
+        if self._baseline is not None:
+            metric.rebase_network_stats(*self._baseline)
+        if metric.total_counts:
+            self._baseline = (metric.total_counts, metric.monotonic)
+        return True
+
+    def _changed(self, metric):
+        if self._last_publish is None:
+            return True
+        if metric.fingerprint() != self._last_fingerprint:
+            return True
+        return self._clock() - self._last_publish >= self.max_silence
+
+    def published(self, metric):
+        """Record that a report has been published."""
+        self._last_fingerprint = metric.fingerprint()
+        self._last_publish = self._clock()
+
+
+def pipeline_submit(pipeline, forwarder=None, timeout=10):
+    """
+    Returns a publish callable submitting reports to a PublishPipeline, waiting at most timeout seconds for
+    room in its window.
+
+    The client queues QoS 1 publishes while disconnected without failing them, so the window only makes room
+    again once the client reconnects. Waiting for it without bound would hold back collection for the whole
+    outage. With a forwarder, reports are spooled instead while the client is offline or older reports are
+    spooled, and when the window has no room in time. Without one, such reports are dropped.
+
+    Parameters
+    ----------
+    pipeline : PublishPipeline
+            Pipeline publishing reports while online.
+    forwarder : StoreAndForward
+            Forwarder spooling reports while offline, reports that cannot be submitted are dropped if omitted.
+    timeout : float
+            Seconds to wait for room in the pipeline's window.
+    """
+
+    def submit(topic, payload):
+        if forwarder is not None and forwarder.should_spool():
+            forwarder.spool_report(topic, payload)
+        elif pipeline.submit(topic, payload, timeout=timeout):
+            return
+        elif forwarder is not None:
+            logger.warning(f"Publish window still full after {timeout} seconds, spooling report")
+            forwarder.spool_report(topic, payload)
+        else:
+            logger.warning(f"Publish window still full after {timeout} seconds, dropping report")
+
+    return submit
+
 
 def parse_args():
     """Setup Commandline Argument Parsing"""
@@ -314,6 +490,71 @@ def parse_args():
         default=300,
         help="Interval in seconds between metric uploads",
     )
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        dest="use_asyncio",
+        default=False,
+        help="Run the agent on an asyncio event loop, collecting in a worker thread and publishing "
+        + "without blocking the next collection",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        action="store",
+        dest="connect_timeout",
+        type=float,
+        default=30,
+        help="Seconds to wait for the connection to AWS IoT to succeed on startup",
+    )
+    parser.add_argument(
+        "--publish-window",
+        action="store",
+        dest="publish_window",
+        type=int,
+        default=None,
+        help="Publish with QoS 1 and retries, keeping at most this many reports awaiting acknowledgement. "
+        + "Collection waits while the window is full.",
+    )
+    parser.add_argument(
+        "--publish-retries",
+        action="store",
+        dest="publish_retries",
+        type=int,
+        default=3,
+        help="With --publish-window, retries of a failed publish, with exponential backoff",
+    )
+    parser.add_argument(
+        "--spool-dir",
+        action="store",
+        dest="spool_dir",
+        default=None,
+        help="Directory to keep reports in while offline, forwarding them once reconnected",
+    )
+    parser.add_argument(
+        "--spool-max-bytes",
+        action="store",
+        dest="spool_max_bytes",
+        type=int,
+        default=16 * 1024 * 1024,
+        help="With --spool-dir, disk space for spooled reports, the oldest are dropped beyond it",
+    )
+    parser.add_argument(
+        "--spool-drain-rate",
+        action="store",
+        dest="spool_drain_rate",
+        type=float,
+        default=1.0,
+        help="With --spool-dir, spooled reports forwarded per second once reconnected",
+    )
+    parser.add_argument(
+        "--jitter",
+        action="store",
+        dest="jitter",
+        type=float,
+        default=0,
+        help="Delay each collection by a random amount up to this many seconds, to spread the load "
+        + "of many agents on the broker. Must be less than the interval.",
+    )
     parser.add_argument(
         "-s",
         "--short_tags",
@@ -366,7 +607,82 @@ def parse_args():
         default=False,
         help="Adds custom metrics to payload.",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--publish-on-change",
+        action="store_true",
+        dest="publish_on_change",
+        default=False,
+        help="Only publish reports when listening ports or connections changed since the last published "
+        + "report, or --max-silence has passed. Traffic of skipped reports is counted in the next published one.",
+    )
+    parser.add_argument(
+        "--max-silence",
+        action="store",
+        dest="max_silence",
+        type=float,
+        default=3600,
+        help="With --publish-on-change, longest time in seconds between published reports",
+    )
+    parser.add_argument(
+        "--max-payload-size",
+        action="store",
+        dest="max_payload_size",
+        type=int,
+        default=None,
+        help="Fit connection and port lists into a report of at most this many bytes, "
+        + "instead of only sampling them down to a fixed count. Ex: 131072",
+    )
+    parser.add_argument(
+        "--reservoir-size",
+        action="store",
+        dest="reservoir_size",
+        type=int,
+        default=None,
+        help="Sample connections and listening ports while collecting, keeping at most this many of each "
+        + "in memory. Reports then list at most the smaller of this and the list size limit of 50.",
+    )
+    parser.add_argument(
+        "--track-changes",
+        action="store_true",
+        dest="track_changes",
+        default=False,
+        help="Log the connections and listening ports opened and closed since the previous collection. "
+        + "Cannot be combined with --reservoir-size.",
+    )
+    parser.add_argument(
+        "--parallel-collection",
+        action="store_true",
+        dest="parallel_collection",
+        default=False,
+        help="Read network stats, sockets and cpu usage concurrently on a thread pool",
+    )
+    parser.add_argument(
+        "--source-timeout",
+        action="store",
+        dest="source_timeout",
+        type=float,
+        default=5.0,
+        help="With --parallel-collection, seconds to wait for each metric source before "
+        + "publishing the report without it",
+    )
+    parser.add_argument(
+        "--connection-source",
+        action="store",
+        dest="connection_source",
+        choices=connections.SOURCES,
+        default=connections.PSUTIL,
+        help="Where to read socket tables from. 'proc' parses /proc/net directly and 'netlink' "
+        + "queries the kernel over NETLINK_SOCK_DIAG, both are much cheaper on busy hosts "
+        + "and fall back to psutil outside Linux.",
+    )
+    args = parser.parse_args()
+    # the asyncio runtime publishes with its own tasks, without a spool or publish pipeline
+    if args.use_asyncio and (args.spool_dir or args.publish_window):
+        parser.error("--spool-dir and --publish-window are not supported with --asyncio")
+    # changes are found by comparing every record, which a reservoir does not keep
+    if args.track_changes and args.reservoir_size:
+        parser.error("--track-changes cannot be combined with --reservoir-size")
+    return args
 
 
 def custom_callback(topic, payload, **kwargs):
@@ -450,16 +766,18 @@ def main():
         )
 
         logger.info("Connecting to AWS IoT...")
-        iot_client.connect()
+        iot_client.connect(timeout=args.connect_timeout)
 
         # client_id must match a registered thing name in your account
         topic = "$aws/things/" + thing_name + "/defender/metrics/" + args.format
         logger.info(f"Device Defender topic: {topic}")
 
-        # Subscribe to the accepted/rejected topics to indicate status of published metrics reports
-        logger.info("Setting up Device Defender response subscriptions")
-        iot_client.subscribe(topic + "/accepted", custom_callback)
-        iot_client.subscribe(topic + "/rejected", custom_callback)
+        # Subscribe to the accepted/rejected topics to indicate status of published metrics reports,
+        # the asyncio runtime subscribes itself to handle them on its event loop
+        if not args.use_asyncio:
+            logger.info("Setting up Device Defender response subscriptions")
+            iot_client.subscribe(topic + "/accepted", custom_callback)
+            iot_client.subscribe(topic + "/rejected", custom_callback)
     else:
         logger.info("Running in dry-run mode - metrics will be printed to console only")
 
@@ -469,15 +787,79 @@ def main():
     logger.info(f"Custom metrics enabled: {args.custom_metrics}")
 
     #  Collector samples metrics from the system, it can track the previous metric to generate deltas
-    coll = collector.Collector(args.short_tags, args.custom_metrics)
+    coll = collector.Collector(
+        args.short_tags,
+        args.custom_metrics,
+        connection_source=args.connection_source,
+        reservoir_size=args.reservoir_size,
+        incremental=args.track_changes,
+        parallel=args.parallel_collection,
+        source_timeout=args.source_timeout,
+    )
     logger.info("Metrics collector initialized")
 
     metric = None
     first_sample = (
         True  # don't publish first sample, so we can accurately report delta metrics
     )
+    publish_filter = None
+    if args.publish_on_change:
+        publish_filter = ChangePublishFilter(args.max_silence)
+        logger.info(
+            f"Publishing on change only, at least every {args.max_silence} seconds"
+        )
     iteration = 0
 
+    if args.use_asyncio:
+        logger.info("Starting asyncio metrics collection loop")
+        runtime = async_agent.AsyncAgent(
+            coll,
+            iot_client=None if args.dry_run else iot_client,
+            topic=None if args.dry_run else topic,
+            serialization_format=args.format,
+            interval=float(sample_rate),
+            jitter=args.jitter,
+            max_payload_size=args.max_payload_size,
+            publish_filter=publish_filter,
+        )
+        try:
+            asyncio.run(async_agent.serve(runtime))
+        finally:
+            coll.close()
+        logger.info("Agent stopped")
+        return
+
+    # Reports that cannot be published are kept on disk, and forwarded once the client reconnects
+    forwarder = None
+    publish = None
+    if not args.dry_run:
+        publish = iot_client.publish
+        if args.spool_dir:
+            report_spool = spool.ReportSpool(args.spool_dir, max_bytes=args.spool_max_bytes)
+            forwarder = spool.StoreAndForward(
+                iot_client, report_spool, rate=args.spool_drain_rate
+            )
+            forwarder.start()
+            publish = forwarder.publish
+            logger.info(
+                f"Spooling reports to {args.spool_dir} while offline, {len(report_spool)} spooled"
+            )
+
+    # Publishes are acknowledged and retried, reports failing every retry are spooled if a spool is configured
+    pipeline = None
+    if not args.dry_run and args.publish_window:
+        pipeline = publisher.PublishPipeline(
+            iot_client,
+            window=args.publish_window,
+            max_retries=args.publish_retries,
+            on_failure=forwarder.spool_report if forwarder is not None else None,
+        )
+        publish = pipeline_submit(pipeline, forwarder)
+        logger.info(f"Publishing with QoS 1, window of {args.publish_window} reports")
+
+    # Collections run on fixed deadlines, so the time spent collecting and publishing does not add up
+    scheduler = Scheduler(float(sample_rate), args.jitter)
+
     logger.info("Starting metrics collection loop")
 
     try:
@@ -487,7 +869,11 @@ def main():
 
             try:
                 metric = coll.collect_metrics()
+                if args.max_payload_size:
+                    metric.set_payload_budget(args.max_payload_size, args.format)
                 logger.debug("Metrics collected successfully")
+                if metric.changes is not None:
+                    logger.info(f"Changes since the previous collection: {metrics.describe_changes(metric.changes)}")
 
                 if args.dry_run:
                     logger.info("Dry-run mode: metrics collected")
@@ -496,7 +882,7 @@ def main():
                     )
                     if args.format == "cbor":
                         with open("cbor_metrics", "w+b") as outfile:
-                            outfile.write(bytearray(metric.to_cbor()))
+                            metric.write_cbor(outfile)
                         logger.debug("CBOR metrics written to file: cbor_metrics")
                 else:
                     if first_sample:
@@ -504,31 +890,56 @@ def main():
                             "Skipping first sample to establish baseline for delta metrics"
                         )
                         first_sample = False
+                    elif publish_filter and not publish_filter.should_publish(metric):
+                        logger.info(
+                            f"Metrics unchanged, skipping publish (iteration {iteration})"
+                        )
                     else:
                         logger.info(
                             f"Publishing metrics to Device Defender (iteration {iteration})"
                         )
                         if args.format == "cbor":
-                            iot_client.publish(topic, bytearray(metric.to_cbor()))
+                            publish(topic, metric.write_cbor())
                             logger.debug("Published CBOR metrics")
                         else:
-                            iot_client.publish(topic, metric.to_json_string())
+                            publish(topic, metric.to_json_string())
                             logger.debug("Published JSON metrics")
+                        if publish_filter:
+                            publish_filter.published(metric)
 
             except Exception as e:
                 logger.error(f"Error in metrics collection iteration {iteration}: {e}")
                 # Continue the loop despite errors
 
-            logger.debug(f"Sleeping for {sample_rate} seconds")
-            sleep(float(sample_rate))
+            logger.debug(f"Waiting for the next collection in {sample_rate} second intervals")
+            missed = scheduler.wait()
+            if missed:
+                logger.warning(
+                    f"Collection overran the interval, skipped {missed} collection(s)"
+                )
 
     except KeyboardInterrupt:
         logger.info("Received interrupt signal, shutting down gracefully")
+        logger.info(
+            f"Scheduler lateness: {scheduler.lateness}, skipped collections: {scheduler.missed}"
+        )
 
     except Exception as e:
         logger.error(f"Unexpected error in main loop: {e}")
         raise
 
+    finally:
+        if pipeline is not None:
+            pipeline.flush(timeout=10)
+            logger.info(
+                f"Published {pipeline.published} report(s), {pipeline.retries} retries, "
+                f"{pipeline.failed} failed, latency: {pipeline.latency}"
+            )
+        if forwarder is not None:
+            forwarder.stop(timeout=5)
+            forwarder.spool.close()
+        coll.close()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,236 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+"""
+Asyncio runtime for the agent.
+
+Collection runs in an executor so it does not block the event loop, publishes are awaited in their own
+tasks so a slow broker does not delay the next collection, and Device Defender responses are handed from
+the MQTT client's threads to the event loop and handled there. Other coroutines can share the loop with
+the agent.
+"""
+
+import asyncio
+import logging
+import signal
+import cbor2 as cbor
+from AWSIoTDeviceDefenderAgentSDK import metrics
+from AWSIoTDeviceDefenderAgentSDK.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAgent(object):
+    """AsyncAgent
+
+    Collects metrics on a fixed schedule and publishes them to Device Defender from an asyncio event loop.
+
+    As with the blocking agent, the first collection is not published, it is only the baseline for delta metrics.
+    Without a client, every report is logged instead, and CBOR reports written to cbor_metrics, as in the
+    agent's dry-run mode.
+    """
+
+    def __init__(self, collector, iot_client=None, topic=None, serialization_format="json", interval=300,
+                 jitter=0.0, max_payload_size=None, publish_filter=None, executor=None, shutdown_timeout=10):
+        """
+        Parameters
+        ----------
+        collector : Collector
+                Collector sampling the metrics.
+        iot_client : IoTClientWrapper
+                Connected client to publish with, metrics are only logged if omitted.
+        topic : string
+                Device Defender metrics topic of the thing, responses are read from its accepted and rejected topics.
+        serialization_format : string
+                "json" or "cbor".
+        interval : float
+                Seconds between collections.
+        jitter : float
+                Upper bound of the random delay added to each collection, see Scheduler.
+        max_payload_size : int
+                Fit the report lists into this many bytes, see Metrics.set_payload_budget.
+        publish_filter : ChangePublishFilter
+                Skips publishing reports that did not change, every report is published if omitted.
+        executor : concurrent.futures.Executor
+                Executor running collection, serialization and blocking client calls, the loop's default if omitted.
+        shutdown_timeout : float
+                Seconds to wait for publishes still in flight when stopping.
+        """
+        self._collector = collector
+        self._iot_client = iot_client
+        self._topic = topic
+        self._format = serialization_format
+        self._interval = interval
+        self._jitter = jitter
+        self._max_payload_size = max_payload_size
+        self._publish_filter = publish_filter
+        self._executor = executor
+        self._shutdown_timeout = shutdown_timeout
+
+        self._loop = None
+        self._stop = None
+        self._responses = None
+        self._publishes = set()
+
+        self.scheduler = None
+        self.published = 0
+        self.publish_errors = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    def stop(self):
+        """Stop the agent after the current collection. Must be called from the event loop's thread."""
+        if self._stop is not None:
+            self._stop.set()
+
+    async def run(self):
+        """Run collections until stopped, then wait for the publishes in flight."""
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._responses = asyncio.Queue()
+
+        dispatcher = self._loop.create_task(self._dispatch_responses())
+        try:
+            if self._iot_client is not None:
+                await self._subscribe(self._topic + "/accepted")
+                await self._subscribe(self._topic + "/rejected")
+
+            self.scheduler = Scheduler(self._interval, self._jitter)
+            first_sample = self._iot_client is not None
+            while not self._stop.is_set():
+                try:
+                    metric = await self._loop.run_in_executor(self._executor, self._collect)
+                    if self._iot_client is None:
+                        logger.info(f"Metrics JSON:\n{metric.to_json_string(pretty_print=True)}")
+                        if self._format == "cbor":
+                            await self._loop.run_in_executor(self._executor, self._write_cbor, metric)
+                    elif first_sample:
+                        logger.info("Skipping first sample to establish baseline for delta metrics")
+                        first_sample = False
+                    elif self._publish_filter and not self._publish_filter.should_publish(metric):
+                        logger.info("Metrics unchanged, skipping publish")
+                    else:
+                        payload = await self._loop.run_in_executor(self._executor, self._serialize, metric)
+                        self._start_publish(payload, metric)
+                except Exception as e:
+                    logger.error(f"Error in metrics collection: {e}")
+
+                missed = await self.scheduler.wait_async(self._stop)
+                if missed:
+                    logger.warning(f"Collection overran the interval, skipped {missed} collection(s)")
+        finally:
+            if self._publishes:
+                logger.info(f"Waiting for {len(self._publishes)} publish(es) in flight")
+                await asyncio.wait(self._publishes, timeout=self._shutdown_timeout)
+            # hand over responses that arrived before stopping
+            await self._responses.join()
+            dispatcher.cancel()
+            await asyncio.gather(dispatcher, return_exceptions=True)
+            if self.scheduler is not None:
+                logger.info(f"Scheduler lateness: {self.scheduler.lateness}, "
+                            f"skipped collections: {self.scheduler.missed}")
+
+    def _collect(self):
+        metric = self._collector.collect_metrics()
+        if metric.changes is not None:
+            logger.info(f"Changes since the previous collection: {metrics.describe_changes(metric.changes)}")
+        if self._max_payload_size:
+            metric.set_payload_budget(self._max_payload_size, self._format)
+        return metric
+
+    def _serialize(self, metric):
+        if self._format == "cbor":
+            return metric.write_cbor()
+        return metric.to_json_string()
+
+    @staticmethod
+    def _write_cbor(metric):
+        with open("cbor_metrics", "w+b") as outfile:
+            metric.write_cbor(outfile)
+        logger.debug("CBOR metrics written to file: cbor_metrics")
+
+    def _start_publish(self, payload, metric):
+        task = self._loop.create_task(self._publish(payload, metric))
+        self._publishes.add(task)
+        task.add_done_callback(self._publishes.discard)
+
+    async def _publish(self, payload, metric):
+        try:
+            await asyncio.wrap_future(self._iot_client.publish(self._topic, payload))
+            self.published += 1
+            logger.debug("Published metrics")
+            # only a report the broker took counts as published, so a failed one is not skipped as unchanged
+            if self._publish_filter:
+                self._publish_filter.published(metric)
+        except Exception as e:
+            self.publish_errors += 1
+            logger.error(f"Failed to publish metrics: {e}")
+
+    async def _subscribe(self, topic):
+        # the client blocks until the broker acknowledges the subscription
+        await self._loop.run_in_executor(self._executor, self._iot_client.subscribe, topic, self._on_response)
+
+    def _on_response(self, topic, payload, **kwargs):
+        """Called on the MQTT client's thread, queues the response for the event loop."""
+        self._loop.call_soon_threadsafe(self._responses.put_nowait, (topic, payload))
+
+    async def _dispatch_responses(self):
+        while True:
+            topic, payload = await self._responses.get()
+            try:
+                await self.on_response(topic, payload)
+            except Exception as e:
+                logger.error(f"Error processing message from topic {topic}: {e}")
+            finally:
+                self._responses.task_done()
+
+    async def on_response(self, topic, payload):
+        """
+        Handle a Device Defender response on the event loop. Override to act on accepted or rejected reports.
+
+        Parameters
+        ----------
+        topic : string
+                The accepted or rejected topic the response arrived on.
+        payload : bytes
+                The response, in the format of the published report.
+        """
+        if self._format == "cbor":
+            response = cbor.loads(payload)
+        else:
+            response = payload.decode("utf-8")
+
+        if topic.endswith("/rejected"):
+            self.rejected += 1
+            logger.warning(f"Device Defender rejected report: {response}")
+        else:
+            self.accepted += 1
+            logger.info(f"Device Defender response: {response}")
+
+
+async def serve(agent):
+    """Run an AsyncAgent until it is stopped or the process receives SIGINT or SIGTERM."""
+    loop = asyncio.get_running_loop()
+    installed = []
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, agent.stop)
+            installed.append(signum)
+        except (NotImplementedError, RuntimeError):
+            # signal handlers cannot be installed on Windows event loops, or outside the main thread
+            pass
+    try:
+        await agent.run()
+    finally:
+        for signum in installed:
+            loop.remove_signal_handler(signum)
@@ -15,8 +15,128 @@
 import psutil as ps
 import socket
 from AWSIoTDeviceDefenderAgentSDK import metrics
+from AWSIoTDeviceDefenderAgentSDK import connections
+from AWSIoTDeviceDefenderAgentSDK import netdev
+from AWSIoTDeviceDefenderAgentSDK.scheduler import Scheduler
 import argparse
-from time import sleep
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from ipaddress import ip_address
+
+
+class InterfaceIndex(object):
+    """
+    Lookup table from local addresses to the name of the interface they are assigned to.
+
+    The table is built from a single ``net_if_addrs()`` call, so resolving the interface of every
+    connection in a collection pass costs one dictionary lookup each, instead of a full scan of
+    all interface addresses.
+
+    Addresses are also indexed in a normalized form, so IPv4-mapped IPv6 addresses (``::ffff:10.0.0.1``)
+    resolve to the interface owning the IPv4 address, and scoped link-local addresses
+    (``fe80::1%eth0``) resolve regardless of the scope suffix.
+    """
+
+    WILDCARD_ADDRESSES = ('0.0.0.0', '::')
+
+    def __init__(self, if_addrs=None):
+        """
+        Parameters
+        ----------
+        if_addrs : dict
+                Mapping of interface name to a list of addresses, as returned by ``psutil.net_if_addrs()``.
+                Read from the system if omitted.
+        """
+        if if_addrs is None:
+            if_addrs = ps.net_if_addrs()
+
+        self._index = {}
+        for iface, snics in if_addrs.items():
+            for snic in snics:
+                # first interface owning an address wins, as with a linear scan
+                self._index.setdefault(snic.address, iface)
+                normalized = InterfaceIndex.normalize(snic.address)
+                if normalized is not None:
+                    self._index.setdefault(normalized, iface)
+
+        # Resolution results for addresses not found verbatim, including misses.
+        self._resolved = {}
+
+    @staticmethod
+    def normalize(address):
+        """
+        Returns the canonical text form of an ip address, with any scope id removed and IPv4-mapped
+        IPv6 addresses converted to IPv4. Returns None if the address is not an ip address.
+        """
+        try:
+            ip = ip_address(address.split('%', 1)[0])
+        except (ValueError, AttributeError):
+            return None
+
+        mapped = getattr(ip, 'ipv4_mapped', None)
+        if mapped is not None:
+            ip = mapped
+        return str(ip)
+
+    def get(self, address):
+        """
+        Returns the interface name for a local address, the address itself for wildcard addresses,
+        or None if no interface owns the address.
+        """
+        if address in self.WILDCARD_ADDRESSES:
+            return address
+
+        iface = self._index.get(address)
+        if iface is not None:
+            return iface
+
+        try:
+            return self._resolved[address]
+        except KeyError:
+            normalized = InterfaceIndex.normalize(address)
+            if normalized in self.WILDCARD_ADDRESSES:
+                iface = normalized
+            elif normalized is not None:
+                iface = self._index.get(normalized)
+            self._resolved[address] = iface
+            return iface
+
+
+class ConnectionSnapshot(object):
+    """
+    Socket table and interface addresses captured once per collection cycle.
+
+    Every metric extractor in a cycle reads from the same snapshot, so the system socket tables are
+    only enumerated once, and listening ports and connections describe the same instant.
+    """
+
+    def __init__(self, connections=None, interfaces=None):
+        """
+        Parameters
+        ----------
+        connections : list
+                Inet sockets, as returned by ``psutil.net_connections(kind='inet')``.
+                Read from the system if omitted.
+        interfaces : InterfaceIndex
+                Address to interface lookup table. Read from the system if omitted.
+        """
+        if connections is None:
+            connections = ps.net_connections(kind='inet')
+        if interfaces is None:
+            interfaces = InterfaceIndex()
+
+        self.connections = connections
+        self.interfaces = interfaces
+
+
+# Metric sources read concurrently by a parallel collector, each can be given its own timeout
+NETWORK_STATS = "network_stats"
+SOCKETS = "sockets"
+INTERFACE_STATS = "interface_stats"
+CPU_USAGE = "cpu_usage"
+METRIC_SOURCES = (NETWORK_STATS, SOCKETS, INTERFACE_STATS, CPU_USAGE)
 
 
 class Collector(object):
@@ -27,7 +147,9 @@ class Collector(object):
     to make parsing metrics easier and more cross-platform.
     """
 
-    def __init__(self, short_metrics_names=False, use_custom_metrics=True):
+    def __init__(self, short_metrics_names=False, use_custom_metrics=True, connection_source=connections.PSUTIL,
+                 seed=None, reservoir_size=None, incremental=False, per_interface_stats=False, parallel=False,
+                 source_timeout=5.0, address_cache=None):
         """
         Parameters
         ----------
@@ -35,31 +157,84 @@ class Collector(object):
                 Toggle short object tags in output metrics.
         use_custom_metrics : bool
                 Toggle whether to collect custom metrics.
+        connection_source : string
+                Where to read the socket tables from, one of ``connections.SOURCES``.
+                "proc" parses /proc/net directly, skipping psutil's per-process socket mapping,
+                "netlink" queries the kernel over NETLINK_SOCK_DIAG. Both fall back to psutil
+                on systems other than Linux.
+        seed : int
+                Seed for sampling lists in reports, for reproducible reports. Random if omitted.
+        reservoir_size : int
+                Sample connections and listening ports while collecting, so each report holds at most this many
+                of each, plus their totals, no matter how many sockets the host has. See RecordReservoir.
+        incremental : bool
+                Diff connections and listening ports against the previous collection, reusing the records of
+                unchanged ones. Changes are available from the ``changes`` property of collected metrics.
+        per_interface_stats : bool
+                Also collect network stats deltas of every interface, available from the
+                ``interface_network_stats`` property of collected metrics.
+        parallel : bool
+                Read the metric sources concurrently on a thread pool, then add them to the metrics in order.
+                Most of the time collecting is spent in /proc reads and system calls that release the GIL.
+        source_timeout : float or dict
+                With parallel collection, seconds to wait for each source before leaving it out of the report,
+                either for every source, or as a dictionary keyed by METRIC_SOURCES, others waiting 5 seconds.
+        address_cache : metrics.AddressCache
+                Cache of parsed remote addresses, may be shared between collectors. A new one if omitted.
         """
+        if reservoir_size and incremental:
+            raise ValueError("Incremental collection cannot be combined with reservoir sampling")
+
         # Keep a copy of the last metric, if there is one, so we can calculate change in some metrics.
         self._last_metric = None
         self._short_names = short_metrics_names
         self._use_custom_metrics = use_custom_metrics
+        self._read_connections = connections.get_source(connection_source)
+        # Remote peers mostly repeat between collections, so parsed addresses are kept across them.
+        self.address_cache = address_cache if address_cache is not None else metrics.AddressCache()
+        # One generator for every report, rather than reseeding the global one for each sample
+        self._rng = random.Random(seed)
+        self._reservoir_size = reservoir_size
+        self._incremental = incremental
+        # Per interface counters of the previous collection, kept in preallocated arrays between collections
+        self._interface_counters = netdev.InterfaceCounters() if per_interface_stats else None
 
-    @staticmethod
-    def __get_interface_name(address):
+        self._executor = None
+        if parallel:
+            self._executor = ThreadPoolExecutor(max_workers=len(METRIC_SOURCES), thread_name_prefix="collector")
+        if isinstance(source_timeout, dict):
+            self._source_timeouts = dict((source, source_timeout.get(source, 5.0)) for source in METRIC_SOURCES)
+        else:
+            self._source_timeouts = dict.fromkeys(METRIC_SOURCES, source_timeout)
+        # Reads of sources that timed out, a source is not read again until its last read finished
+        self._pending_reads = {}
+        # Sources left out of the last report, because their read timed out, or their previous one still runs
+        self.timed_out_sources = []
+        self.skipped_sources = []
 
-        if address == '0.0.0.0' or address == '::':
-            return address
+    def take_snapshot(self):
+        """Capture the socket table and interface addresses from the configured connection source."""
+        return ConnectionSnapshot(self._read_connections())
 
-        for iface in ps.net_if_addrs():
-            for snic in ps.net_if_addrs()[iface]:
-                if snic.address == address:
-                    return iface
-
-    def listening_ports(self, metrics):
+    def listening_ports(self, metrics, snapshot=None):
         """
         Iterate over all inet connections in the LISTEN state and extract port and interface.
+
+        Parameters
+        ----------
+        metrics : Metrics
+                Metrics object to populate.
+        snapshot : ConnectionSnapshot
+                Socket table to read from, a new one is taken if omitted.
         """
+        if snapshot is None:
+            snapshot = self.take_snapshot()
+        interfaces = snapshot.interfaces
+
         udp_ports = []
         tcp_ports = []
-        for conn in ps.net_connections(kind='inet'):
-            iface = Collector.__get_interface_name(conn.laddr.ip)
+        for conn in snapshot.connections:
+            iface = interfaces.get(conn.laddr.ip)
             if conn.status == "LISTEN" and conn.type == socket.SOCK_STREAM:
                 if iface:
                     tcp_ports.append({'port': conn.laddr.port, 'interface': iface})
@@ -76,26 +251,57 @@ class Collector(object):
 
     @staticmethod
     def network_stats(metrics):
-        net_counters = ps.net_io_counters(pernic=False)
+        Collector._add_network_stats(metrics, ps.net_io_counters(pernic=False))
+
+    @staticmethod
+    def _add_network_stats(metrics, net_counters):
         metrics.add_network_stats(
             net_counters.bytes_recv,
             net_counters.packets_recv,
             net_counters.bytes_sent,
             net_counters.packets_sent)
 
+    def interface_network_stats(self, metrics):
+        """
+        Read the counters of every interface and add their deltas since the previous collection.
+
+        Parameters
+        ----------
+        metrics : Metrics
+                Metrics object to populate.
+        """
+        self._add_interface_network_stats(metrics, self._interface_counters.update())
+
     @staticmethod
-    def network_connections(metrics):
-        protocols = ['tcp']
-        for protocol in protocols:
-            for c in ps.net_connections(kind=protocol):
-                try:
-                    if c.status == "ESTABLISHED" or c.status == "BOUND":
-                        metrics.add_network_connection(c.raddr.ip, c.raddr.port,
-                                                       Collector.__get_interface_name(c.laddr.ip),
-                                                       c.laddr.port)
-                except Exception as ex:
-                    print('Failed to parse network info for protocol: ' + protocol)
-                    print(ex)
+    def _add_interface_network_stats(metrics, interface_deltas):
+        for interface, deltas in interface_deltas.items():
+            metrics.add_interface_network_stats(interface, *deltas)
+
+    def network_connections(self, metrics, snapshot=None):
+        """
+        Iterate over all established tcp connections and extract remote peer, local port and interface.
+
+        Parameters
+        ----------
+        metrics : Metrics
+                Metrics object to populate.
+        snapshot : ConnectionSnapshot
+                Socket table to read from, a new one is taken if omitted.
+        """
+        if snapshot is None:
+            snapshot = self.take_snapshot()
+        interfaces = snapshot.interfaces
+
+        # udp sockets never report a connection status, so only tcp connections match below
+        for c in snapshot.connections:
+            try:
+                if c.status == "ESTABLISHED" or c.status == "BOUND":
+                    metrics.add_network_connection(c.raddr.ip, c.raddr.port,
+                                                   interfaces.get(c.laddr.ip),
+                                                   c.laddr.port)
+            except Exception as ex:
+                print('Failed to parse network info for connection: ' + str(c))
+                print(ex)
 
     @staticmethod
     def cpu_usage(metrics):
@@ -105,18 +311,77 @@ class Collector(object):
     def collect_metrics(self):
         """Sample system metrics and populate a metrics object suitable for publishing to Device Defender."""
         metrics_current = metrics.Metrics(
-            short_names=self._short_names, last_metric=self._last_metric)
+            short_names=self._short_names, last_metric=self._last_metric, address_cache=self.address_cache,
+            rng=self._rng, reservoir_size=self._reservoir_size, track_changes=self._incremental)
 
-        self.network_stats(metrics_current)
-        self.listening_ports(metrics_current)
-        self.network_connections(metrics_current)
+        if self._executor is not None:
+            self._collect_parallel(metrics_current)
+        else:
+            # Sockets and interfaces are read once per collection and shared by all extractors.
+            snapshot = self.take_snapshot()
 
-        if self._use_custom_metrics:
-            self.cpu_usage(metrics_current)
+            self.network_stats(metrics_current)
+            if self._interface_counters is not None:
+                self.interface_network_stats(metrics_current)
+            self.listening_ports(metrics_current, snapshot)
+            self.network_connections(metrics_current, snapshot)
+
+            if self._use_custom_metrics:
+                self.cpu_usage(metrics_current)
 
         self._last_metric = metrics_current
         return metrics_current
 
+    def _add_snapshot(self, metrics, snapshot):
+        self.listening_ports(metrics, snapshot)
+        self.network_connections(metrics, snapshot)
+
+    def _collect_parallel(self, metrics):
+        """
+        Read every metric source on the thread pool, and add those read within their timeout to metrics.
+        Metrics objects are not thread safe, so they are only populated from the calling thread.
+        """
+        sources = [(NETWORK_STATS, lambda: ps.net_io_counters(pernic=False), self._add_network_stats),
+                   (SOCKETS, self.take_snapshot, self._add_snapshot)]
+        if self._interface_counters is not None:
+            sources.append((INTERFACE_STATS, self._interface_counters.update, self._add_interface_network_stats))
+        if self._use_custom_metrics:
+            sources.append((CPU_USAGE, lambda: ps.cpu_percent(interval=None), lambda m, cpu: m.add_cpu_usage(cpu)))
+
+        started = time.monotonic()
+        reads = []
+        self.skipped_sources = []
+        for source, read, add in sources:
+            pending = self._pending_reads.get(source)
+            if pending is not None:
+                if not pending.done():
+                    print('Skipping metric source still busy with a timed out read: ' + source)
+                    self.skipped_sources.append(source)
+                    continue
+                del self._pending_reads[source]
+            reads.append((source, self._executor.submit(read), add))
+
+        self.timed_out_sources = []
+        for source, future, add in reads:
+            remaining = started + self._source_timeouts[source] - time.monotonic()
+            try:
+                value = future.result(timeout=max(0.0, remaining))
+            except TimeoutError:
+                print('Metric source timed out, leaving it out of the report: ' + source)
+                self._pending_reads[source] = future
+                self.timed_out_sources.append(source)
+                continue
+            except Exception as ex:
+                print('Failed to read metric source: ' + source)
+                print(ex)
+                continue
+            add(metrics, value)
+
+    def close(self):
+        """Shut down the thread pool of a parallel collector, without waiting for reads still running."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
 def main():
     """Use this method to run the collector in stand-alone mode to tests metric collection."""
 
@@ -131,22 +396,33 @@ def main():
     parser.add_argument("--short-names", action="store_true", dest="short_names", default=False, required=False,
                         help="Produce metric report with short names")
     parser.add_argument('-cm','--custom-metrics', action="store_true", dest="custom_metrics", default=False, help="Adds custom metrics to payload.")
+    parser.add_argument("--connection-source", action="store", dest="connection_source", default=connections.PSUTIL,
+                        choices=connections.SOURCES, help="Where to read socket tables from")
+    parser.add_argument("--parallel", action="store_true", dest="parallel", default=False,
+                        help="Read metric sources concurrently on a thread pool")
+    parser.add_argument("--per-interface-stats", action="store_true", dest="per_interface_stats", default=False,
+                        help="Also print network stats of every interface, after the first sample")
 
     args = parser.parse_args()
-    collector = Collector(short_metrics_names=args.short_names,use_custom_metrics=args.custom_metrics)
+    collector = Collector(short_metrics_names=args.short_names, use_custom_metrics=args.custom_metrics,
+                          connection_source=args.connection_source, per_interface_stats=args.per_interface_stats,
+                          parallel=args.parallel)
 
     if args.sample_rate:
         count = int(args.number_samples)
+        scheduler = Scheduler(float(args.sample_rate))
         while True:
             count -= 1
             # setup a loop to collect
             metric = collector.collect_metrics()
             print(metric.to_json_string(pretty_print=True))
+            if metric.interface_network_stats:
+                print(json.dumps(metric.interface_network_stats, indent=4))
 
             if count == 0:
                 break
 
-            sleep(float(args.sample_rate))
+            scheduler.wait()
 
     else:
         metric = collector.collect_metrics()
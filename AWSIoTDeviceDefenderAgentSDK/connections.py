@@ -0,0 +1,362 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+"""
+Sources of inet socket tables for the collector.
+
+Every source returns a list of records exposing the same ``family``, ``type``, ``laddr``, ``raddr``
+and ``status`` fields as the records returned by ``psutil.net_connections()``, so the collector can
+use them interchangeably.
+"""
+
+import psutil as ps
+import socket
+import struct
+import errno
+import sys
+import os
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+PSUTIL = "psutil"
+PROC = "proc"
+NETLINK = "netlink"
+SOURCES = (PSUTIL, PROC, NETLINK)
+
+Address = namedtuple("Address", "ip port")
+Connection = namedtuple("Connection", "family type laddr raddr status")
+
+# Socket tables under <procfs>/net, with the family and type of the sockets they list
+PROC_NET_TABLES = (
+    ("tcp", socket.AF_INET, socket.SOCK_STREAM),
+    ("tcp6", socket.AF_INET6, socket.SOCK_STREAM),
+    ("udp", socket.AF_INET, socket.SOCK_DGRAM),
+    ("udp6", socket.AF_INET6, socket.SOCK_DGRAM),
+)
+
+# Kernel tcp states (include/net/tcp_states.h), as printed in the "st" column of /proc/net/tcp
+TCP_STATUSES = {
+    "01": ps.CONN_ESTABLISHED,
+    "02": ps.CONN_SYN_SENT,
+    "03": ps.CONN_SYN_RECV,
+    "04": ps.CONN_FIN_WAIT1,
+    "05": ps.CONN_FIN_WAIT2,
+    "06": ps.CONN_TIME_WAIT,
+    "07": ps.CONN_CLOSE,
+    "08": ps.CONN_CLOSE_WAIT,
+    "09": ps.CONN_LAST_ACK,
+    "0A": ps.CONN_LISTEN,
+    "0B": ps.CONN_CLOSING,
+    "0C": ps.CONN_SYN_RECV,
+}
+
+# Numeric tcp states, as reported in inet_diag_msg.idiag_state
+TCP_STATUSES_BY_STATE = {int(state, 16): status for state, status in TCP_STATUSES.items()}
+
+# Netlink constants (include/uapi/linux/netlink.h, include/uapi/linux/sock_diag.h)
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+# struct nlmsghdr
+_NLMSGHDR = struct.Struct("=IHHII")
+# struct inet_diag_req_v2, with a zeroed inet_diag_sockid so every socket matches
+_INET_DIAG_REQ_V2 = struct.Struct("=BBBBI48x")
+# Leading fields of struct inet_diag_msg: family, state, then the ports and addresses of
+# inet_diag_sockid, which are in network byte order
+_INET_DIAG_MSG = struct.Struct("!BB2xHH16s16s")
+
+TCP_LISTEN_ESTABLISHED_STATES = (1 << 1) | (1 << 10)
+ALL_STATES = 0xFFFFFFFF
+
+# Dumps requested from the kernel: tcp sockets are filtered down to LISTEN and ESTABLISHED
+# kernel-side, udp sockets are all needed to report listening ports.
+SOCK_DIAG_REQUESTS = (
+    (socket.AF_INET, socket.IPPROTO_TCP, socket.SOCK_STREAM, TCP_LISTEN_ESTABLISHED_STATES, "tcp"),
+    (socket.AF_INET6, socket.IPPROTO_TCP, socket.SOCK_STREAM, TCP_LISTEN_ESTABLISHED_STATES, "tcp6"),
+    (socket.AF_INET, socket.IPPROTO_UDP, socket.SOCK_DGRAM, ALL_STATES, "udp"),
+    (socket.AF_INET6, socket.IPPROTO_UDP, socket.SOCK_DGRAM, ALL_STATES, "udp6"),
+)
+
+SOCK_DIAG_BUFFER_SIZE = 65536
+
+
+def psutil_connections():
+    """Read inet sockets through psutil, which also maps every socket to its owning process."""
+    return ps.net_connections(kind="inet")
+
+
+def _decode_ipv4(hex_ip):
+    # The kernel prints the address as a native-endian 32 bit integer
+    return socket.inet_ntop(socket.AF_INET, struct.pack("=I", int(hex_ip, 16)))
+
+
+def _decode_ipv6(hex_ip):
+    # The kernel prints the address as four native-endian 32 bit integers
+    words = (int(hex_ip[i:i + 8], 16) for i in range(0, 32, 8))
+    return socket.inet_ntop(socket.AF_INET6, struct.pack("=4I", *words))
+
+
+def _parse_proc_net_table(lines, family, sock_type, decoded):
+    """
+    Parse the lines of a /proc/net/{tcp,tcp6,udp,udp6} table into connection records.
+
+    Parameters
+    ----------
+    lines: iterable
+        Lines of the table, including the header line
+    family: int
+        Address family of the sockets in the table
+    sock_type: int
+        Socket type of the sockets in the table
+    decoded: dict
+        Cache of already decoded hex addresses, shared between tables
+    """
+    decode_ip = _decode_ipv4 if family == socket.AF_INET else _decode_ipv6
+    is_tcp = sock_type == socket.SOCK_STREAM
+    connections = []
+
+    lines = iter(lines)
+    next(lines, None)  # header
+    for line in lines:
+        fields = line.split(None, 4)
+        if len(fields) < 4:
+            continue
+
+        local, remote, state = fields[1], fields[2], fields[3]
+
+        local_ip, local_port = local.split(":")
+        remote_ip, remote_port = remote.split(":")
+
+        ip = decoded.get(local_ip)
+        if ip is None:
+            ip = decoded[local_ip] = decode_ip(local_ip)
+        laddr = Address(ip, int(local_port, 16))
+
+        remote_port = int(remote_port, 16)
+        if remote_port:
+            ip = decoded.get(remote_ip)
+            if ip is None:
+                ip = decoded[remote_ip] = decode_ip(remote_ip)
+            raddr = Address(ip, remote_port)
+        else:
+            # unconnected socket, psutil reports these with an empty remote address
+            raddr = ()
+
+        if is_tcp:
+            status = TCP_STATUSES.get(state, ps.CONN_NONE)
+        else:
+            status = ps.CONN_NONE  # as with psutil, udp sockets carry no status
+
+        connections.append(Connection(family, sock_type, laddr, raddr, status))
+
+    return connections
+
+
+def proc_connections(procfs_path=None):
+    """
+    Read inet sockets straight from the /proc/net socket tables.
+
+    Unlike ``psutil.net_connections()``, this does not walk every ``/proc/<pid>/fd`` directory to
+    find the process owning each socket, which is the bulk of the cost on hosts with many processes
+    and sockets. Tables that do not exist, such as tcp6 with IPv6 disabled, are skipped.
+
+    Parameters
+    ----------
+    procfs_path: string
+        Mount point of procfs, defaults to ``psutil.PROCFS_PATH``
+    """
+    if procfs_path is None:
+        procfs_path = ps.PROCFS_PATH
+
+    decoded = {}
+    connections = []
+    for table, family, sock_type in PROC_NET_TABLES:
+        try:
+            with open(os.path.join(procfs_path, "net", table)) as table_file:
+                connections.extend(_parse_proc_net_table(table_file, family, sock_type, decoded))
+        except FileNotFoundError:
+            continue
+
+    return connections
+
+
+def _parse_inet_diag_messages(view, seq, records):
+    """
+    Decode the inet_diag_msg records in a buffer of netlink messages received from a sock_diag dump.
+
+    Parameters
+    ----------
+    view: memoryview
+        Received bytes
+    seq: int
+        Sequence number of the dump request, messages for other requests are ignored
+    records: list
+        Decoded (family, state, sport, dport, src, dst) tuples are appended to this list
+
+    Returns
+    -------
+        True once the end of the dump has been reached
+    """
+    offset = 0
+    end = len(view)
+    header_size = _NLMSGHDR.size
+    while offset + header_size <= end:
+        msg_len, msg_type, _, msg_seq, _ = _NLMSGHDR.unpack_from(view, offset)
+        if msg_len < header_size:
+            raise OSError(errno.EBADMSG, "Truncated netlink message")
+
+        if msg_seq == seq:
+            if msg_type == NLMSG_DONE:
+                return True
+            if msg_type == NLMSG_ERROR:
+                error = -struct.unpack_from("=i", view, offset + header_size)[0]
+                raise OSError(error, os.strerror(error))
+            if msg_type == SOCK_DIAG_BY_FAMILY:
+                records.append(_INET_DIAG_MSG.unpack_from(view, offset + header_size))
+
+        # messages are aligned to 4 bytes
+        offset += (msg_len + 3) & ~3
+
+    return False
+
+
+def _sock_diag_dump(sock, seq, family, protocol, states, buffer):
+    """Request a socket dump for a family and protocol and collect the raw records of the reply."""
+    sock.send(_NLMSGHDR.pack(_NLMSGHDR.size + _INET_DIAG_REQ_V2.size, SOCK_DIAG_BY_FAMILY,
+                             NLM_F_REQUEST | NLM_F_DUMP, seq, 0) +
+              _INET_DIAG_REQ_V2.pack(family, protocol, 0, 0, states))
+
+    records = []
+    view = memoryview(buffer)
+    done = False
+    while not done:
+        received = sock.recv_into(buffer)
+        if not received:
+            break
+        done = _parse_inet_diag_messages(view[:received], seq, records)
+    return records
+
+
+def sock_diag_connections(procfs_path=None):
+    """
+    Read inet sockets from the kernel over a NETLINK_SOCK_DIAG socket.
+
+    The kernel hands over fixed layout binary records, skipping both the text formatting of the
+    /proc/net tables and the parsing in Python, and only sends tcp sockets in the LISTEN and
+    ESTABLISHED states. If the kernel cannot dump a protocol, for example because the udp_diag
+    module is not loaded, that table is read from procfs instead.
+
+    Parameters
+    ----------
+    procfs_path: string
+        Mount point of procfs for the fallback, defaults to ``psutil.PROCFS_PATH``
+    """
+    if procfs_path is None:
+        procfs_path = ps.PROCFS_PATH
+
+    decoded = {}
+    connections = []
+    buffer = bytearray(SOCK_DIAG_BUFFER_SIZE)
+
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_SOCK_DIAG) as sock:
+        for seq, (family, protocol, sock_type, states, table) in enumerate(SOCK_DIAG_REQUESTS, 1):
+            try:
+                records = _sock_diag_dump(sock, seq, family, protocol, states, buffer)
+            except OSError as ex:
+                logger.debug("sock_diag dump of %s failed, reading procfs instead: %s", table, ex)
+                try:
+                    with open(os.path.join(procfs_path, "net", table)) as table_file:
+                        connections.extend(_parse_proc_net_table(table_file, family, sock_type, decoded))
+                except FileNotFoundError:
+                    pass
+                continue
+
+            # raw addresses are only unambiguous within a family
+            addresses = {}
+            address_size = 4 if family == socket.AF_INET else 16
+            is_tcp = sock_type == socket.SOCK_STREAM
+            for _, state, sport, dport, src, dst in records:
+                ip = addresses.get(src)
+                if ip is None:
+                    ip = addresses[src] = socket.inet_ntop(family, src[:address_size])
+                laddr = Address(ip, sport)
+
+                if dport:
+                    ip = addresses.get(dst)
+                    if ip is None:
+                        ip = addresses[dst] = socket.inet_ntop(family, dst[:address_size])
+                    raddr = Address(ip, dport)
+                else:
+                    raddr = ()
+
+                if is_tcp:
+                    status = TCP_STATUSES_BY_STATE.get(state, ps.CONN_NONE)
+                else:
+                    status = ps.CONN_NONE
+
+                connections.append(Connection(family, sock_type, laddr, raddr, status))
+
+    return connections
+
+
+def sock_diag_available():
+    """Returns True if the kernel accepts NETLINK_SOCK_DIAG sockets."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_SOCK_DIAG).close()
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def proc_connections_available(procfs_path=None):
+    """Returns True if socket tables can be read from procfs on this system."""
+    if procfs_path is None:
+        procfs_path = ps.PROCFS_PATH
+    return sys.platform.startswith("linux") and os.path.exists(os.path.join(procfs_path, "net", "tcp"))
+
+
+def get_source(name):
+    """
+    Returns a callable reading the inet socket table from the named source.
+
+    Sources other than psutil are only available on Linux, on other systems psutil is used instead.
+    Where netlink sockets are not permitted, the netlink source falls back to procfs.
+
+    Parameters
+    ----------
+    name: string
+        One of SOURCES
+    """
+    if name not in SOURCES:
+        raise ValueError("Invalid connection source: " + str(name))
+
+    if name == NETLINK:
+        if sock_diag_available():
+            return sock_diag_connections
+        logger.warning("NETLINK_SOCK_DIAG is not available, falling back to procfs")
+        name = PROC
+
+    if name == PROC:
+        if proc_connections_available():
+            return proc_connections
+        logger.warning("Socket tables are not readable from procfs, falling back to psutil")
+
+    return psutil_connections
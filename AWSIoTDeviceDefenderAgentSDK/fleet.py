@@ -0,0 +1,302 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+"""
+Fleet agent, publishing Device Defender metrics for many things from one process.
+
+Every thing connects with its own identity, but all their clients share one CRT event loop group and host
+resolver, and a single thread schedules collections for all of them, spread evenly over the interval so the
+things do not collect and publish all at once.
+
+The metrics of each thing come from its own source. Only the thing naming this host as its source reports the
+host's sockets and network stats, which are collected once per interval however many things the fleet has.
+Other things get their metrics from a factory, e.g. one querying the device behind the gateway.
+"""
+
+from awscrt import io
+from AWSIoTDeviceDefenderAgentSDK import collector
+from AWSIoTDeviceDefenderAgentSDK import connections
+from AWSIoTDeviceDefenderAgentSDK.agent import IoTClientWrapper, shared_client_bootstrap
+from collections import namedtuple
+import argparse
+import heapq
+import importlib
+import json
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Metrics source of the thing reporting the metrics of this host
+HOST = "host"
+
+# Identity of a thing in the fleet, and where its metrics come from
+Thing = namedtuple("Thing", "thing_name client_id certificate_path private_key_path metrics_source")
+
+
+def load_things(path):
+    """
+    Read the things of a fleet from a JSON file, holding a list of objects with "thing_name", "cert", "key"
+    and "metrics" members, and optionally "client_id", which defaults to the thing name.
+
+    "metrics" is either "host", for the single thing reporting the metrics of this host, or the
+    "module:attribute" path of a factory, see metrics_source.
+
+    Parameters
+    ----------
+    path : string
+            Path of the JSON file.
+    """
+    with open(path) as things_file:
+        entries = json.load(things_file)
+
+    things = []
+    for entry in entries:
+        try:
+            things.append(Thing(entry["thing_name"], entry.get("client_id") or entry["thing_name"],
+                                entry["cert"], entry["key"], entry["metrics"]))
+        except (KeyError, TypeError):
+            raise ValueError("Fleet entries need thing_name, cert, key and metrics: " + str(entry))
+    if len(set(thing.client_id for thing in things)) != len(things):
+        raise ValueError("Client ids of a fleet must be unique")
+    if sum(thing.metrics_source == HOST for thing in things) > 1:
+        raise ValueError("Only one thing of a fleet can report the metrics of this host")
+    return things
+
+
+def metrics_source(thing, host_collector):
+    """
+    Returns the object collecting the metrics of a thing, with a collect_metrics method like Collector.
+
+    Parameters
+    ----------
+    thing : Thing
+            Thing to collect metrics for.
+    host_collector : Collector
+            Collector of this host's metrics, for the thing whose source is "host".
+            For other things, the "module:attribute" source is imported and called with the thing name.
+    """
+    if thing.metrics_source == HOST:
+        return host_collector
+    module_name, _, attribute = thing.metrics_source.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Metrics source of {thing.thing_name} must be 'host' or 'module:attribute'")
+    factory = getattr(importlib.import_module(module_name), attribute)
+    return factory(thing.thing_name)
+
+
+class StaggeredSchedule(object):
+    """StaggeredSchedule
+
+    Deadlines one interval apart for each of count members, with members offset by interval / count from
+    each other, kept in a heap so finding the next member due costs O(log count).
+
+    As with Scheduler, deadlines are absolute on the monotonic clock, and a member whose collection overran
+    its next deadline skips to the first deadline still ahead.
+    """
+
+    def __init__(self, count, interval, clock=time.monotonic):
+        """
+        Parameters
+        ----------
+        count : int
+                Number of members.
+        interval : float
+                Seconds between deadlines of a member.
+        clock : callable
+                Monotonic clock returning seconds.
+        """
+        if count < 1 or interval <= 0:
+            raise ValueError("A schedule needs at least one member and a positive interval")
+        self.interval = interval
+        self._clock = clock
+        start = clock()
+        self._deadlines = [(start + member * interval / count, member) for member in range(count)]
+        heapq.heapify(self._deadlines)
+        self.missed = 0
+
+    def next_due(self):
+        """Returns (deadline, member) of the next member due, without removing it."""
+        return self._deadlines[0]
+
+    def advance(self):
+        """Move the member due next to its following deadline, returns the member."""
+        deadline, member = self._deadlines[0]
+        following = deadline + self.interval
+        now = self._clock()
+        if now > following:
+            skipped = int((now - following) // self.interval) + 1
+            self.missed += skipped
+            following += skipped * self.interval
+        heapq.heapreplace(self._deadlines, (following, member))
+        return member
+
+
+class FleetMember(object):
+    """A thing of the fleet, with its client and the source of its metrics, keeping its previous metrics for deltas."""
+
+    def __init__(self, thing_name, iot_client, source, serialization_format):
+        self.thing_name = thing_name
+        self.iot_client = iot_client
+        self.source = source
+        self.topic = "$aws/things/" + thing_name + "/defender/metrics/" + serialization_format
+        self._format = serialization_format
+        # don't publish the first sample, so we can accurately report delta metrics
+        self.first_sample = True
+        self.published = 0
+
+    def collect_and_publish(self):
+        metric = self.source.collect_metrics()
+        if self.first_sample:
+            logger.info(f"Skipping first sample of {self.thing_name} to establish baseline for delta metrics")
+            self.first_sample = False
+            return
+        if self._format == "cbor":
+            self.iot_client.publish(self.topic, metric.write_cbor())
+        else:
+            self.iot_client.publish(self.topic, metric.to_json_string())
+        self.published += 1
+
+
+class FleetAgent(object):
+    """FleetAgent
+
+    Collects and publishes metrics for every member of a fleet on staggered deadlines, from a single thread.
+    """
+
+    def __init__(self, members, interval, clock=time.monotonic):
+        """
+        Parameters
+        ----------
+        members : list
+                FleetMember of every thing.
+        interval : float
+                Seconds between collections of each thing.
+        clock : callable
+                Monotonic clock returning seconds.
+        """
+        self.members = members
+        self._clock = clock
+        self.schedule = StaggeredSchedule(len(members), interval, clock)
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Run collections until stopped."""
+        while not self._stop.is_set():
+            deadline, _ = self.schedule.next_due()
+            remaining = deadline - self._clock()
+            if remaining > 0 and self._stop.wait(remaining):
+                break
+            member = self.members[self.schedule.advance()]
+            try:
+                member.collect_and_publish()
+            except Exception as e:
+                logger.error(f"Error collecting metrics for {member.thing_name}: {e}")
+
+
+def wait_connected(members, timeout, clock=time.monotonic):
+    """
+    Wait for the clients of all members to connect, within timeout seconds for all of them.
+    Returns the members not connected by then, which stay scheduled as their clients keep reconnecting.
+    """
+    deadline = clock() + timeout
+    unconnected = []
+    for member in members:
+        try:
+            member.iot_client.wait_connected(max(0.0, deadline - clock()))
+        except TimeoutError as e:
+            logger.warning(f"{member.thing_name} is not connected, its reports are lost until it connects: {e}")
+            unconnected.append(member)
+    if unconnected:
+        logger.warning(f"{len(unconnected)} of {len(members)} things not connected after {timeout} seconds")
+    return unconnected
+
+
+def parse_args():
+    """Setup Commandline Argument Parsing"""
+    parser = argparse.ArgumentParser(fromfile_prefix_chars="@")
+    parser.add_argument("-e", "--endpoint", action="store", required=True, dest="endpoint",
+                        help="Your AWS IoT custom endpoint, not including a port.")
+    parser.add_argument("-r", "--rootCA", action="store", dest="root_ca_path", required=True,
+                        help="File path to root certificate authority, in PEM format.")
+    parser.add_argument("--things", action="store", dest="things_path", required=True,
+                        help='JSON file listing the things, as '
+                        + '[{"thing_name": ..., "cert": ..., "key": ..., "metrics": "host" or "module:attribute"}, ...]')
+    parser.add_argument("-i", "--interval", action="store", dest="upload_interval", type=float, default=300,
+                        help="Interval in seconds between metric uploads of each thing")
+    parser.add_argument("-f", "--format", action="store", dest="format", choices=["cbor", "json"], default="json",
+                        help="Choose serialization format for metrics report")
+    parser.add_argument("-s", "--short_tags", action="store_true", dest="short_tags", default=False,
+                        help="Use short-format field names in metrics report")
+    parser.add_argument("-cm", "--custom-metrics", action="store_true", dest="custom_metrics", default=False,
+                        help="Adds custom metrics to payload.")
+    parser.add_argument("--connection-source", action="store", dest="connection_source",
+                        choices=connections.SOURCES, default=connections.PSUTIL,
+                        help="Where to read socket tables from")
+    parser.add_argument("--connect-timeout", action="store", dest="connect_timeout", type=float, default=30,
+                        help="Seconds to wait for the connections of all things to succeed on startup")
+    parser.add_argument("--event-loop-threads", action="store", dest="event_loop_threads", type=int, default=1,
+                        help="Threads of the CRT event loop group shared by every thing's connection")
+    parser.add_argument("--verbosity", action="store", dest="verbosity", choices=[x.name for x in io.LogLevel],
+                        default=io.LogLevel.NoLogs.name, help="Logging level")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                        handlers=[logging.StreamHandler(sys.stderr)])
+    io.init_logging(getattr(io.LogLevel, args.verbosity), "stderr")
+
+    things = load_things(args.things_path)
+    logger.info(f"Starting fleet agent for {len(things)} things")
+
+    # One event loop group and host resolver serve the connections of every thing
+    client_bootstrap = shared_client_bootstrap(args.event_loop_threads)
+    # The host's metrics are collected for a single thing, the others are read from their own sources
+    host_collector = None
+    if any(thing.metrics_source == HOST for thing in things):
+        host_collector = collector.Collector(args.short_tags, args.custom_metrics,
+                                             connection_source=args.connection_source)
+
+    members = []
+    for thing in things:
+        iot_client = IoTClientWrapper(args.endpoint, args.root_ca_path, thing.certificate_path,
+                                      thing.private_key_path, thing.client_id, None, None, None, False,
+                                      client_bootstrap=client_bootstrap)
+        # connections are established concurrently, and waited for below
+        iot_client.connect(wait=False)
+        members.append(FleetMember(thing.thing_name, iot_client, metrics_source(thing, host_collector),
+                                   args.format))
+
+    fleet = FleetAgent(members, args.upload_interval)
+    try:
+        wait_connected(members, args.connect_timeout)
+        fleet.run()
+    except KeyboardInterrupt:
+        logger.info("Received interrupt signal, shutting down gracefully")
+    finally:
+        for member in members:
+            member.iot_client.stop()
+        if host_collector is not None:
+            host_collector.close()
+    logger.info(f"Skipped collections: {fleet.schedule.missed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,9 +15,325 @@ import time
 import json
 import cbor2 as cbor
 import random
-import os
+import struct
+from itertools import islice
 from AWSIoTDeviceDefenderAgentSDK import tags
-from ipaddress import ip_address, IPv4Address
+from ipaddress import ip_address
+from collections import namedtuple, OrderedDict
+
+# Compact records for the metrics held by a Metrics object. Tag names and output formatting are only
+# applied when a report is serialized.
+NetworkConnection = namedtuple("NetworkConnection", "remote_addr remote_port interface local_port")
+ListeningPort = namedtuple("ListeningPort", "port interface")
+
+# Records added and removed since the previous collection, for one list, and for all lists of a Metrics object
+ChangeSet = namedtuple("ChangeSet", "added removed")
+MetricsChanges = namedtuple("MetricsChanges", "connections tcp_ports udp_ports")
+
+# Network stats counters, by long tag name, in report order
+NETWORK_STATS_COUNTERS = ("bytes_in", "bytes_out", "packets_in", "packets_out")
+# Interface counters on many embedded NICs and 32 bit kernels are 32 bits wide and wrap around
+COUNTER_WRAP = 2 ** 32
+# A counter going backwards is only taken to have wrapped when it was within this much of COUNTER_WRAP,
+# and is below it again, otherwise it was reset
+COUNTER_WRAP_MARGIN = 2 ** 28
+
+
+def describe_changes(changes):
+    """
+    Summarize the changes of a Metrics object, e.g. "connections +2 -1, tcp ports +0 -0, udp ports +1 -0".
+
+    Parameters
+    ----------
+    changes: MetricsChanges
+        Changes to summarize, as returned by Metrics.changes
+    """
+    return ", ".join("{} +{} -{}".format(name.replace("_", " "), len(change.added), len(change.removed))
+                     for name, change in zip(changes._fields, changes))
+
+
+def counter_delta(current, previous):
+    """
+    Difference between two readings of a cumulative counter, allowing for wraparound and resets.
+
+    A counter that went backwards from within COUNTER_WRAP_MARGIN of the 32 bit limit, to a value below the
+    margin, wrapped around and the delta is counted across the wrap. Any other decrease means the counter was
+    reset, by a reboot, a module reload or the interface being recreated, and everything counted since the reset
+    is the delta. A reset is only mistaken for a wrap when the counter was just below the limit, which bounds the
+    error to the margin, where taking every decrease from the upper half of the range as a wrap could report
+    bogus deltas of up to 2 GiB for 64 bit counters. Aggregate counters read through psutil are already
+    corrected for wraps.
+
+    Parameters
+    ----------
+    current: int
+        Latest reading of the counter
+    previous: int
+        Reading of the counter at the previous collection
+    """
+    if current >= previous:
+        return current - previous
+    if COUNTER_WRAP - COUNTER_WRAP_MARGIN <= previous < COUNTER_WRAP and current < COUNTER_WRAP_MARGIN:
+        return current + COUNTER_WRAP - previous
+    return current
+
+
+class AddressCache(object):
+    """AddressCache
+
+    Bounded LRU cache of parsed remote addresses and formatted ``addr:port`` strings.
+
+    Parsing an address with ``ipaddress.ip_address`` is expensive compared to the rest of adding a connection,
+    and most peers stay the same from one collection to the next, so a cache shared by all the metrics
+    objects of a collector saves re-parsing them every cycle.
+    """
+
+    def __init__(self, maxsize=4096):
+        """
+        Parameters
+        ----------
+        maxsize : int
+                Maximum number of addresses, and separately of formatted strings, kept in the cache.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._versions = OrderedDict()
+        self._formatted = OrderedDict()
+
+    def _lookup(self, cache, key):
+        value = cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            cache.move_to_end(key)
+        return value
+
+    def _store(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    def version(self, address):
+        """
+        Returns the ip version, 4 or 6, of an address. Raises ValueError if it is not a valid ip address.
+        """
+        version = self._lookup(self._versions, address)
+        if version is None:
+            version = ip_address(address).version
+            self._store(self._versions, address, version)
+        return version
+
+    def format(self, address, port):
+        """Returns "address:port", with IPv6 addresses enclosed in brackets."""
+        key = (address, port)
+        formatted = self._lookup(self._formatted, key)
+        if formatted is None:
+            if self.version(address) == 6:
+                formatted = "[" + address + "]:" + str(port)
+            else:
+                formatted = address + ":" + str(port)
+            self._store(self._formatted, key, formatted)
+        return formatted
+
+    def clear(self):
+        """Empty the cache and reset its counters."""
+        self._versions.clear()
+        self._formatted.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def sample(records, count, rng):
+    """
+    Randomly choose count items from a sized iterable, such as a list or a dict's keys.
+
+    Only count indices are drawn, and the input is never copied. Sequences are indexed directly, in O(count),
+    so record stores are sampled through their records list. Other iterables are advanced once, up to the last
+    chosen item, in O(len(records)). Items are returned in their input order.
+
+    Parameters
+    ----------
+    records: sized iterable
+        Items to sample from
+    count: int
+        Number of items to choose, at most len(records)
+    rng: random.Random
+        Random number generator to draw indices from
+    """
+    size = len(records)
+    # random.sample draws from a range without materializing it
+    indices = sorted(rng.sample(range(size), count))
+    if isinstance(records, (list, tuple)):
+        return [records[i] for i in indices]
+
+    # skip ahead between chosen indices
+    items = iter(records)
+    position = 0
+    selected = []
+    for i in indices:
+        selected.append(next(islice(items, i - position, None)))
+        position = i + 1
+    return selected
+
+
+class RecordSet(dict):
+    """
+    Insertion-ordered set of records, kept as dictionary keys, so duplicates are dropped in constant time.
+    The records are also listed in insertion order in ``records``, so they can be sampled by index.
+    """
+    __slots__ = ('records',)
+
+    def __init__(self):
+        super(RecordSet, self).__init__()
+        self.records = []
+
+    def add(self, record):
+        # re-adding an existing record keeps its original position
+        if record not in self:
+            self[record] = record
+            self.records.append(record)
+
+
+class ChangeTrackingRecordSet(RecordSet):
+    """
+    RecordSet that tracks which records were added or removed compared to the set of a previous collection.
+
+    Besides the set, records are linked in a list, through a node held as the value of each record. A record
+    found in the previous set as it is added has its node moved from the previous set's list to this one, and
+    keeps the previous instance and node, so long-lived records are held once across collections. Records not
+    found are listed as added. Once all records are added, the nodes left in the previous set's list are the
+    removed records, so the changes are found in O(changes), without copying or scanning the previous set.
+    The previous set is released, with its removed records kept, once a set of the next collection succeeds it.
+    """
+    __slots__ = ('added', '_root', '_previous', '_removed')
+
+    def __init__(self, previous=None):
+        """
+        Parameters
+        ----------
+        previous : ChangeTrackingRecordSet
+                Records of the previous collection, empty if omitted.
+        """
+        super(ChangeTrackingRecordSet, self).__init__()
+        if previous is not None:
+            # this set succeeds it, so collections do not keep each other alive in a chain
+            previous._release_previous()
+        self.added = []
+        # nodes are [previous node, next node, record] lists, linked in a circle through the root
+        self._root = []
+        self._root[:] = [self._root, self._root, None]
+        self._previous = previous
+        self._removed = None
+
+    def add(self, record):
+        if record in self:
+            return
+
+        node = None
+        if self._previous is not None:
+            node = dict.get(self._previous, record)
+        if node is None:
+            node = [None, None, record]
+            self.added.append(record)
+        else:
+            # unlink from the previous set's list, what is left there once all records are added was removed
+            node[0][1] = node[1]
+            node[1][0] = node[0]
+        last = self._root[0]
+        node[0] = last
+        node[1] = self._root
+        last[1] = node
+        self._root[0] = node
+        self[node[2]] = node
+        self.records.append(node[2])
+        self._removed = None
+
+    def _release_previous(self):
+        self._find_removed()
+        if self._previous is not None:
+            # break the reference cycles of the removed records' nodes
+            root = self._previous._root
+            node = root[1]
+            while node is not root:
+                node[0], node = None, node[1]
+            root[:] = [root, root, None]
+        self._previous = None
+
+    def _find_removed(self):
+        if self._removed is None:
+            removed = []
+            if self._previous is not None:
+                root = self._previous._root
+                node = root[1]
+                while node is not root:
+                    removed.append(node[2])
+                    node = node[1]
+            self._removed = tuple(removed)
+        return self._removed
+
+    def changes(self):
+        return ChangeSet(tuple(self.added), self._find_removed())
+
+
+class RecordReservoir(object):
+    """
+    Fixed-size uniform random sample of the records added to it, with a running count of all records added.
+
+    Memory stays bounded by the reservoir size however many records are added (reservoir sampling,
+    Algorithm R). By default duplicates are only recognized while they are held in the reservoir, so the count
+    is exact only when each record is added once. Listening ports are not: sockets sharing a port with
+    SO_REUSEPORT, or listening on it for both IPv4 and IPv6, give the same record. With exact, every distinct
+    record added is remembered, so duplicates are never counted twice, at the cost of memory growing with the
+    number of distinct records, which stays small for ports.
+    """
+    __slots__ = ('size', 'total', 'records', '_members', '_seen', '_rng')
+
+    def __init__(self, size, rng, exact=False):
+        """
+        Parameters
+        ----------
+        size : int
+                Maximum number of records held.
+        rng : random.Random
+                Random number generator choosing which records are kept.
+        exact : bool
+                Remember every distinct record added, so the count is exact even when records are added again.
+        """
+        self.size = size
+        self.total = 0
+        self.records = []
+        self._members = set()
+        self._seen = set() if exact else None
+        self._rng = rng
+
+    def add(self, record):
+        if self._seen is not None:
+            if record in self._seen:
+                return
+            self._seen.add(record)
+        elif record in self._members:
+            return
+
+        self.total += 1
+        if len(self.records) < self.size:
+            self.records.append(record)
+            self._members.add(record)
+        else:
+            # keep the new record with probability size / total, in place of a random held one
+            i = self._rng.randrange(self.total)
+            if i < self.size:
+                self._members.discard(self.records[i])
+                self.records[i] = record
+                self._members.add(record)
+
+    def __len__(self):
+        """Number of records added, not only those held."""
+        return self.total
+
+    def __iter__(self):
+        return iter(self.records)
 
 
 class Metrics(object):
@@ -36,7 +352,8 @@ class Metrics(object):
 
     """
 
-    def __init__(self, short_names=False, last_metric=None):
+    def __init__(self, short_names=False, last_metric=None, address_cache=None, rng=None, reservoir_size=None,
+                 track_changes=False):
         """Initialize a new metrics object.
 
         Parameters
@@ -45,19 +362,57 @@ class Metrics(object):
                 Toggle short object tags in output metrics.
         last_metric : Metrics object
                 Metric object used for delta metric calculation.
+        address_cache : AddressCache
+                Cache of parsed and formatted remote addresses, may be shared between metrics objects.
+        rng : random.Random
+                Random number generator used to sample lists, may be shared between metrics objects.
+                Pass a seeded generator for reproducible samples.
+        reservoir_size : int
+                Sample connections and listening ports as they are added, keeping at most this many of each
+                along with an exact count, instead of holding every record until the report is serialized.
+        track_changes : bool
+                Track connections and listening ports added and removed since last_metric, see ``changes``.
+                Cannot be combined with reservoir_size.
         """
-        self.t = tags.Tags(short_names)
-        # Header Information
+        if reservoir_size and track_changes:
+            raise ValueError("Change tracking needs every record, it cannot be combined with a reservoir")
+
+        self.t = tags.get_tags(short_names)
+        if address_cache is None:
+            address_cache = AddressCache()
+        self._address_cache = address_cache
+        if rng is None:
+            rng = random.Random()
+        self._rng = rng
+        # Header Information, the wall clock timestamp identifies the report, while the interval is measured on
+        # the monotonic clock so that clock adjustments do not skew it
         self._timestamp = int(time.time())
+        self._monotonic = time.monotonic()
         if last_metric is None:
             self.interval = 0
         else:
-            self.interval = self._timestamp - last_metric._timestamp
-
-        # Network Metrics
-        self._net_connections = []
-        self.listening_tcp_ports = []
-        self.listening_udp_ports = []
+            self.interval = self._monotonic - last_metric._monotonic
+
+        # Network Metrics, either every record in insertion order, or a fixed-size sample of them
+        if reservoir_size:
+            self._net_connections = RecordReservoir(reservoir_size, rng)
+            # several sockets can listen on the same port, and there are few distinct ports to remember
+            self._listening_tcp_ports = RecordReservoir(reservoir_size, rng, exact=True)
+            self._listening_udp_ports = RecordReservoir(reservoir_size, rng, exact=True)
+        elif track_changes:
+            previous = (None, None, None)
+            if last_metric is not None:
+                previous = tuple(store if isinstance(store, ChangeTrackingRecordSet) else None
+                                 for store in (last_metric._net_connections,
+                                               last_metric._listening_tcp_ports,
+                                               last_metric._listening_udp_ports))
+            self._net_connections = ChangeTrackingRecordSet(previous[0])
+            self._listening_tcp_ports = ChangeTrackingRecordSet(previous[1])
+            self._listening_udp_ports = ChangeTrackingRecordSet(previous[2])
+        else:
+            self._net_connections = RecordSet()
+            self._listening_tcp_ports = RecordSet()
+            self._listening_udp_ports = RecordSet()
 
         # Custom Metrics
         self.cpu_metrics = []
@@ -65,18 +420,82 @@ class Metrics(object):
         # Network Stats By Interface
         self.total_counts = {}  # The raw values from the system
         self._interface_stats = {}  # The diff values, if delta metrics are used
+        self._per_interface_stats = {}  # Diff values of every interface, if collected per interface
         if last_metric is None:
             self._old_interface_stats = {}
         else:
             self._old_interface_stats = last_metric.total_counts
 
-        self.max_list_size = 50
+        self._max_list_size = 50
+        # (max bytes, serialization format) when lists are packed into a payload size budget
+        self._payload_budget = None
+
+        # Sampled records and the report built from them, shared by every serialization until the metrics change
+        self._selection = None
+        self._report = None
+
+    @property
+    def max_list_size(self):
+        """Lists larger than this size are randomly sampled down to it in reports."""
+        return self._max_list_size
+
+    @max_list_size.setter
+    def max_list_size(self, max_list_size):
+        self._max_list_size = max_list_size
+        self._invalidate()
+
+    def set_payload_budget(self, max_bytes, serialization_format="json"):
+        """
+        Size sampled lists so the serialized report fits in a payload size, such as the MQTT message size limit.
+
+        Connections and listening ports are added to the report, in random order and taking turns between
+        lists, for as long as their encoded size still fits in the budget. Each item is only encoded once to
+        measure it. max_list_size still caps the length of each list, set it to None to only limit by size.
+        The budget applies to the compact json output, and to cbor output.
+
+        Parameters
+        ----------
+        max_bytes: int
+            Maximum size of the serialized report in bytes, None to disable packing
+        serialization_format: string
+            "json" or "cbor", the format the report will be serialized in
+        """
+        if serialization_format not in ("json", "cbor"):
+            raise ValueError("Invalid serialization format: " + str(serialization_format))
+        if max_bytes:
+            self._payload_budget = (max_bytes, serialization_format)
+        else:
+            self._payload_budget = None
+        self._invalidate()
+
+    def _invalidate(self):
+        """Drop the cached sample and report, after the metrics changed."""
+        self._selection = None
+        self._report = None
 
     @property
     def network_stats(self):
         """Retrieve network TCP and UDP stats aggregated across all interfaces."""
         return self._interface_stats
 
+    @property
+    def interface_network_stats(self):
+        """Retrieve network stats deltas of every interface, keyed by interface name, if collected per interface."""
+        return self._per_interface_stats
+
+    @property
+    def monotonic(self):
+        """Monotonic time the metrics were collected at."""
+        return self._monotonic
+
+    @property
+    def listening_tcp_ports(self):
+        return [self._format_port(p) for p in self._listening_tcp_ports]
+
+    @property
+    def listening_udp_ports(self):
+        return [self._format_port(p) for p in self._listening_udp_ports]
+
     def listening_ports(self, protocol):
         if protocol.upper() == "UDP":
             return self.listening_udp_ports
@@ -100,21 +519,23 @@ class Metrics(object):
 
         """
         if protocol.upper() == "UDP":
-            for p in ports:
-                if p not in self.listening_udp_ports:
-                    self.listening_udp_ports += ports
+            listening_ports = self._listening_udp_ports
         elif protocol.upper() == "TCP":
-            for p in ports:
-                if p not in self.listening_tcp_ports:
-                    self.listening_tcp_ports += ports
+            listening_ports = self._listening_tcp_ports
         else:
             print(("Invalid Protocol: " + protocol))
+            return
+
+        self._invalidate()
+        for p in ports:
+            listening_ports.add(ListeningPort(p['port'], p.get('interface')))
 
     def add_network_stats(self, bytes_in, packets_in, bytes_out, packets_out):
         """
         Add cumulative network stats across all network interfaces.
         If a previous metrics object was supplied,attempts to calculate and store delta metric.
         If a previous metrics object is not present, we do not send any metrics.
+        Counters that wrapped around or were reset since the previous metrics are handled by counter_delta.
 
         Parameters
         ----------
@@ -127,6 +548,7 @@ class Metrics(object):
         packets_out: int
            Number of packets sent from this interface
         """
+        self._invalidate()
         self.total_counts = {
             'bytes_in': bytes_in,
             'bytes_out': bytes_out,
@@ -134,20 +556,55 @@ class Metrics(object):
             'packets_out': packets_out
         }
 
+        # Raw counts are kept under long names whatever the tag mode, only the deltas are reported under self.t
         if self._old_interface_stats:
-            bytes_in_diff = bytes_in - self._old_interface_stats[self.t.bytes_in]
-            bytes_out_diff = bytes_out - self._old_interface_stats[self.t.bytes_out]
-            packets_in_diff = packets_in - self._old_interface_stats[self.t.packets_in]
-            packets_out_diff = packets_out - self._old_interface_stats[self.t.packets_out]
-
-            self._interface_stats = {self.t.bytes_in: bytes_in_diff,
-                                     self.t.bytes_out: bytes_out_diff,
-                                     self.t.packets_in: packets_in_diff,
-                                     self.t.packets_out: packets_out_diff}
-
+            self._interface_stats = {
+                getattr(self.t, name): counter_delta(self.total_counts[name], self._old_interface_stats[name])
+                for name in NETWORK_STATS_COUNTERS
+            }
         else:
             self._interface_stats = {}
 
+    def rebase_network_stats(self, total_counts, since):
+        """
+        Compute the network stats deltas from other cumulative counts than those of the previous metrics,
+        e.g. those of the last published report, so the traffic of reports skipped since is not lost.
+
+        Parameters
+        ----------
+        total_counts: dict
+           Cumulative counts to compute the deltas from, as in total_counts
+        since: float
+           Monotonic time these counts were read at, as in monotonic
+        """
+        self._old_interface_stats = total_counts
+        self.interval = self._monotonic - since
+        if self.total_counts:
+            self.add_network_stats(**self.total_counts)
+
+    def add_interface_network_stats(self, interface, bytes_in, packets_in, bytes_out, packets_out):
+        """
+        Add network stats deltas of a single interface since the previous collection.
+        These are kept for local inspection, the version 1 report only carries the aggregate network stats.
+
+        Parameters
+        ----------
+        interface: string
+           Name of the interface
+        bytes_in: int
+           Number of bytes received on this interface
+        bytes_out: int
+           Number of bytes sent from this interface
+        packets_in: int
+           Number of packets received on this interface
+        packets_out: int
+           Number of packets sent from this interface
+        """
+        self._per_interface_stats[interface] = {self.t.bytes_in: bytes_in,
+                                                self.t.bytes_out: bytes_out,
+                                                self.t.packets_in: packets_in,
+                                                self.t.packets_out: packets_out}
+
     def add_network_connection(self, remote_addr, remote_port, interface, local_port):
         """
         Add network connection details.
@@ -163,15 +620,10 @@ class Metrics(object):
         local_port: int
             Local port of the connection
         """
-        ipAddress = remote_addr
-        if type(ip_address(remote_addr)) is not IPv4Address:
-            ipAddress = "[" + remote_addr + "]"
-        new_conn = {self.t.remote_addr: ipAddress + ":" + str(remote_port),
-                    self.t.local_interface: interface,
-                    self.t.local_port: local_port}
+        self._address_cache.version(remote_addr)  # raises ValueError for invalid addresses
 
-        if new_conn not in self._net_connections:
-            self._net_connections.append(new_conn)
+        self._invalidate()
+        self._net_connections.add(NetworkConnection(remote_addr, remote_port, interface, local_port))
 
     def add_cpu_usage(self, cpu_usage):
         """
@@ -182,12 +634,51 @@ class Metrics(object):
         cpu_uage: float
              representing the current system-wide CPU utilization as a percentage
         """
+        self._invalidate()
         self.cpu_metrics = {"number": cpu_usage}
 
 
+    @property
+    def changes(self):
+        """
+        Connections and listening ports added and removed since the previous metrics, as a MetricsChanges
+        of ChangeSet tuples of records. None unless the metrics were created with track_changes.
+        """
+        stores = (self._net_connections, self._listening_tcp_ports, self._listening_udp_ports)
+        if not all(isinstance(store, ChangeTrackingRecordSet) for store in stores):
+            return None
+        return MetricsChanges(*(store.changes() for store in stores))
+
+    def fingerprint(self):
+        """
+        Returns a hash of the listening ports and connections, which only changes when they change.
+
+        Network stats and custom metrics change every collection, so they are left out. The hash does not
+        depend on the order records were added in, and is only comparable within one process. With reservoir
+        sampling only the totals are covered, as the sample itself changes every collection.
+        """
+        sections = []
+        for store in (self._net_connections, self._listening_tcp_ports, self._listening_udp_ports):
+            if isinstance(store, RecordReservoir):
+                sections.append((len(store), 0))
+            else:
+                sections.append((len(store), sum(map(hash, store)) & 0xFFFFFFFFFFFFFFFF))
+        return hash(tuple(sections))
+
     @property
     def network_connections(self):
-        return self._net_connections
+        return [self._format_connection(c) for c in self._net_connections]
+
+    @staticmethod
+    def _format_port(port):
+        if port.interface is None:
+            return {'port': port.port}
+        return {'port': port.port, 'interface': port.interface}
+
+    def _format_connection(self, conn):
+        return {self.t.remote_addr: self._address_cache.format(conn.remote_addr, conn.remote_port),
+                self.t.local_interface: conn.interface,
+                self.t.local_port: conn.local_port}
 
     def _sample_list(self, input_list):
         """
@@ -196,7 +687,7 @@ class Metrics(object):
         Parameters
         ----------
         input_list: list
-           List of arbitrary size
+           List, or other sized iterable, of arbitrary size, or a RecordSet or RecordReservoir
 
         Returns
         -------
@@ -204,10 +695,10 @@ class Metrics(object):
            with items randomly selected from input list
 
         """
+        if isinstance(input_list, (RecordReservoir, RecordSet)):
+            input_list = input_list.records
         if self.max_list_size and len(input_list) > self.max_list_size:
-            random.seed(os.urandom(50))
-            output_list = random.sample(input_list, self.max_list_size)
-            return output_list
+            return sample(input_list, self.max_list_size, self._rng)
         else:
             return input_list
 
@@ -221,7 +712,7 @@ class Metrics(object):
             Set to true if you would like json to be formatted in a more human-friendly format.
 
         """
-        metrics = self._v1_metrics()
+        metrics = self._cached_report()
         if pretty_print:
             return json.dumps(metrics, indent=4, sort_keys=True)
         else:
@@ -229,10 +720,144 @@ class Metrics(object):
 
     def to_cbor(self):
         """Returns a cbor serialized metrics object."""
-        return cbor.dumps(self._v1_metrics())
+        return cbor.dumps(self._cached_report())
+
+    def write_json(self, sink=None):
+        """
+        Write the metrics as compact json, producing the same bytes as ``to_json_string()`` encoded as utf-8.
 
-    def _v1_metrics(self):
-        """Format metrics in Device Defender version 1 format."""
+        The report is written section by section and list item by list item, without building the full
+        report or output string first, so memory use is bounded by the output itself.
+
+        Parameters
+        ----------
+        sink: bytearray or file-like object
+            Output is appended to a bytearray, or written to an object with a ``write`` method accepting bytes.
+            A new bytearray is used if omitted.
+
+        Returns
+        -------
+            The sink
+        """
+        if sink is None:
+            sink = bytearray()
+        write = sink.extend if isinstance(sink, bytearray) else sink.write
+        _write_json(self._v1_metrics(lazy=True), write)
+        return sink
+
+    def write_cbor(self, sink=None):
+        """
+        Write the metrics as cbor, producing the same bytes as ``to_cbor()``.
+
+        The report is written section by section and list item by list item, without building the full
+        report or output bytes first, so memory use is bounded by the output itself.
+
+        Parameters
+        ----------
+        sink: bytearray or file-like object
+            Output is appended to a bytearray, or written to an object with a ``write`` method accepting bytes.
+            A new bytearray is used if omitted.
+
+        Returns
+        -------
+            The sink
+        """
+        if sink is None:
+            sink = bytearray()
+        write = sink.extend if isinstance(sink, bytearray) else sink.write
+        _write_cbor(self._v1_metrics(lazy=True), write)
+        return sink
+
+    def _sampled_records(self):
+        """
+        Returns the records of each list included in reports, sampled down to max_list_size.
+
+        The sample is kept until the metrics change, so every serialization carries the same one.
+        """
+        if self._selection is None:
+            if self._payload_budget is not None:
+                self._selection = self._pack_to_budget(*self._payload_budget)
+            else:
+                self._selection = (self._sample_list(self._net_connections),
+                                   self._sample_list(self._listening_tcp_ports),
+                                   self._sample_list(self._listening_udp_ports))
+        return self._selection
+
+    def _pack_to_budget(self, max_bytes, serialization_format):
+        """
+        Select records of each list, in random order, while the encoded report still fits in max_bytes.
+
+        The size of the report without any list items is measured once, then every candidate item is encoded
+        on its own and added to the running size, along with its separator or the growth of its list's
+        cbor length prefix.
+        """
+        empty = ((), (), ())
+        if serialization_format == "cbor":
+            size = len(_encode(self._v1_metrics(lazy=True, selection=empty), _write_cbor))
+
+            def item_size(item, count):
+                return len(cbor.dumps(item)) + len(_cbor_head(CBOR_ARRAY, count + 1)) - len(_cbor_head(CBOR_ARRAY, count))
+        else:
+            size = len(_encode(self._v1_metrics(lazy=True, selection=empty), _write_json))
+
+            def item_size(item, count):
+                separator = 1 if count else 0
+                return len(json.dumps(item, separators=(',', ':'))) + separator
+
+        lists = [(self._random_order(self._net_connections), self._format_connection, []),
+                 (self._random_order(self._listening_tcp_ports), self._format_port, []),
+                 (self._random_order(self._listening_udp_ports), self._format_port, [])]
+
+        # Take turns between lists, so one large list cannot use up the whole budget
+        open_lists = [entry for entry in lists if entry[0]]
+        while open_lists:
+            still_open = []
+            for candidates, format, selected in open_lists:
+                record = candidates[len(selected)]
+                cost = item_size(format(record), len(selected))
+                if size + cost > max_bytes:
+                    continue  # the list is full
+
+                size += cost
+                selected.append(record)
+                if len(selected) < len(candidates):
+                    still_open.append((candidates, format, selected))
+            open_lists = still_open
+
+        return tuple(selected for _, _, selected in lists)
+
+    def _random_order(self, records):
+        """Returns up to max_list_size records, in random order."""
+        if isinstance(records, (RecordReservoir, RecordSet)):
+            records = records.records
+        count = len(records)
+        if self.max_list_size:
+            count = min(count, self.max_list_size)
+        selected = sample(records, count, self._rng)
+        self._rng.shuffle(selected)
+        return selected
+
+    def _cached_report(self):
+        """
+        Returns the report for the current metrics, building it only if the metrics changed since the last call.
+
+        Every serialization of the same metrics therefore carries the same sample of each list.
+        """
+        if self._report is None:
+            self._report = self._v1_metrics()
+        return self._report
+
+    def _v1_metrics(self, lazy=False, selection=None):
+        """Format metrics in Device Defender version 1 format.
+
+        Parameters
+        ----------
+        lazy: bool
+            Leave the sampled lists as _RecordList objects, which format their records as they are iterated,
+            for writing the report out piece by piece.
+        selection: tuple
+            Records of the connections, tcp ports and udp ports lists to include, the cached sample if omitted.
+        """
 
         t = self.t
         header = {t.report_id: self._timestamp,
@@ -242,17 +867,23 @@ class Metrics(object):
         if self.network_stats:
             metrics[t.interface_stats] = self.network_stats
 
+        # Only the sampled records are formatted
+        if selection is None:
+            selection = self._sampled_records()
+        connections, tcp_ports, udp_ports = selection
+
         if self._net_connections:
-            metrics[t.tcp_conn] = {t.established_connections: {t.connections: self._sample_list(self._net_connections),
+            connections = _format_records(connections, self._format_connection, lazy)
+            metrics[t.tcp_conn] = {t.established_connections: {t.connections: connections,
                                                                t.total: len(self._net_connections)}}
 
-        if self.listening_tcp_ports:
-            metrics[t.listening_tcp_ports] = {t.ports: self._sample_list(self.listening_tcp_ports),
-                                              t.total: len(self.listening_tcp_ports)}
+        if self._listening_tcp_ports:
+            metrics[t.listening_tcp_ports] = {t.ports: _format_records(tcp_ports, self._format_port, lazy),
+                                              t.total: len(self._listening_tcp_ports)}
 
-        if self.listening_udp_ports:
-            metrics[t.listening_udp_ports] = {t.ports: self._sample_list(self.listening_udp_ports),
-                                              t.total: len(self.listening_udp_ports)}
+        if self._listening_udp_ports:
+            metrics[t.listening_udp_ports] = {t.ports: _format_records(udp_ports, self._format_port, lazy),
+                                              t.total: len(self._listening_udp_ports)}
 
         report = {t.header: header,
                   t.metrics: metrics}
@@ -261,3 +892,92 @@ class Metrics(object):
             report[t.custom_metrics] = {t.cpu_usage: [self.cpu_metrics]}
 
         return report
+
+
+class _RecordList(object):
+    """Records of a report list, formatted one at a time as they are iterated."""
+    __slots__ = ('records', 'format')
+
+    def __init__(self, records, format):
+        self.records = records
+        self.format = format
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return map(self.format, self.records)
+
+
+def _format_records(records, format, lazy):
+    """Returns the formatted records of a report list, as a _RecordList if lazy, otherwise as a list."""
+    if lazy:
+        return _RecordList(records, format)
+    return [format(r) for r in records]
+
+
+def _write_json(node, write):
+    """Write a report as compact json, with the same output as ``json.dumps(node, separators=(',', ':'))``."""
+    if isinstance(node, dict):
+        write(b'{')
+        first = True
+        for key, value in node.items():
+            if not first:
+                write(b',')
+            first = False
+            write(json.dumps(key).encode())
+            write(b':')
+            _write_json(value, write)
+        write(b'}')
+    elif isinstance(node, _RecordList):
+        write(b'[')
+        first = True
+        for item in node:
+            if not first:
+                write(b',')
+            first = False
+            write(json.dumps(item, separators=(',', ':')).encode())
+        write(b']')
+    else:
+        write(json.dumps(node, separators=(',', ':')).encode())
+
+
+def _encode(node, writer):
+    """Encode a report into a new bytearray with _write_json or _write_cbor."""
+    output = bytearray()
+    writer(node, output.extend)
+    return output
+
+
+def _cbor_head(major_type, length):
+    """Encode the initial bytes of a cbor data item with a major type and length (RFC 8949 section 3)."""
+    major_type <<= 5
+    if length < 24:
+        return struct.pack('>B', major_type | length)
+    elif length < 0x100:
+        return struct.pack('>BB', major_type | 24, length)
+    elif length < 0x10000:
+        return struct.pack('>BH', major_type | 25, length)
+    elif length < 0x100000000:
+        return struct.pack('>BI', major_type | 26, length)
+    else:
+        return struct.pack('>BQ', major_type | 27, length)
+
+
+CBOR_ARRAY = 4
+CBOR_MAP = 5
+
+
+def _write_cbor(node, write):
+    """Write a report as cbor, with the same output as ``cbor.dumps(node)``."""
+    if isinstance(node, dict):
+        write(_cbor_head(CBOR_MAP, len(node)))
+        for key, value in node.items():
+            write(cbor.dumps(key))
+            _write_cbor(value, write)
+    elif isinstance(node, _RecordList):
+        write(_cbor_head(CBOR_ARRAY, len(node)))
+        for item in node:
+            write(cbor.dumps(item))
+    else:
+        write(cbor.dumps(node))
@@ -0,0 +1,193 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+"""
+Per interface network counters for the collector.
+
+Counters are read from /proc/net/dev once per collection, into counter arrays allocated up front with one row
+per interface, so a collection cycle does not allocate a record per interface and counter.
+"""
+
+import psutil as ps
+import os
+import sys
+from array import array
+from AWSIoTDeviceDefenderAgentSDK.metrics import counter_delta
+
+# Counters kept for every interface, in row order, matching the arguments of Metrics.add_network_stats
+FIELDS = ("bytes_in", "packets_in", "bytes_out", "packets_out")
+WIDTH = len(FIELDS)
+
+# Columns of the FIELDS counters in a /proc/net/dev line, after the interface name
+PROC_NET_DEV_COLUMNS = (0, 1, 8, 9)
+
+
+def _parse_proc_net_dev(lines):
+    """
+    Parse the lines of /proc/net/dev into (interface, bytes_in, packets_in, bytes_out, packets_out) tuples.
+
+    Parameters
+    ----------
+    lines: iterable
+        Lines of the table, including the two header lines
+    """
+    readings = []
+    for line in lines:
+        name, sep, counters = line.partition(":")
+        if not sep:
+            continue  # header
+        counters = counters.split()
+        if len(counters) <= PROC_NET_DEV_COLUMNS[-1]:
+            continue
+        readings.append((name.strip(),) + tuple(int(counters[column]) for column in PROC_NET_DEV_COLUMNS))
+    return readings
+
+
+def proc_net_dev(procfs_path=None):
+    """
+    Read the counters of every interface from /proc/net/dev.
+
+    Parameters
+    ----------
+    procfs_path: string
+        Mount point of procfs, defaults to ``psutil.PROCFS_PATH``
+    """
+    if procfs_path is None:
+        procfs_path = ps.PROCFS_PATH
+    with open(os.path.join(procfs_path, "net", "dev")) as dev_file:
+        return _parse_proc_net_dev(dev_file)
+
+
+def psutil_net_dev():
+    """Read the counters of every interface through psutil, on systems without /proc/net/dev."""
+    return [(name, c.bytes_recv, c.packets_recv, c.bytes_sent, c.packets_sent)
+            for name, c in ps.net_io_counters(pernic=True).items()]
+
+
+def proc_net_dev_available(procfs_path=None):
+    """Returns True if interface counters can be read from procfs on this system."""
+    if procfs_path is None:
+        procfs_path = ps.PROCFS_PATH
+    return sys.platform.startswith("linux") and os.path.exists(os.path.join(procfs_path, "net", "dev"))
+
+
+class InterfaceCounters(object):
+    """InterfaceCounters
+
+    Counters of every interface at the current and previous collection, and the deltas between them.
+
+    Every interface is assigned a row of WIDTH counters in flat arrays, which are swapped between collections
+    rather than reallocated, and grow only when more interfaces exist than rows. Readings are written in place
+    into the rows, and deltas computed row by row into a third array, which update hands out through a view
+    of each row, in a dictionary reused across updates. Rows of interfaces that went away are reused by
+    interfaces that appear later.
+    An interface only gets deltas once it was present at two consecutive collections, and counters of
+    a recreated interface going backwards are handled as a reset by ``counter_delta``.
+    """
+
+    def __init__(self, capacity=8, read=None):
+        """
+        Parameters
+        ----------
+        capacity : int
+                Number of interface rows allocated up front.
+        read : callable
+                Returns a list of (interface, bytes_in, packets_in, bytes_out, packets_out) tuples.
+                Reads /proc/net/dev if omitted, or psutil where procfs is not available.
+        """
+        if read is None:
+            read = proc_net_dev if proc_net_dev_available() else psutil_net_dev
+        self._read = read
+        self._rows = {}
+        self._free_rows = []
+        self._capacity = 0
+        self._current = array("Q")
+        self._previous = array("Q")
+        self._deltas = array("Q")
+        # 1 for the rows holding counters of an interface present at the current, and previous, collection
+        self._current_present = array("B")
+        self._previous_present = array("B")
+        # Views of the delta rows, and the deltas of the last update, handed out by update
+        self._delta_rows = []
+        self._result = {}
+        self._gone = []
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        # arrays cannot be resized while views of them exist
+        for view in self._delta_rows:
+            view.release()
+        self._result.clear()
+
+        added = capacity - self._capacity
+        for counters in (self._current, self._previous, self._deltas):
+            counters.extend(array("Q", bytes(8 * WIDTH * added)))
+        for present in (self._current_present, self._previous_present):
+            present.extend(bytes(added))
+        self._free_rows.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
+        deltas = memoryview(self._deltas)
+        self._delta_rows = [deltas[row * WIDTH:(row + 1) * WIDTH] for row in range(capacity)]
+        deltas.release()
+
+    def _row(self, name):
+        row = self._rows.get(name)
+        if row is None:
+            if not self._free_rows:
+                self._grow(self._capacity * 2 or 1)
+            row = self._rows[name] = self._free_rows.pop()
+        return row
+
+    def update(self):
+        """
+        Read the counters of every interface, and return the deltas since the previous update,
+        as a dictionary of interface name to a sequence of counters in FIELDS order.
+
+        The dictionary and sequences are reused by the next update, copy them to keep them longer.
+        """
+        readings = self._read()
+
+        self._current, self._previous = self._previous, self._current
+        self._current_present, self._previous_present = self._previous_present, self._current_present
+        current, previous, deltas = self._current, self._previous, self._deltas
+        current_present, previous_present = self._current_present, self._previous_present
+
+        for i in range(self._capacity):
+            current_present[i] = 0
+        for reading in readings:
+            row = self._row(reading[0])
+            base = row * WIDTH
+            for i in range(WIDTH):
+                current[base + i] = reading[i + 1]
+            current_present[row] = 1
+
+        result = self._result
+        result.clear()
+        gone = self._gone
+        for name, row in self._rows.items():
+            if not current_present[row]:
+                gone.append(name)
+                continue
+            if not previous_present[row]:
+                continue
+            base = row * WIDTH
+            for i in range(base, base + WIDTH):
+                deltas[i] = counter_delta(current[i], previous[i])
+            result[name] = self._delta_rows[row]
+
+        # interfaces that went away free their row for the next new interface
+        for name in gone:
+            self._free_rows.append(self._rows.pop(name))
+        del gone[:]
+        return result
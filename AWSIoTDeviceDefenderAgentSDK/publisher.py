@@ -0,0 +1,203 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+"""
+Publishing of metrics reports with acknowledgements, retries and a bounded number of reports in flight.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from awscrt import mqtt5
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the publish latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram(object):
+    """LatencyHistogram
+
+    Counts of publish latencies in fixed buckets, each counting the latencies up to its bound and above the
+    previous one, with a last bucket for latencies above every bound. Thread safe.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        """
+        Parameters
+        ----------
+        bounds : tuple
+                Increasing upper bounds of the buckets, in seconds.
+        """
+        self.bounds = tuple(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self._counts[bisect_left(self.bounds, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.maximum:
+                self.maximum = seconds
+
+    @property
+    def buckets(self):
+        """List of (upper bound, count) tuples, the last bound being infinite."""
+        with self._lock:
+            return list(zip(self.bounds + (float("inf"),), self._counts))
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of the latencies, e.g. 0.99, or 0 if empty."""
+        with self._lock:
+            rank = fraction * self.count
+            seen = 0
+            for bound, count in zip(self.bounds + (float("inf"),), self._counts):
+                seen += count
+                if count and seen >= rank:
+                    return bound
+        return 0.0
+
+    def __repr__(self):
+        return "LatencyHistogram(count={}, mean={:.3f}, p50<={}, p99<={}, maximum={:.3f})".format(
+            self.count, self.mean, self.percentile(0.5), self.percentile(0.99), self.maximum)
+
+
+class PublishPipeline(object):
+    """PublishPipeline
+
+    Publishes reports with QoS 1, keeping at most window reports awaiting their acknowledgement.
+
+    Publishes complete on the client's threads, so submitting a report does not wait for the broker.
+    A report that fails, or is rejected in its PUBACK, is published again after an exponentially growing
+    delay, and keeps its place in the window meanwhile. When the window is full, submit blocks until a report
+    completes, which holds back the next collection rather than queueing reports without bound.
+    """
+
+    def __init__(self, iot_client, window=8, max_retries=3, backoff=1.0, max_backoff=30.0, on_failure=None,
+                 clock=time.monotonic):
+        """
+        Parameters
+        ----------
+        iot_client : IoTClientWrapper
+                Client publishing the reports.
+        window : int
+                Most reports awaiting their acknowledgement at once, retries included.
+        max_retries : int
+                Times a failed report is published again before giving up on it.
+        backoff : float
+                Seconds before the first retry, doubled for every further retry.
+        max_backoff : float
+                Longest delay between retries, in seconds.
+        on_failure : callable
+                Called with the topic and payload of a report that failed every retry, e.g. to spool it.
+        clock : callable
+                Monotonic clock returning seconds.
+        """
+        if window < 1:
+            raise ValueError("Publish window must be at least 1")
+        self._client = iot_client
+        self.window = window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._on_failure = on_failure
+        self._clock = clock
+
+        self._slots = threading.BoundedSemaphore(window)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self.in_flight = 0
+        self.published = 0
+        self.retries = 0
+        self.failed = 0
+        self.latency = LatencyHistogram()
+
+    def submit(self, topic, payload, timeout=None):
+        """
+        Publish a report, waiting for room in the window if it is full.
+        Returns False, without publishing, if no room was made within timeout seconds.
+        """
+        if not self._slots.acquire(False):
+            logger.warning(f"{self.window} reports awaiting acknowledgement, waiting before publishing")
+            if not self._slots.acquire(timeout=timeout):
+                return False
+        with self._lock:
+            self.in_flight += 1
+        self._publish(topic, payload, 0)
+        return True
+
+    def _publish(self, topic, payload, attempt):
+        started = self._clock()
+        try:
+            future = self._client.publish(topic, payload, qos=mqtt5.QoS.AT_LEAST_ONCE)
+        except Exception as e:
+            self._failed(topic, payload, attempt, e)
+            return
+        future.add_done_callback(lambda f: self._completed(f, topic, payload, attempt, started))
+
+    def _completed(self, future, topic, payload, attempt, started):
+        error = future.exception()
+        if error is None:
+            puback = getattr(future.result(), "puback", None)
+            reason_code = getattr(puback, "reason_code", None)
+            # reason codes of 128 and above are failures (MQTT 5, 3.4.2.1)
+            if reason_code is not None and reason_code >= 128:
+                error = RuntimeError("Publish rejected: " + getattr(reason_code, "name", str(reason_code)))
+        if error is not None:
+            self._failed(topic, payload, attempt, error)
+            return
+
+        self.latency.record(self._clock() - started)
+        with self._lock:
+            self.published += 1
+        self._release()
+
+    def _failed(self, topic, payload, attempt, error):
+        if attempt < self.max_retries:
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+            logger.warning(f"Publish failed, retrying in {delay} seconds: {error}")
+            with self._lock:
+                self.retries += 1
+            timer = threading.Timer(delay, self._publish, (topic, payload, attempt + 1))
+            timer.daemon = True
+            timer.start()
+            return
+
+        logger.error(f"Publish failed after {attempt + 1} attempts: {error}")
+        with self._lock:
+            self.failed += 1
+        self._release()
+        if self._on_failure is not None:
+            self._on_failure(topic, payload)
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.notify_all()
+        self._slots.release()
+
+    def flush(self, timeout=None):
+        """Wait until every submitted report completed or failed, returns False on timeout."""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self.in_flight, timeout)
@@ -0,0 +1,167 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+"""
+Routing of received MQTT messages to the callbacks of matching topic filters.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SINGLE_LEVEL_WILDCARD = "+"
+MULTI_LEVEL_WILDCARD = "#"
+
+
+def validate_topic_filter(topic_filter):
+    """Raises ValueError if topic_filter is not a valid MQTT topic filter."""
+    if not topic_filter:
+        raise ValueError("Topic filter must not be empty")
+    levels = topic_filter.split("/")
+    for i, level in enumerate(levels):
+        if MULTI_LEVEL_WILDCARD in level and (level != MULTI_LEVEL_WILDCARD or i != len(levels) - 1):
+            raise ValueError("'#' must be the whole last level of a topic filter: " + topic_filter)
+        if SINGLE_LEVEL_WILDCARD in level and level != SINGLE_LEVEL_WILDCARD:
+            raise ValueError("'+' must be a whole level of a topic filter: " + topic_filter)
+
+
+class _Node(object):
+    __slots__ = ("children", "callbacks")
+
+    def __init__(self):
+        self.children = {}
+        self.callbacks = []
+
+
+class TopicRouter(object):
+    """TopicRouter
+
+    Trie of topic filters, one level per node, holding the callbacks subscribed to each filter.
+
+    Matching a topic walks the trie level by level, following the exact level, and the ``+`` and ``#``
+    wildcards, so its cost depends on the depth of the topic rather than on the number of filters.
+    As required by MQTT, topics starting with ``$``, such as the ``$aws`` reserved topics, are not matched
+    by filters starting with a wildcard.
+
+    Callbacks are run on a pool of worker threads, so a slow callback does not hold up the client's event
+    loop thread, which delivers the messages. Messages may then be handled out of order, unless the pool has
+    a single worker.
+    """
+
+    def __init__(self, workers=2):
+        """
+        Parameters
+        ----------
+        workers : int
+                Threads running the callbacks.
+        """
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="topic-router")
+
+    def subscribe(self, topic_filter, callback):
+        """
+        Add a callback for the topics matching topic_filter, next to any callbacks already added for it.
+
+        Parameters
+        ----------
+        topic_filter : string
+                MQTT topic filter, may contain ``+`` and ``#`` wildcards.
+        callback : callable
+                Called with the topic and payload of every matching message.
+        """
+        validate_topic_filter(topic_filter)
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split("/"):
+                node = node.children.setdefault(level, _Node())
+            node.callbacks.append(callback)
+
+    def unsubscribe(self, topic_filter, callback=None):
+        """Remove a callback of topic_filter, or all of them if callback is omitted."""
+        with self._lock:
+            path = [(None, self._root)]
+            for level in topic_filter.split("/"):
+                node = path[-1][1].children.get(level)
+                if node is None:
+                    return
+                path.append((level, node))
+
+            node = path[-1][1]
+            if callback is None:
+                node.callbacks = []
+            elif callback in node.callbacks:
+                node.callbacks.remove(callback)
+
+            # prune the nodes left without callbacks or children
+            for (level, node), (_, parent) in zip(reversed(path[1:]), reversed(path[:-1])):
+                if node.callbacks or node.children:
+                    break
+                del parent.children[level]
+
+    def match(self, topic):
+        """Returns the callbacks of every filter matching topic."""
+        levels = topic.split("/")
+        matched = []
+        with self._lock:
+            self._match(self._root, levels, 0, matched)
+        return matched
+
+    def _match(self, node, levels, depth, matched):
+        # '#' also matches the parent level, "a/#" matches "a"
+        reserved = depth == 0 and levels[0].startswith("$")
+        if not reserved:
+            multi = node.children.get(MULTI_LEVEL_WILDCARD)
+            if multi is not None:
+                matched.extend(multi.callbacks)
+
+        if depth == len(levels):
+            matched.extend(node.callbacks)
+            return
+
+        child = node.children.get(levels[depth])
+        if child is not None:
+            self._match(child, levels, depth + 1, matched)
+        if not reserved:
+            single = node.children.get(SINGLE_LEVEL_WILDCARD)
+            if single is not None:
+                self._match(single, levels, depth + 1, matched)
+
+    def dispatch(self, topic, payload):
+        """
+        Run the callbacks matching topic on the worker pool, returns the number of callbacks scheduled.
+
+        Parameters
+        ----------
+        topic : string
+                Topic the message was received on.
+        payload : bytes
+                Payload of the message.
+        """
+        callbacks = self.match(topic)
+        for callback in callbacks:
+            self._executor.submit(self._run, callback, topic, payload)
+        return len(callbacks)
+
+    @staticmethod
+    def _run(callback, topic, payload):
+        try:
+            callback(topic, payload)
+        except Exception as e:
+            logger.error(f"Error in callback for topic {topic}: {e}")
+
+    def close(self, wait=True):
+        """Stop the worker pool, after running the callbacks already dispatched if wait is True."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,158 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+"""
+Fixed rate scheduling of collection cycles.
+
+Sleeping for the interval after each cycle stretches the period by however long the cycle took, so reports
+drift later and later. The scheduler instead waits for absolute deadlines on the monotonic clock, spaced
+exactly one interval apart from the start.
+"""
+
+import asyncio
+import random
+import time
+
+
+class LatenessStats(object):
+    """How late the scheduler woke up past its deadlines, in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, lateness):
+        """
+        Parameters
+        ----------
+        lateness : float
+                Seconds between a deadline and the moment the scheduler woke up for it.
+        """
+        self.count += 1
+        self.total += lateness
+        if lateness > self.maximum:
+            self.maximum = lateness
+
+    @property
+    def mean(self):
+        """Average lateness, 0 before any tick."""
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return "LatenessStats(count={}, mean={:.6f}, maximum={:.6f})".format(self.count, self.mean, self.maximum)
+
+
+class Scheduler(object):
+    """Scheduler
+
+    Waits for deadlines one interval apart on the monotonic clock, starting when the scheduler is created.
+
+    Each deadline can be delayed by a random jitter, so a fleet of agents started together does not
+    publish in bursts. The jitter is drawn afresh for each tick and does not accumulate, the nominal
+    deadlines stay on the grid. When a cycle overruns one or more deadlines, they are skipped and the
+    scheduler waits for the next deadline still ahead, rather than running the missed cycles back to back.
+    """
+
+    def __init__(self, interval, jitter=0.0, clock=time.monotonic, sleep=time.sleep, rng=None):
+        """
+        Parameters
+        ----------
+        interval : float
+                Seconds between deadlines.
+        jitter : float
+                Upper bound of the random delay, in seconds, added to each deadline. Must be less than interval.
+        clock : callable
+                Monotonic clock returning seconds.
+        sleep : callable
+                Sleeps for the given number of seconds.
+        rng : random.Random
+                Random number generator drawing the jitter.
+        """
+        if interval <= 0:
+            raise ValueError("Interval must be positive: " + str(interval))
+        if not 0 <= jitter < interval:
+            raise ValueError("Jitter must be at least 0 and less than the interval: " + str(jitter))
+
+        self.interval = interval
+        self.jitter = jitter
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng if rng is not None else random.Random()
+        self._start = clock()
+        self._tick = 0
+        self.missed = 0
+        self.lateness = LatenessStats()
+
+    @property
+    def tick(self):
+        """Number of the last deadline waited for, deadline 0 being the start."""
+        return self._tick
+
+    def next_deadline(self):
+        """Monotonic time of the next nominal deadline, before jitter."""
+        return self._start + (self._tick + 1) * self.interval
+
+    def _advance(self, now):
+        """Move to the next deadline still ahead of now, returns it with jitter applied and the number skipped."""
+        tick = self._tick + 1
+        missed = 0
+        if now > self._start + tick * self.interval:
+            # the last cycle overran, resume on the first deadline still ahead
+            ahead = int((now - self._start) // self.interval) + 1
+            missed = ahead - tick
+            tick = ahead
+        self._tick = tick
+        self.missed += missed
+
+        deadline = self._start + tick * self.interval
+        if self.jitter:
+            deadline += self._rng.uniform(0, self.jitter)
+        return deadline, missed
+
+    def wait(self):
+        """
+        Sleep until the next deadline, skipping deadlines already passed.
+        Returns the number of deadlines skipped.
+        """
+        now = self._clock()
+        deadline, missed = self._advance(now)
+        remaining = deadline - now
+        if remaining > 0:
+            self._sleep(remaining)
+        self.lateness.record(max(0.0, self._clock() - deadline))
+        return missed
+
+    async def wait_async(self, stop=None):
+        """
+        Coroutine version of wait, for use on an asyncio event loop. The sleep function is not used.
+        Returns the number of deadlines skipped.
+
+        Parameters
+        ----------
+        stop : asyncio.Event
+                Returns as soon as this event is set, rather than at the deadline.
+        """
+        now = self._clock()
+        deadline, missed = self._advance(now)
+        remaining = max(0.0, deadline - now)
+        if stop is None:
+            await asyncio.sleep(remaining)
+        else:
+            try:
+                await asyncio.wait_for(stop.wait(), remaining)
+                return missed
+            except asyncio.TimeoutError:
+                pass
+        self.lateness.record(max(0.0, self._clock() - deadline))
+        return missed
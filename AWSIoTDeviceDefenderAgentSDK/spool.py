@@ -0,0 +1,403 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+"""
+Store and forward of metrics reports while the device is offline.
+
+Reports that cannot be published are appended to a bounded spool on disk, and published again, oldest first,
+at a limited rate once the connection is back. The spool is a sequence of append-only segment files holding
+CRC framed CBOR records, so appending is a single write at the end of a file, and a report torn by a crash
+is detected and discarded when the spool is reopened.
+"""
+
+import cbor2 as cbor
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Every record is framed by its length and CRC32, followed by the CBOR encoded [topic, payload] array
+FRAME_HEADER = struct.Struct("!II")
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+
+def _segment_name(sequence):
+    return "{:020d}{}".format(sequence, SEGMENT_SUFFIX)
+
+
+def _read_frame(segment_file):
+    """Read the record at the current position of a segment, None at the end or at a torn or corrupt frame."""
+    header = segment_file.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    length, crc = FRAME_HEADER.unpack(header)
+    record = segment_file.read(length)
+    if len(record) < length or zlib.crc32(record) != crc:
+        return None
+    return record
+
+
+class ReportSpool(object):
+    """ReportSpool
+
+    Bounded FIFO of reports, persisted to segment files in a directory.
+
+    New reports are appended to the newest segment, a new segment is started once it reaches segment_bytes.
+    When the spool exceeds max_bytes, its oldest segment is dropped, with the reports in it, so the spool
+    behaves as a ring buffer keeping the most recent reports. The position of the oldest report not yet
+    forwarded is kept in a cursor file, replaced atomically, and segments are deleted once forwarded.
+
+    On opening, every segment is scanned, and anything after the first torn or corrupt frame of a segment
+    is truncated. A report forwarded right before a crash may be forwarded again, never lost.
+    All methods are thread safe.
+    """
+
+    def __init__(self, directory, max_bytes=16 * 1024 * 1024, segment_bytes=1024 * 1024, fsync=False):
+        """
+        Parameters
+        ----------
+        directory : string
+                Directory holding the segment files, created if missing.
+        max_bytes : int
+                Bound on the size of all segments, the oldest reports are dropped beyond it.
+        segment_bytes : int
+                Size at which a new segment file is started.
+        fsync : bool
+                Flush every append to stable storage, rather than leaving it to the operating system.
+        """
+        if not 0 < segment_bytes <= max_bytes:
+            raise ValueError("Segment size must be positive and at most the spool size")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._fsync = fsync
+        self._lock = threading.Lock()
+
+        # [sequence, size in bytes, number of records] of every segment, oldest first
+        self._segments = deque()
+        self._size = 0
+        self._count = 0
+        self._next_sequence = 0
+        self.dropped = 0
+
+        # Position of the oldest report not yet forwarded, in the oldest segment
+        self._head_offset = 0
+        self._head_file = None
+        self._peeked = None
+        self._tail_file = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _path(self, sequence):
+        return os.path.join(self.directory, _segment_name(sequence))
+
+    def _recover(self):
+        sequences = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                           if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+        cursor_sequence, cursor_offset = None, 0
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), "rb") as cursor_file:
+                cursor_sequence, cursor_offset = cbor.loads(cursor_file.read())
+        except (OSError, ValueError, TypeError, cbor.CBORDecodeError):
+            pass
+
+        # new segments are numbered after the cursor, even when every segment was forwarded and deleted
+        self._next_sequence = max(sequences + [cursor_sequence if cursor_sequence is not None else -1]) + 1
+
+        for sequence in sequences:
+            if cursor_sequence is not None and sequence < cursor_sequence:
+                # already forwarded, deleting it was interrupted
+                os.remove(self._path(sequence))
+                continue
+
+            skip_to = cursor_offset if sequence == cursor_sequence else 0
+            size = count = 0
+            with open(self._path(sequence), "r+b") as segment_file:
+                while True:
+                    record = _read_frame(segment_file)
+                    if record is None:
+                        break
+                    if size >= skip_to:
+                        count += 1
+                    size = segment_file.tell()
+                if segment_file.seek(0, os.SEEK_END) != size:
+                    logger.warning(f"Truncating torn or corrupt reports at offset {size} of spool segment {sequence}")
+                    segment_file.truncate(size)
+
+            if not self._segments:
+                self._head_offset = min(skip_to, size)
+            self._segments.append([sequence, size, count])
+            self._size += size
+            self._count += count
+
+        if self._count:
+            logger.info(f"Recovered {self._count} spooled report(s)")
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def size(self):
+        """Bytes used by all segments."""
+        return self._size
+
+    def append(self, topic, payload):
+        """
+        Append a report to the spool, dropping the oldest segment if the spool is full.
+
+        Parameters
+        ----------
+        topic : string
+                Topic to publish the report to.
+        payload : bytes or string
+                The serialized report.
+        """
+        record = cbor.dumps([topic, payload])
+        frame = FRAME_HEADER.pack(len(record), zlib.crc32(record)) + record
+        if len(frame) > self.segment_bytes:
+            raise ValueError("Report of {} bytes does not fit in a spool segment".format(len(frame)))
+
+        with self._lock:
+            # recovered segments are never appended to, in case their tail was torn
+            if self._tail_file is None or self._segments[-1][1] + len(frame) > self.segment_bytes:
+                self._start_segment()
+
+            self._tail_file.write(frame)
+            self._tail_file.flush()
+            if self._fsync:
+                os.fsync(self._tail_file.fileno())
+
+            tail = self._segments[-1]
+            tail[1] += len(frame)
+            tail[2] += 1
+            self._size += len(frame)
+            self._count += 1
+
+            while self._size > self.max_bytes and len(self._segments) > 1:
+                self._drop_head()
+
+    def _start_segment(self):
+        if self._tail_file is not None:
+            self._tail_file.close()
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        self._tail_file = open(self._path(sequence), "ab")
+        self._segments.append([sequence, 0, 0])
+
+    def _drop_head(self):
+        count = self._segments[0][2]
+        logger.warning(f"Spool full, dropping {count} oldest report(s)")
+        self.dropped += count
+        self._remove_head()
+
+    def _remove_head(self):
+        """Delete the oldest segment, after moving the cursor past it."""
+        sequence, size, count = self._segments.popleft()
+        self._size -= size
+        self._count -= count
+        self._head_offset = 0
+        self._peeked = None
+        if self._head_file is not None:
+            self._head_file.close()
+            self._head_file = None
+        if self._segments:
+            self._write_cursor(self._segments[0][0], 0)
+        else:
+            self._tail_file.close()
+            self._tail_file = None
+        os.remove(self._path(sequence))
+
+    def _write_cursor(self, sequence, offset):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", "wb") as cursor_file:
+            cursor_file.write(cbor.dumps([sequence, offset]))
+            if self._fsync:
+                cursor_file.flush()
+                os.fsync(cursor_file.fileno())
+        os.replace(path + ".tmp", path)
+
+    def peek(self):
+        """Returns the oldest report as a (topic, payload) tuple, without removing it, or None if the spool is empty."""
+        with self._lock:
+            while self._segments:
+                sequence, size, count = self._segments[0]
+                if self._head_offset < size:
+                    if self._head_file is None:
+                        self._head_file = open(self._path(sequence), "rb")
+                    self._head_file.seek(self._head_offset)
+                    record = _read_frame(self._head_file)
+                    if record is not None:
+                        self._peeked = self._head_file.tell()
+                        topic, payload = cbor.loads(record)
+                        return topic, payload
+                    logger.error(f"Skipping corrupt reports in spool segment {sequence}")
+                elif len(self._segments) == 1:
+                    return None
+                # segment forwarded, or unreadable
+                self._remove_head()
+            return None
+
+    def pop(self):
+        """Remove the report returned by the last peek, once it has been forwarded."""
+        with self._lock:
+            if self._peeked is None:
+                return
+            self._head_offset, self._peeked = self._peeked, None
+            head = self._segments[0]
+            head[2] -= 1
+            self._count -= 1
+            if self._head_offset >= head[1] and len(self._segments) > 1:
+                self._remove_head()
+            else:
+                self._write_cursor(head[0], self._head_offset)
+
+    def close(self):
+        with self._lock:
+            for segment_file in (self._head_file, self._tail_file):
+                if segment_file is not None:
+                    segment_file.close()
+            self._head_file = self._tail_file = None
+
+
+class TokenBucket(object):
+    """Rate limiter allowing bursts of up to burst operations, refilled at rate operations per second."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def delay(self):
+        """Seconds until an operation is allowed, 0 if it is allowed now."""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def take(self):
+        """Use up a token, after delay returned 0."""
+        self._tokens -= 1
+
+
+class StoreAndForward(object):
+    """StoreAndForward
+
+    Publishes reports while the client is connected, and spools them while it is not.
+
+    Reports are spooled, rather than published directly, while older reports are still waiting in the spool,
+    so they are forwarded in order. A background thread forwards spooled reports at a limited rate whenever
+    the client is connected, so a long backlog does not flood the broker on reconnection.
+    """
+
+    def __init__(self, iot_client, spool, rate=1.0, burst=10, publish_timeout=10):
+        """
+        Parameters
+        ----------
+        iot_client : IoTClientWrapper
+                Client publishing the reports, tracking its connection state.
+        spool : ReportSpool
+                Spool for reports that cannot be published.
+        rate : float
+                Spooled reports forwarded per second, once reconnected.
+        burst : int
+                Spooled reports forwarded back to back before the rate applies.
+        publish_timeout : float
+                Seconds to wait for a spooled report to be published before retrying it.
+        """
+        self._client = iot_client
+        self.spool = spool
+        self._bucket = TokenBucket(rate, burst)
+        self._publish_timeout = publish_timeout
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.forwarded = 0
+
+    def should_spool(self):
+        """True while reports must be spooled: the client is offline or older reports are still spooled."""
+        return bool(len(self.spool)) or not self._client.connected.is_set()
+
+    def publish(self, topic, payload):
+        """Publish a report, or spool it if the client is offline or older reports are still spooled."""
+        if self.should_spool():
+            self.spool_report(topic, payload)
+            return None
+
+        future = self._client.publish(topic, payload)
+
+        def spool_on_failure(publish_future):
+            if publish_future.exception() is not None:
+                logger.warning(f"Publish failed, spooling report: {publish_future.exception()}")
+                self.spool_report(topic, payload)
+
+        future.add_done_callback(spool_on_failure)
+        return future
+
+    def spool_report(self, topic, payload):
+        """Spool a report to be forwarded later, e.g. after publishing it failed."""
+        self.spool.append(topic, payload)
+        self._wakeup.set()
+
+    def start(self):
+        """Start forwarding spooled reports in a background thread."""
+        self._thread = threading.Thread(target=self._forward, name="spool-forwarder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop forwarding, leaving reports not yet forwarded in the spool."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _forward(self):
+        while not self._stop.is_set():
+            if not self._client.connected.wait(1):
+                continue
+            report = self.spool.peek()
+            if report is None:
+                self._wakeup.wait(1)
+                self._wakeup.clear()
+                continue
+
+            delay = self._bucket.delay()
+            if delay:
+                self._stop.wait(delay)
+                continue
+
+            topic, payload = report
+            try:
+                self._client.publish(topic, payload).result(self._publish_timeout)
+            except Exception as e:
+                logger.warning(f"Failed to forward spooled report, retrying: {e}")
+                self._stop.wait(1)
+                continue
+            self._bucket.take()
+            self.spool.pop()
+            self.forwarded += 1
+            logger.debug(f"Forwarded spooled report, {len(self.spool)} left")
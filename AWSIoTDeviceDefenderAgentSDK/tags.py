@@ -136,4 +136,45 @@ class Tags(object):
 
     @property
     def custom_metrics(self):
-        return self.get(self.CUSTOM_METRICS)
\ No newline at end of file
+        return self.get(self.CUSTOM_METRICS)
+
+
+# Names of the fields resolved by Tags
+TAG_FIELDS = tuple(name for name, value in vars(Tags).items() if isinstance(value, property))
+
+
+class TagTable(object):
+    """
+    Immutable field names for metrics reports, resolved once for a naming style.
+
+    Exposes the same fields as Tags, but as plain attributes, so reading a field name costs an attribute
+    lookup rather than a property call. Use the LONG_TAGS and SHORT_TAGS singletons, or get_tags().
+    """
+    __slots__ = ('short_names',) + TAG_FIELDS
+
+    def __init__(self, short_names=False):
+        resolved = Tags(short_names)
+        object.__setattr__(self, 'short_names', short_names)
+        for name in TAG_FIELDS:
+            object.__setattr__(self, name, getattr(resolved, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TagTable is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("TagTable is immutable")
+
+    def get(self, tag):
+        if self.short_names:
+            return tag[1]
+        else:
+            return tag[0]
+
+
+LONG_TAGS = TagTable(short_names=False)
+SHORT_TAGS = TagTable(short_names=True)
+
+
+def get_tags(short_names=False):
+    """Returns the shared tag table for the long or short naming style."""
+    return SHORT_TAGS if short_names else LONG_TAGS
@@ -0,0 +1,240 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+import sys
+import threading
+import pytest
+from AWSIoTDeviceDefenderAgentSDK import agent, metrics
+if sys.version_info >= (3, 3):
+    from unittest import mock
+else:
+    import mock
+
+
+class FakeClock(object):
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _metric(ports, cpu=1.0):
+    m = metrics.Metrics()
+    m.add_network_stats(100, 10, 200, 20)
+    m.add_listening_ports("TCP", [{"port": p} for p in ports])
+    m.add_network_connection("10.0.0.1", 443, "eth0", 5000)
+    m.add_cpu_usage(cpu)
+    return m
+
+
+def test_change_publish_filter_skips_unchanged_reports():
+    clock = FakeClock()
+    publish_filter = agent.ChangePublishFilter(max_silence=600, clock=clock)
+
+    first = _metric([22, 80])
+    assert publish_filter.should_publish(first)
+    publish_filter.published(first)
+
+    # only counters and custom metrics changed, ports in a different order
+    clock.now = 300
+    assert not publish_filter.should_publish(_metric([80, 22], cpu=50.0))
+    assert publish_filter.skipped == 1
+
+    clock.now = 310
+    changed = _metric([22, 80, 443])
+    assert publish_filter.should_publish(changed)
+    publish_filter.published(changed)
+
+
+def test_change_publish_filter_publishes_after_max_silence():
+    clock = FakeClock()
+    publish_filter = agent.ChangePublishFilter(max_silence=600, clock=clock)
+    publish_filter.published(_metric([22]))
+
+    clock.now = 599
+    assert not publish_filter.should_publish(_metric([22]))
+    clock.now = 600
+    assert publish_filter.should_publish(_metric([22]))
+
+
+def test_change_publish_filter_carries_network_stats_of_skipped_reports():
+    clock = FakeClock()
+    publish_filter = agent.ChangePublishFilter(max_silence=600, clock=clock)
+
+    def collect(last, bytes_in):
+        m = metrics.Metrics(last_metric=last)
+        m.add_network_stats(bytes_in, 10, 200, 20)
+        m.add_listening_ports("TCP", [{"port": 22}])
+        return m
+
+    baseline = collect(None, 100)
+    first = collect(baseline, 150)
+    assert publish_filter.should_publish(first)
+    publish_filter.published(first)
+    assert first.network_stats["bytes_in"] == 50
+
+    # unchanged reports are skipped, the collector keeps computing deltas from the previous collection
+    skipped = collect(first, 400)
+    assert not publish_filter.should_publish(skipped)
+
+    clock.now = 600
+    published = collect(skipped, 1000)
+    assert published.network_stats["bytes_in"] == 600
+    assert publish_filter.should_publish(published)
+    # counted from the last published report, including the traffic of the skipped one
+    assert published.network_stats["bytes_in"] == 850
+    assert published.network_stats["packets_in"] == 0
+
+
+def test_shared_client_bootstrap_is_reused():
+    assert agent.shared_client_bootstrap() is agent.shared_client_bootstrap()
+
+
+def _wrapper():
+    return agent.IoTClientWrapper(
+        "endpoint.example.com", "ca.pem", "cert.pem", "key.pem", "thing", None, None, None, False
+    )
+
+
+def test_connect_waits_for_connection_success():
+    wrapper = _wrapper()
+    client = mock.Mock()
+    # the CRT reports connection success from its event loop thread, after start returns
+    client.start.side_effect = lambda: threading.Timer(
+        0.05, wrapper.on_lifecycle_connection_success, (None,)
+    ).start()
+
+    with mock.patch.object(agent.mqtt5_client_builder, "mtls_from_path", return_value=client) as builder:
+        wrapper.connect(timeout=5)
+
+    assert wrapper.connected.is_set()
+    assert builder.call_args[1]["client_bootstrap"] is agent.shared_client_bootstrap()
+
+
+def test_connect_times_out_with_last_error():
+    wrapper = _wrapper()
+    client = mock.Mock()
+    client.start.side_effect = lambda: wrapper.on_lifecycle_connection_failure(
+        mock.Mock(exception=ConnectionRefusedError("refused"))
+    )
+
+    with mock.patch.object(agent.mqtt5_client_builder, "mtls_from_path", return_value=client):
+        with pytest.raises(TimeoutError) as error:
+            wrapper.connect(timeout=0.05)
+
+    assert "refused" in str(error.value)
+
+
+def test_received_messages_are_routed_off_the_client_thread():
+    wrapper = _wrapper()
+    wrapper.iot_client = mock.Mock()
+    wrapper.iot_client.subscribe.return_value.result.return_value.reason_codes = [mock.sentinel.granted]
+    received = []
+    done = threading.Event()
+
+    def callback(topic, payload):
+        received.append((topic, payload, threading.current_thread()))
+        done.set()
+
+    wrapper.subscribe("$aws/things/thing/defender/metrics/json/+", callback)
+    packet = mock.Mock()
+    packet.publish_packet.topic = "$aws/things/thing/defender/metrics/json/accepted"
+    packet.publish_packet.payload = b"{}"
+    wrapper.on_publish_received(packet)
+
+    assert done.wait(5)
+    topic, payload, thread = received[0]
+    assert topic == "$aws/things/thing/defender/metrics/json/accepted"
+    assert payload == b"{}"
+    assert thread is not threading.current_thread()
+    wrapper.router.close()
+
+
+def test_pipeline_submit_spools_while_offline_or_window_full(tmp_path):
+    from AWSIoTDeviceDefenderAgentSDK import spool
+
+    client = mock.Mock()
+    client.connected = threading.Event()
+    forwarder = spool.StoreAndForward(client, spool.ReportSpool(str(tmp_path)))
+    pipeline = mock.Mock()
+    submit = agent.pipeline_submit(pipeline, forwarder, timeout=0)
+
+    # offline, the report never reaches the pipeline, whose window would fill up until reconnection
+    submit("topic", b"offline")
+    pipeline.submit.assert_not_called()
+    assert len(forwarder.spool) == 1
+
+    # online with a backlog, reports stay in order behind it
+    client.connected.set()
+    submit("topic", b"backlog")
+    pipeline.submit.assert_not_called()
+
+    assert forwarder.spool.peek() == ("topic", b"offline")
+    forwarder.spool.pop()
+    assert forwarder.spool.peek() == ("topic", b"backlog")
+    forwarder.spool.pop()
+    pipeline.submit.return_value = True
+    submit("topic", b"online")
+    pipeline.submit.assert_called_once_with("topic", b"online", timeout=0)
+    assert len(forwarder.spool) == 0
+
+    # the window stayed full past the timeout
+    pipeline.submit.return_value = False
+    submit("topic", b"window full")
+    assert forwarder.spool.peek() == ("topic", b"window full")
+    forwarder.spool.close()
+
+
+def test_pipeline_submit_drops_reports_when_window_stays_full(caplog):
+    pipeline = mock.Mock()
+    pipeline.submit.return_value = False
+    submit = agent.pipeline_submit(pipeline, timeout=0.5)
+
+    submit("topic", b"report")
+
+    pipeline.submit.assert_called_once_with("topic", b"report", timeout=0.5)
+    assert "dropping report" in caplog.text
+
+
+@pytest.mark.parametrize("option", [["--spool-dir", "spool"], ["--publish-window", "8"]])
+def test_asyncio_rejects_spool_and_publish_window(option):
+    argv = ["agent", "-e", "endpoint", "-r", "ca.pem", "-c", "cert.pem", "-k", "key.pem", "-id", "thing",
+            "-f", "json", "--asyncio"]
+    with mock.patch.object(sys, "argv", argv):
+        assert agent.parse_args().use_asyncio
+    with mock.patch.object(sys, "argv", argv + option):
+        with pytest.raises(SystemExit):
+            agent.parse_args()
+
+
+def test_stop_disconnects_and_closes_router():
+    wrapper = _wrapper()
+    wrapper.stop()
+    wrapper.iot_client = mock.Mock()
+    wrapper.router = mock.Mock()
+
+    wrapper.stop()
+
+    wrapper.iot_client.stop.assert_called_once_with()
+    wrapper.router.close.assert_called_once_with()
+
+
+def test_track_changes_rejects_reservoir():
+    argv = ["agent", "-e", "endpoint", "-r", "ca.pem", "-c", "cert.pem", "-k", "key.pem", "-id", "thing",
+            "-f", "json", "--track-changes"]
+    with mock.patch.object(sys, "argv", argv):
+        assert agent.parse_args().track_changes
+    with mock.patch.object(sys, "argv", argv + ["--reservoir-size", "100"]):
+        with pytest.raises(SystemExit):
+            agent.parse_args()
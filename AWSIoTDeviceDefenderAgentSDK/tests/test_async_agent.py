@@ -0,0 +1,142 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+import asyncio
+import json
+import threading
+from concurrent.futures import Future
+from AWSIoTDeviceDefenderAgentSDK import async_agent, metrics
+
+TOPIC = "$aws/things/thing/defender/metrics/json"
+
+
+class FakeCollector(object):
+    def __init__(self):
+        self.collections = 0
+        self._last = None
+
+    def collect_metrics(self):
+        self.collections += 1
+        m = metrics.Metrics(last_metric=self._last)
+        m.add_network_stats(100 * self.collections, 10, 200, 20)
+        self._last = m
+        return m
+
+
+class FakeClient(object):
+    """Completes publishes from another thread, and answers each one on the accepted topic."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.callbacks = {}
+        self.payloads = []
+
+    def subscribe(self, topic, callback):
+        self.callbacks[topic] = callback
+
+    def publish(self, topic, payload):
+        future = Future()
+
+        def complete():
+            self.payloads.append(payload)
+            if self.fail:
+                future.set_exception(RuntimeError("broker unavailable"))
+            else:
+                future.set_result(None)
+                self.callbacks[topic + "/accepted"](topic + "/accepted", b'{"status": "ACCEPTED"}')
+
+        threading.Timer(0.01, complete).start()
+        return future
+
+
+async def _run_until(agent, condition, timeout=5):
+    task = asyncio.get_running_loop().create_task(agent.run())
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not condition() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+    finally:
+        agent.stop()
+        await task
+
+
+def test_async_agent_publishes_and_handles_responses():
+    client = FakeClient()
+    agent = async_agent.AsyncAgent(FakeCollector(), iot_client=client, topic=TOPIC, interval=0.02)
+
+    asyncio.run(_run_until(agent, lambda: agent.accepted >= 2))
+
+    assert set(client.callbacks) == {TOPIC + "/accepted", TOPIC + "/rejected"}
+    assert agent.published >= 2
+    assert agent.accepted >= 2
+    # the baseline collection is not published
+    first = json.loads(client.payloads[0])
+    assert first["metrics"]["network_stats"]["bytes_in"] == 100
+
+
+def test_async_agent_counts_failed_publishes():
+    agent = async_agent.AsyncAgent(FakeCollector(), iot_client=FakeClient(fail=True), topic=TOPIC, interval=0.02)
+
+    asyncio.run(_run_until(agent, lambda: agent.publish_errors >= 1))
+
+    assert agent.publish_errors >= 1
+    assert agent.published == 0
+
+
+def test_async_agent_stops_promptly():
+    collector = FakeCollector()
+    agent = async_agent.AsyncAgent(collector, interval=3600)
+
+    async def run():
+        task = asyncio.get_running_loop().create_task(agent.run())
+        while collector.collections == 0:
+            await asyncio.sleep(0.01)
+        agent.stop()
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(run())
+    assert collector.collections == 1
+
+
+class RecordingFilter(object):
+    def __init__(self):
+        self.recorded = []
+
+    def should_publish(self, metric):
+        return True
+
+    def published(self, metric):
+        self.recorded.append(metric)
+
+
+def test_async_agent_records_only_acknowledged_publishes():
+    publish_filter = RecordingFilter()
+    agent = async_agent.AsyncAgent(FakeCollector(), iot_client=FakeClient(fail=True), topic=TOPIC, interval=0.02,
+                                   publish_filter=publish_filter)
+
+    asyncio.run(_run_until(agent, lambda: agent.publish_errors >= 2))
+    assert publish_filter.recorded == []
+
+    agent = async_agent.AsyncAgent(FakeCollector(), iot_client=FakeClient(), topic=TOPIC, interval=0.02,
+                                   publish_filter=publish_filter)
+    asyncio.run(_run_until(agent, lambda: agent.published >= 2))
+    assert len(publish_filter.recorded) == agent.published
+
+
+def test_async_agent_dry_run_writes_cbor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    collector = FakeCollector()
+    agent = async_agent.AsyncAgent(collector, serialization_format="cbor", interval=0.02)
+
+    asyncio.run(_run_until(agent, lambda: (tmp_path / "cbor_metrics").exists()))
+    assert (tmp_path / "cbor_metrics").stat().st_size > 0
@@ -14,6 +14,7 @@ from collections import namedtuple
 from AWSIoTDeviceDefenderAgentSDK import collector
 import sys
 import socket
+import threading
 import psutil
 import pytest
 if sys.version_info >= (3, 3):
@@ -273,3 +274,228 @@ def test_collector_net_connections(
     assert metrics_output.network_connections[5]["remote_addr"] == "11.0.0.7:789"
     assert metrics_output.network_connections[5]["local_interface"] is None
     assert metrics_output.network_connections[5]["local_port"] == 77777
+
+
+def test_interface_index_lookup(if_addrs):
+    interfaces = collector.InterfaceIndex(if_addrs)
+
+    assert interfaces.get("10.0.0.1") == "em1"
+    assert interfaces.get("10.0.0.7") is None
+    assert interfaces.get("0.0.0.0") == "0.0.0.0"
+    assert interfaces.get("::") == "::"
+
+
+def test_interface_index_ipv4_mapped_and_scoped_addresses():
+    if_addrs = {
+        "eth0": [
+            if_addr_tuple(family=socket.AF_INET, address="192.168.1.10", netmask=None, broadcast=None, ptp=None),
+            if_addr_tuple(family=socket.AF_INET6, address="fe80::1%eth0", netmask=None, broadcast=None, ptp=None),
+        ],
+        "eth1": [
+            if_addr_tuple(family=socket.AF_INET6, address="2001:db8::1", netmask=None, broadcast=None, ptp=None),
+        ],
+    }
+    interfaces = collector.InterfaceIndex(if_addrs)
+
+    assert interfaces.get("::ffff:192.168.1.10") == "eth0"
+    assert interfaces.get("fe80::1") == "eth0"
+    assert interfaces.get("fe80::1%eth0") == "eth0"
+    assert interfaces.get("2001:0db8:0000::0001") == "eth1"
+    assert interfaces.get("not-an-address") is None
+
+
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_if_addrs")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_io_counters")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_connections")
+def test_collector_reads_interfaces_once_per_collection(
+    mock_net_connections,
+    mock_io_counters,
+    mock_if_addrs,
+    net_connections,
+    if_addrs,
+    net_io_counters,
+):
+    mock_net_connections.return_value = net_connections
+    mock_io_counters.return_value = net_io_counters
+    mock_if_addrs.return_value = if_addrs
+
+    new_collector = collector.Collector(short_metrics_names=False)
+    new_collector.collect_metrics()
+
+    assert mock_if_addrs.call_count == 1
+
+
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_if_addrs")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_io_counters")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_connections")
+def test_collector_reads_socket_table_once_per_collection(
+    mock_net_connections,
+    mock_io_counters,
+    mock_if_addrs,
+    net_connections,
+    if_addrs,
+    net_io_counters,
+):
+    mock_net_connections.return_value = net_connections
+    mock_io_counters.return_value = net_io_counters
+    mock_if_addrs.return_value = if_addrs
+
+    new_collector = collector.Collector(short_metrics_names=False)
+    metrics_output = new_collector.collect_metrics()
+
+    mock_net_connections.assert_called_once_with(kind="inet")
+    assert len(metrics_output.listening_ports("TCP")) == 1
+    assert len(metrics_output.network_connections) == 6
+
+
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_if_addrs")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_io_counters")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_connections")
+def test_collector_seeded_reports_are_reproducible(
+    mock_net_connections,
+    mock_io_counters,
+    mock_if_addrs,
+    net_connections,
+    if_addrs,
+    net_io_counters,
+):
+    mock_net_connections.return_value = net_connections
+    mock_io_counters.return_value = net_io_counters
+    mock_if_addrs.return_value = if_addrs
+
+    def sampled_connections(seed):
+        metrics_output = collector.Collector(use_custom_metrics=False, seed=seed).collect_metrics()
+        metrics_output.max_list_size = 2
+        return metrics_output._v1_metrics()["metrics"]["tcp_connections"]
+
+    assert sampled_connections(3) == sampled_connections(3)
+
+
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_if_addrs")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_io_counters")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_connections")
+def test_collector_reservoir_sampling(
+    mock_net_connections,
+    mock_io_counters,
+    mock_if_addrs,
+    net_connections,
+    if_addrs,
+    net_io_counters,
+):
+    mock_net_connections.return_value = net_connections
+    mock_io_counters.return_value = net_io_counters
+    mock_if_addrs.return_value = if_addrs
+
+    new_collector = collector.Collector(use_custom_metrics=False, reservoir_size=2)
+    metrics_output = new_collector.collect_metrics()
+
+    assert len(metrics_output.network_connections) == 2
+    assert len(metrics_output.listening_ports("UDP")) == 2
+    report = metrics_output._v1_metrics()["metrics"]
+    assert report["tcp_connections"]["established_connections"]["total"] == 6
+    assert report["listening_udp_ports"]["total"] == 3
+
+
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_if_addrs")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_io_counters")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_connections")
+def test_collector_incremental_changes(
+    mock_net_connections,
+    mock_io_counters,
+    mock_if_addrs,
+    net_connections,
+    if_addrs,
+    net_io_counters,
+):
+    mock_net_connections.return_value = net_connections
+    mock_io_counters.return_value = net_io_counters
+    mock_if_addrs.return_value = if_addrs
+
+    new_collector = collector.Collector(use_custom_metrics=False, incremental=True)
+    first = new_collector.collect_metrics()
+    assert len(first.changes.connections.added) == 6
+
+    # the first connection closes, the others are long-lived
+    mock_net_connections.return_value = net_connections[1:]
+    second = new_collector.collect_metrics()
+
+    assert second.changes.connections.added == ()
+    assert [c.remote_addr for c in second.changes.connections.removed] == ["11.0.0.1"]
+    assert second.changes.tcp_ports.added == ()
+    assert second.changes.udp_ports.removed == ()
+
+
+def test_collector_incremental_rejects_reservoir():
+    with pytest.raises(ValueError):
+        collector.Collector(reservoir_size=10, incremental=True)
+
+
+@mock.patch(PATCH_MODULE_LOCATION_PS + "cpu_percent")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_if_addrs")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_io_counters")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_connections")
+def test_collector_parallel_matches_sequential(
+    mock_net_connections,
+    mock_io_counters,
+    mock_if_addrs,
+    mock_cpu_percent,
+    net_connections,
+    if_addrs,
+    net_io_counters,
+):
+    mock_net_connections.return_value = net_connections
+    mock_io_counters.return_value = net_io_counters
+    mock_if_addrs.return_value = if_addrs
+    mock_cpu_percent.return_value = 12.5
+
+    sequential = collector.Collector(seed=1).collect_metrics()
+    parallel_collector = collector.Collector(seed=1, parallel=True)
+    parallel = parallel_collector.collect_metrics()
+    parallel_collector.close()
+
+    # headers differ only by their timestamps
+    assert parallel._v1_metrics()["metrics"] == sequential._v1_metrics()["metrics"]
+    assert parallel.cpu_metrics == sequential.cpu_metrics
+    assert parallel_collector.timed_out_sources == []
+
+
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_if_addrs")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_io_counters")
+@mock.patch(PATCH_MODULE_LOCATION_PS + "net_connections")
+def test_collector_parallel_source_timeout(
+    mock_net_connections,
+    mock_io_counters,
+    mock_if_addrs,
+    net_connections,
+    if_addrs,
+    net_io_counters,
+):
+    release = threading.Event()
+
+    def slow_connections(kind):
+        release.wait(5)
+        return net_connections
+
+    mock_net_connections.side_effect = slow_connections
+    mock_io_counters.return_value = net_io_counters
+    mock_if_addrs.return_value = if_addrs
+
+    new_collector = collector.Collector(
+        use_custom_metrics=False, parallel=True, source_timeout={collector.SOCKETS: 0.05}
+    )
+    try:
+        first = new_collector.collect_metrics()
+        assert new_collector.timed_out_sources == [collector.SOCKETS]
+        assert new_collector.skipped_sources == []
+        assert first.network_connections == []
+        assert first.total_counts["bytes_in"] == net_io_counters.bytes_recv
+
+        # the stuck read is not started again while it is still running
+        second = new_collector.collect_metrics()
+        assert new_collector.timed_out_sources == []
+        assert new_collector.skipped_sources == [collector.SOCKETS]
+        assert mock_net_connections.call_count == 1
+        assert second.network_connections == []
+    finally:
+        release.set()
+        new_collector.close()
@@ -0,0 +1,200 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+import errno
+import socket
+import struct
+import sys
+import psutil
+import pytest
+from AWSIoTDeviceDefenderAgentSDK import connections, collector
+
+PROC_NET_TCP = """\
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 0100007F:0035 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 1060 1 0 100 0 0 10 0
+   1: 0500000A:0016 0600000A:D431 01 00000000:00000000 02:000009B5 00000000     0        0 8284 2 0 20 4 0 16 8
+   2: 0500000A:0016 0700000A:D432 06 00000000:00000000 00:00000000 00000000     0        0 0 2 0 20 4 0 18 -1
+"""
+
+PROC_NET_TCP6 = """\
+  sl  local_address                         remote_address                        st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 0000000000000000FFFF00000500000A:01BB 0000000000000000FFFF00000600000A:9E49 01 00000000:00000000 00:00000000 00000000     0        0 1 1 0 20 4 0 18 -1
+   1: 00000000000000000000000001000000:0277 00000000000000000000000000000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 2 1 0 20 4 0 18 -1
+"""
+
+PROC_NET_UDP = """\
+   sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode ref pointer drops
+  100: 00000000:0044 00000000:0000 07 00000000:00000000 00:00000000 00000000     0        0 3 2 0 0
+"""
+
+
+@pytest.fixture()
+def procfs(tmp_path):
+    net = tmp_path / "net"
+    net.mkdir()
+    (net / "tcp").write_text(PROC_NET_TCP)
+    (net / "tcp6").write_text(PROC_NET_TCP6)
+    (net / "udp").write_text(PROC_NET_UDP)
+    # no udp6 table, as on hosts with IPv6 disabled
+    return str(tmp_path)
+
+
+@pytest.mark.skipif(sys.byteorder != "little", reason="fixture tables are in little-endian layout")
+def test_proc_connections_parses_tables(procfs):
+    conns = connections.proc_connections(procfs)
+
+    assert len(conns) == 6
+
+    listen = conns[0]
+    assert listen.family == socket.AF_INET
+    assert listen.type == socket.SOCK_STREAM
+    assert listen.laddr == ("127.0.0.1", 53)
+    assert listen.raddr == ()
+    assert listen.status == psutil.CONN_LISTEN
+
+    established = conns[1]
+    assert established.laddr.ip == "10.0.0.5"
+    assert established.laddr.port == 22
+    assert established.raddr.ip == "10.0.0.6"
+    assert established.raddr.port == 54321
+    assert established.status == psutil.CONN_ESTABLISHED
+
+    assert conns[2].status == psutil.CONN_TIME_WAIT
+
+    mapped = conns[3]
+    assert mapped.family == socket.AF_INET6
+    assert mapped.laddr == ("::ffff:10.0.0.5", 443)
+    assert mapped.raddr == ("::ffff:10.0.0.6", 40521)
+
+    assert conns[4].laddr == ("::1", 631)
+    assert conns[4].status == psutil.CONN_LISTEN
+
+    udp = conns[5]
+    assert udp.type == socket.SOCK_DGRAM
+    assert udp.laddr == ("0.0.0.0", 68)
+    assert udp.status == psutil.CONN_NONE
+
+
+def test_get_source_rejects_unknown_source():
+    with pytest.raises(ValueError):
+        connections.get_source("bogus")
+
+
+def test_get_source_falls_back_to_psutil(monkeypatch):
+    monkeypatch.setattr(connections, "proc_connections_available", lambda: False)
+    assert connections.get_source(connections.PROC) is connections.psutil_connections
+
+
+@pytest.mark.skipif(not connections.proc_connections_available(), reason="requires Linux procfs")
+def test_proc_connections_sees_loopback_listener():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+
+        conns = connections.proc_connections()
+
+    assert any(
+        c.laddr == ("127.0.0.1", port) and c.status == psutil.CONN_LISTEN for c in conns
+    )
+
+
+@pytest.mark.skipif(not connections.proc_connections_available(), reason="requires Linux procfs")
+def test_collector_proc_source_reports_loopback_connection():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+        with socket.create_connection(("127.0.0.1", port)) as client:
+            accepted, _ = server.accept()
+            with accepted:
+                new_collector = collector.Collector(
+                    use_custom_metrics=False, connection_source=connections.PROC
+                )
+                metrics_output = new_collector.collect_metrics()
+                client_port = client.getsockname()[1]
+
+    assert any(p["port"] == port for p in metrics_output.listening_ports("TCP"))
+    assert any(
+        c["remote_addr"] == "127.0.0.1:" + str(port) and c["local_port"] == client_port
+        for c in metrics_output.network_connections
+    )
+
+
+def _inet_diag_message(seq, family, state, sport, dport, src, dst):
+    body = struct.pack("!BB2xHH16s16s", family, state, sport, dport, src, dst) + b"\0" * 32
+    return struct.pack("=IHHII", 16 + len(body), connections.SOCK_DIAG_BY_FAMILY, 2, seq, 0) + body
+
+
+def test_parse_inet_diag_messages():
+    src = socket.inet_pton(socket.AF_INET, "10.0.0.5") + b"\0" * 12
+    dst = socket.inet_pton(socket.AF_INET, "10.0.0.6") + b"\0" * 12
+    buffer = (
+        _inet_diag_message(7, socket.AF_INET, 10, 22, 0, src, b"\0" * 16)
+        + _inet_diag_message(7, socket.AF_INET, 1, 22, 54321, src, dst)
+        + _inet_diag_message(8, socket.AF_INET, 1, 80, 1234, src, dst)
+    )
+
+    records = []
+    done = connections._parse_inet_diag_messages(memoryview(buffer), 7, records)
+
+    assert not done
+    assert records == [
+        (socket.AF_INET, 10, 22, 0, src, b"\0" * 16),
+        (socket.AF_INET, 1, 22, 54321, src, dst),
+    ]
+
+    done_message = struct.pack("=IHHII", 20, connections.NLMSG_DONE, 2, 7, 0) + b"\0" * 4
+    assert connections._parse_inet_diag_messages(memoryview(done_message), 7, records)
+
+
+def test_parse_inet_diag_messages_raises_netlink_errors():
+    error_message = struct.pack("=IHHIIi", 20, connections.NLMSG_ERROR, 0, 3, 0, -errno.ENOENT)
+
+    with pytest.raises(OSError) as error:
+        connections._parse_inet_diag_messages(memoryview(error_message), 3, [])
+    assert error.value.errno == errno.ENOENT
+
+
+@pytest.mark.skipif(not connections.sock_diag_available(), reason="requires NETLINK_SOCK_DIAG")
+def test_sock_diag_connections_sees_loopback_sockets():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server, \
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+        udp.bind(("127.0.0.1", 0))
+        udp_port = udp.getsockname()[1]
+
+        with socket.create_connection(("127.0.0.1", port)) as client:
+            client_port = client.getsockname()[1]
+            conns = connections.sock_diag_connections()
+
+    assert any(c.laddr == ("127.0.0.1", port) and c.status == psutil.CONN_LISTEN for c in conns)
+    assert any(
+        c.laddr == ("127.0.0.1", client_port)
+        and c.raddr == ("127.0.0.1", port)
+        and c.status == psutil.CONN_ESTABLISHED
+        for c in conns
+    )
+    assert any(
+        c.laddr == ("127.0.0.1", udp_port)
+        and c.type == socket.SOCK_DGRAM
+        and c.status == psutil.CONN_NONE
+        for c in conns
+    )
+    # tcp sockets outside LISTEN and ESTABLISHED are filtered by the kernel
+    assert all(
+        c.status in (psutil.CONN_LISTEN, psutil.CONN_ESTABLISHED)
+        for c in conns
+        if c.type == socket.SOCK_STREAM
+    )
@@ -0,0 +1,143 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+import json
+import sys
+import threading
+import time
+import pytest
+from AWSIoTDeviceDefenderAgentSDK import fleet, metrics
+if sys.version_info >= (3, 3):
+    from unittest import mock
+else:
+    import mock
+
+
+def test_load_things(tmp_path):
+    path = tmp_path / "things.json"
+    path.write_text(json.dumps([
+        {"thing_name": "gateway", "cert": "0.pem", "key": "0.key", "metrics": "host"},
+        {"thing_name": "sensor-2", "client_id": "gw-sensor-2", "cert": "2.pem", "key": "2.key",
+         "metrics": "sensors:SensorMetrics"},
+    ]))
+
+    assert fleet.load_things(str(path)) == [
+        fleet.Thing("gateway", "gateway", "0.pem", "0.key", "host"),
+        fleet.Thing("sensor-2", "gw-sensor-2", "2.pem", "2.key", "sensors:SensorMetrics"),
+    ]
+
+    path.write_text(json.dumps([{"thing_name": "sensor-1"}]))
+    with pytest.raises(ValueError):
+        fleet.load_things(str(path))
+
+    # the host's metrics are not reported as every thing's metrics
+    path.write_text(json.dumps([{"thing_name": "sensor-1", "cert": "1.pem", "key": "1.key"}]))
+    with pytest.raises(ValueError):
+        fleet.load_things(str(path))
+    path.write_text(json.dumps([
+        {"thing_name": "sensor-%d" % i, "cert": "1.pem", "key": "1.key", "metrics": "host"} for i in range(2)
+    ]))
+    with pytest.raises(ValueError):
+        fleet.load_things(str(path))
+
+
+def test_metrics_source():
+    host_collector = FakeCollector()
+    assert fleet.metrics_source(fleet.Thing("gateway", "gateway", "c", "k", "host"), host_collector) is host_collector
+
+    thing = fleet.Thing("sensor-1", "sensor-1", "c", "k", "collections:namedtuple")
+    with mock.patch("collections.namedtuple") as factory:
+        assert fleet.metrics_source(thing, host_collector) is factory.return_value
+    factory.assert_called_once_with("sensor-1")
+
+    with pytest.raises(ValueError):
+        fleet.metrics_source(fleet.Thing("sensor-1", "sensor-1", "c", "k", "sensors"), host_collector)
+
+
+def test_staggered_schedule():
+    now = [100.0]
+    schedule = fleet.StaggeredSchedule(4, 20, clock=lambda: now[0])
+
+    due = []
+    for _ in range(8):
+        deadline, member = schedule.next_due()
+        now[0] = deadline
+        due.append((deadline, schedule.advance()))
+
+    assert due == [(100.0 + 5 * i, i % 4) for i in range(8)]
+
+    # member 0 runs so late that its following deadline has passed too
+    now[0] = 165.0
+    assert schedule.advance() == 0
+    assert schedule.missed == 1
+    assert schedule.next_due() == (145.0, 1)
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+
+
+class FakeCollector(object):
+    def __init__(self):
+        self._last = None
+
+    def collect_metrics(self):
+        self._last = metrics.Metrics(last_metric=self._last)
+        return self._last
+
+
+def test_fleet_agent_publishes_for_every_thing():
+    clients = [FakeClient() for _ in range(3)]
+    members = [fleet.FleetMember("thing-%d" % i, client, FakeCollector(), "json") for i, client in enumerate(clients)]
+    agent = fleet.FleetAgent(members, interval=0.03)
+
+    runner = threading.Thread(target=agent.run)
+    runner.start()
+    deadline = time.monotonic() + 5
+    while any(member.published < 2 for member in members) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    agent.stop()
+    runner.join()
+
+    for i, client in enumerate(clients):
+        assert len(client.published) >= 2
+        assert all(topic == "$aws/things/thing-%d/defender/metrics/json" % i for topic, _ in client.published)
+
+
+class ConnectingClient(object):
+    def __init__(self, clock, connects_at):
+        self.clock = clock
+        self.connects_at = connects_at
+        self.timeouts = []
+
+    def wait_connected(self, timeout):
+        self.timeouts.append(timeout)
+        if self.connects_at is None or self.connects_at > self.clock[0] + timeout:
+            self.clock[0] += timeout
+            raise TimeoutError("not connected")
+        self.clock[0] = max(self.clock[0], self.connects_at)
+
+
+def test_wait_connected_shares_one_deadline():
+    now = [0.0]
+    clients = [ConnectingClient(now, None), ConnectingClient(now, 15.0), ConnectingClient(now, 1.0)]
+    members = [fleet.FleetMember("thing-%d" % i, client, FakeCollector(), "json") for i, client in enumerate(clients)]
+
+    # an unreachable thing neither stops the fleet nor delays the others past the deadline
+    assert fleet.wait_connected(members, 10, clock=lambda: now[0]) == [members[0], members[1]]
+    assert [client.timeouts for client in clients] == [[10.0], [0.0], [0.0]]
+    assert now[0] == 10.0
@@ -11,7 +11,16 @@
 #   express or implied. See the License for the specific language governing
 #   permissions and limitations under the License.
 
+import io
+import json
+import random
+import cbor2
+import sys
 import pytest
+if sys.version_info >= (3, 3):
+    from unittest import mock
+else:
+    import mock
 from AWSIoTDeviceDefenderAgentSDK import metrics, tags
 
 
@@ -144,9 +153,9 @@ def test_v1_metrics_optional_elements(simple_metric):
     assert t.listening_udp_ports in report[t.metrics]
 
     simple_metric._interface_stats = {}
-    simple_metric.listening_tcp_ports = []
-    simple_metric.listening_udp_ports = []
-    simple_metric._net_connections = []
+    simple_metric._listening_tcp_ports = {}
+    simple_metric._listening_udp_ports = {}
+    simple_metric._net_connections = {}
 
     report = simple_metric._v1_metrics()
     metric_block = report[t.metrics]
@@ -188,7 +197,7 @@ def test_v1_sampled_lists(simple_metric):
 
 
 def test_listening_ports(simple_metric):
-    assert len(simple_metric.listening_tcp_ports) == 4
+    assert len(simple_metric.listening_tcp_ports) == 3
     assert len(simple_metric.listening_udp_ports) == 3
 
     if any(
@@ -229,7 +238,7 @@ def test_add_listening_ports_dedup(simple_metric):
     new_udp_port = [{"port": 999, "interface": "eth0"}]
 
     simple_metric.add_listening_ports("TCP", new_tcp_port)
-    assert len(simple_metric.listening_tcp_ports) == 4
+    assert len(simple_metric.listening_tcp_ports) == 3
 
     simple_metric.add_listening_ports("UDP", new_udp_port)
     assert len(simple_metric.listening_udp_ports) == 3
@@ -269,21 +278,123 @@ def test_network_stats_delta_calculation(simple_metric):
     assert m3.network_stats["bytes_out"] == 25
     assert m3.network_stats["packets_out"] == 25
 
+def test_network_stats_delta_with_short_names():
+    m1 = metrics.Metrics(short_names=True)
+    m1.add_network_stats(bytes_in=100, packets_in=50, bytes_out=200, packets_out=150)
+
+    m2 = metrics.Metrics(short_names=True, last_metric=m1)
+    m2.add_network_stats(bytes_in=125, packets_in=75, bytes_out=225, packets_out=175)
+
+    assert m2.network_stats == {"bi": 25, "bo": 25, "pi": 25, "po": 25}
+
+
+def test_counter_delta_wraparound_and_reset():
+    assert metrics.counter_delta(150, 100) == 50
+    # 32 bit counter wrapped past zero
+    assert metrics.counter_delta(20, metrics.COUNTER_WRAP - 30) == 50
+    # counter restarted from zero, e.g. after a reboot
+    assert metrics.counter_delta(40, 1000) == 40
+    assert metrics.counter_delta(40, 5 * metrics.COUNTER_WRAP) == 40
+    # a 64 bit counter reset from above 2 ** 31, e.g. by an interface flap, is not a wrap
+    assert metrics.counter_delta(40, 3 * 10 ** 9) == 40
+    assert metrics.counter_delta(metrics.COUNTER_WRAP_MARGIN, metrics.COUNTER_WRAP - 30) == metrics.COUNTER_WRAP_MARGIN
+
+
+def test_network_stats_delta_across_wrap():
+    m1 = metrics.Metrics()
+    m1.add_network_stats(bytes_in=metrics.COUNTER_WRAP - 10, packets_in=50, bytes_out=200, packets_out=150)
+
+    m2 = metrics.Metrics(last_metric=m1)
+    m2.add_network_stats(bytes_in=15, packets_in=75, bytes_out=225, packets_out=175)
+
+    assert m2.network_stats["bytes_in"] == 25
+
+
+def test_interval_uses_monotonic_clock():
+    with mock.patch.object(metrics.time, "time", side_effect=[1000, 900]), mock.patch.object(metrics.time, "monotonic", side_effect=[50.0, 55.5]):
+        m1 = metrics.Metrics()
+        m2 = metrics.Metrics(last_metric=m1)
+
+    assert m2.interval == 5.5
+
+
 def test_add_cpu_usage(simple_metric):
     assert len(simple_metric.cpu_metrics) == 1
     assert simple_metric.cpu_metrics["number"] == 50.5
 
 def test_add_network_connections(simple_metric):
-    assert len(simple_metric._net_connections) == 3
-    assert simple_metric._net_connections[0]["remote_addr"] == "10.10.10.10:80"
-    assert simple_metric._net_connections[1]["remote_addr"] == "11.11.11.11:80"
-    assert simple_metric._net_connections[2]["remote_addr"] == "[2001:0db8:85a3:0000:0000:8a2e:0370:7334]:80"
+    assert len(simple_metric.network_connections) == 3
+    assert simple_metric.network_connections[0]["remote_addr"] == "10.10.10.10:80"
+    assert simple_metric.network_connections[1]["remote_addr"] == "11.11.11.11:80"
+    assert simple_metric.network_connections[2]["remote_addr"] == "[2001:0db8:85a3:0000:0000:8a2e:0370:7334]:80"
 
 
 def test_add_network_connection_dedup(simple_metric):
-    assert len(simple_metric._net_connections) == 3
+    assert len(simple_metric.network_connections) == 3
     simple_metric.add_network_connection("10.10.10.10", 80, "eth0", 9009)
-    assert len(simple_metric._net_connections) == 3
+    assert len(simple_metric.network_connections) == 3
+    simple_metric.add_network_connection("10.10.10.10", 80, "eth1", 9009)
+    assert len(simple_metric.network_connections) == 4
+
+
+def test_add_network_connection_rejects_invalid_address():
+    m = metrics.Metrics()
+    with pytest.raises(ValueError):
+        m.add_network_connection("not-an-address", 80, "eth0", 9009)
+    assert len(m.network_connections) == 0
+
+
+def test_network_connections_formatted_with_short_names():
+    m = metrics.Metrics(short_names=True)
+    m.add_network_connection("2001:db8::1", 443, "eth0", 50000)
+
+    t = tags.Tags(short_names=True)
+    assert m.network_connections == [
+        {t.remote_addr: "[2001:db8::1]:443", t.local_interface: "eth0", t.local_port: 50000}
+    ]
+
+
+def test_address_cache_shared_between_metrics():
+    cache = metrics.AddressCache()
+    m1 = metrics.Metrics(address_cache=cache)
+    m1.add_network_connection("10.10.10.10", 80, "eth0", 9009)
+    m1.add_network_connection("2001:db8::1", 443, "eth0", 9010)
+    assert cache.hits == 0
+    assert cache.misses == 2
+
+    m2 = metrics.Metrics(last_metric=m1, address_cache=cache)
+    m2.add_network_connection("10.10.10.10", 80, "eth0", 9009)
+    m2.add_network_connection("2001:db8::1", 443, "eth0", 9010)
+    assert cache.hits == 2
+    assert cache.misses == 2
+
+    assert [c["remote_addr"] for c in m2.network_connections] == ["10.10.10.10:80", "[2001:db8::1]:443"]
+
+
+def test_address_cache_evicts_least_recently_used():
+    cache = metrics.AddressCache(maxsize=2)
+    cache.version("10.0.0.1")
+    cache.version("10.0.0.2")
+    cache.version("10.0.0.1")
+    cache.version("10.0.0.3")  # evicts 10.0.0.2
+    assert cache.hits == 1
+
+    cache.version("10.0.0.1")
+    assert cache.hits == 2
+    cache.version("10.0.0.2")
+    assert cache.misses == 4
+
+    cache.clear()
+    assert cache.hits == 0
+    assert cache.misses == 0
+
+
+def test_add_listening_ports_dedup_within_call():
+    m = metrics.Metrics()
+    m.add_listening_ports("TCP", [{"port": 80}, {"port": 80}, {"port": 80, "interface": "eth0"}])
+    m.add_listening_ports("TCP", [{"port": 443}])
+
+    assert m.listening_tcp_ports == [{"port": 80}, {"port": 80, "interface": "eth0"}, {"port": 443}]
 
 
 def test_field_sizes():
@@ -291,10 +402,10 @@ def test_field_sizes():
 
     m.add_network_stats(100, 50, 200, 150)
     m.add_network_connection("10.10.10.10", 80, "eth0", 99999)
-    m.listening_tcp_ports += [80, 88, 8000, 43]
-    m.listening_udp_ports += [999, 980, 9032]
+    m.add_listening_ports("TCP", [{"port": p} for p in [80, 88, 8000, 43]])
+    m.add_listening_ports("UDP", [{"port": p} for p in [999, 980, 9032]])
 
-    assert len(m._net_connections) == 1
+    assert len(m.network_connections) == 1
     assert len(m.listening_tcp_ports) == 4
     assert len(m.listening_udp_ports) == 3
     assert len(m.network_stats) == 0
@@ -307,11 +418,320 @@ def test_sampled_lists(simple_metric):
 
     for i in range(1, 20):
         m.add_network_connection("10.10.10." + str(i), i, "eth0", 99999)
-        m.listening_udp_ports.append(i)
-        m.listening_tcp_ports.append(i)
+        m.add_listening_ports("UDP", [{"port": i}])
+        m.add_listening_ports("TCP", [{"port": i}])
 
     report = m._v1_metrics()
     metric_block = report[t.metrics]
     assert len(metric_block[t.listening_tcp_ports][t.ports]) == 10
     assert len(metric_block[t.listening_udp_ports][t.ports]) == 10
     assert len(metric_block[t.tcp_conn][t.established_connections][t.connections]) == 10
+
+
+def test_serializations_share_sampled_report():
+    m = metrics.Metrics()
+    m.max_list_size = 5
+    for i in range(1, 50):
+        m.add_network_connection("10.10.10." + str(i), i, "eth0", 9000 + i)
+
+    assert json.loads(m.to_json_string()) == json.loads(m.to_json_string(pretty_print=True))
+    assert json.loads(m.to_json_string()) == cbor2.loads(m.to_cbor())
+
+
+def test_report_rebuilt_after_metrics_change():
+    t = tags.Tags()
+    m = metrics.Metrics()
+    m.add_network_connection("10.10.10.10", 80, "eth0", 9009)
+    report = json.loads(m.to_json_string())
+    assert report[t.metrics][t.tcp_conn][t.established_connections][t.total] == 1
+
+    m.add_network_connection("10.10.10.11", 80, "eth0", 9009)
+    m.add_listening_ports("TCP", [{"port": 80}])
+    report = json.loads(m.to_json_string())
+    assert report[t.metrics][t.tcp_conn][t.established_connections][t.total] == 2
+    assert report[t.metrics][t.listening_tcp_ports][t.total] == 1
+
+    m.add_cpu_usage(10.0)
+    assert cbor2.loads(m.to_cbor())[t.custom_metrics][t.cpu_usage] == [{"number": 10.0}]
+
+    m.max_list_size = 1
+    report = json.loads(m.to_json_string())
+    assert len(report[t.metrics][t.tcp_conn][t.established_connections][t.connections]) == 1
+
+
+@pytest.mark.parametrize("max_list_size", [None, 10])
+def test_streaming_serializers_match_full_serializers(simple_metric, max_list_size):
+    simple_metric.max_list_size = max_list_size
+    for i in range(1, 30):
+        simple_metric.add_network_connection("10.0.0." + str(i), i, "eth0", 1000 + i)
+        simple_metric.add_listening_ports("UDP", [{"port": i}])
+
+    assert bytes(simple_metric.write_json()) == simple_metric.to_json_string().encode()
+    assert bytes(simple_metric.write_cbor()) == simple_metric.to_cbor()
+
+
+def test_streaming_serializers_write_to_sinks(simple_metric):
+    buffer = bytearray(b"prefix")
+    assert simple_metric.write_cbor(buffer) is buffer
+    assert bytes(buffer) == b"prefix" + simple_metric.to_cbor()
+
+    sink = io.BytesIO()
+    simple_metric.write_json(sink)
+    assert sink.getvalue() == simple_metric.to_json_string().encode()
+
+
+def test_cbor_head_lengths():
+    for length in (0, 23, 24, 255, 256, 65535, 65536):
+        # every 0 encodes to a single byte, leaving the array head in front
+        encoded = cbor2.dumps([0] * length)
+        assert metrics._cbor_head(metrics.CBOR_ARRAY, length) == encoded[:len(encoded) - length]
+    assert metrics._cbor_head(metrics.CBOR_MAP, 2 ** 32) == b"\xbb" + (2 ** 32).to_bytes(8, "big")
+
+
+def _large_metric(short_names=False):
+    m = metrics.Metrics(short_names=short_names)
+    m.max_list_size = None
+    m.add_network_stats(bytes_in=100, packets_in=50, bytes_out=200, packets_out=150)
+    for i in range(1, 400):
+        m.add_network_connection("10.0.%d.%d" % (i // 256, i % 256), 443, "eth0", 1000 + i)
+        m.add_listening_ports("TCP", [{"port": i, "interface": "eth0"}])
+    m.add_listening_ports("UDP", [{"port": 53}])
+    return m
+
+
+@pytest.mark.parametrize("short_names", [False, True])
+@pytest.mark.parametrize("serialization_format", ["json", "cbor"])
+def test_payload_budget_fills_budget(short_names, serialization_format):
+    t = tags.Tags(short_names)
+    m = _large_metric(short_names)
+    m.set_payload_budget(4096, serialization_format)
+
+    if serialization_format == "json":
+        payload = m.to_json_string().encode()
+        report = json.loads(payload)
+        assert bytes(m.write_json()) == payload
+    else:
+        payload = m.to_cbor()
+        report = cbor2.loads(payload)
+        assert bytes(m.write_cbor()) == payload
+
+    assert len(payload) <= 4096
+    # no list item is larger than 60 bytes, so the budget is used up to that
+    assert len(payload) > 4096 - 60
+
+    metric_block = report[t.metrics]
+    connections = metric_block[t.tcp_conn][t.established_connections]
+    assert connections[t.total] == 399
+    assert 0 < len(connections[t.connections]) < 399
+    assert 0 < len(metric_block[t.listening_tcp_ports][t.ports]) < 399
+    assert metric_block[t.listening_udp_ports][t.ports] == [{"port": 53}]
+
+
+def test_payload_budget_respects_max_list_size():
+    m = _large_metric()
+    m.max_list_size = 5
+    m.set_payload_budget(128 * 1024)
+
+    t = tags.Tags()
+    metric_block = json.loads(m.to_json_string())[t.metrics]
+    assert len(metric_block[t.tcp_conn][t.established_connections][t.connections]) == 5
+    assert len(metric_block[t.listening_tcp_ports][t.ports]) == 5
+
+
+def test_payload_budget_too_small_for_items():
+    m = _large_metric()
+    m.set_payload_budget(10)
+
+    t = tags.Tags()
+    metric_block = json.loads(m.to_json_string())[t.metrics]
+    assert metric_block[t.tcp_conn][t.established_connections][t.connections] == []
+    assert metric_block[t.tcp_conn][t.established_connections][t.total] == 399
+
+
+def test_payload_budget_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        metrics.Metrics().set_payload_budget(1024, "xml")
+
+
+def test_sample_draws_from_sequences_and_iterables():
+    rng = random.Random(7)
+    records = dict.fromkeys(range(1000))
+
+    chosen = metrics.sample(records, 10, rng)
+    assert len(chosen) == 10
+    assert len(set(chosen)) == 10
+    assert chosen == sorted(chosen)  # input order is kept
+    assert all(c in records for c in chosen)
+
+    assert metrics.sample(list(range(1000)), 10, random.Random(7)) == chosen
+    assert metrics.sample(records, 1000, rng) == list(records)
+    assert metrics.sample(records, 0, rng) == []
+
+
+def test_record_set_lists_records_for_sampling():
+    records = metrics.RecordSet()
+    for i in range(1000):
+        records.add(i % 500)
+
+    assert records.records == list(range(500))
+    assert metrics.sample(records.records, 10, random.Random(7)) == metrics.sample(list(records), 10, random.Random(7))
+
+    m = metrics.Metrics(rng=random.Random(3))
+    for i in range(100):
+        m.add_network_connection("10.0.0.%d" % i, 443, "eth0", 5000)
+    m.max_list_size = 10
+    sampled = m._sample_list(m._net_connections)
+    assert len(sampled) == 10
+    assert all(c in m._net_connections for c in sampled)
+
+
+def test_seeded_sampling_is_reproducible_and_leaves_global_random_alone():
+    def build(seed):
+        m = metrics.Metrics(rng=random.Random(seed))
+        m.max_list_size = 5
+        for i in range(1, 100):
+            m.add_network_connection("10.0.0." + str(i), i, "eth0", 1000 + i)
+        return m
+
+    random.seed(1234)
+    expected_global = random.random()
+    random.seed(1234)
+
+    assert build(42).network_connections == build(42).network_connections
+    assert json.loads(build(42).to_json_string()) == json.loads(build(42).to_json_string())
+    assert random.random() == expected_global
+
+
+def test_record_reservoir_keeps_bounded_uniform_sample():
+    rng = random.Random(5)
+    reservoir = metrics.RecordReservoir(50, rng)
+    for i in range(10000):
+        reservoir.add(i)
+    reservoir.add(reservoir.records[0])  # duplicates of held records are ignored
+
+    assert len(reservoir) == 10000
+    assert len(reservoir.records) == 50
+    assert len(set(reservoir.records)) == 50
+    # a uniform sample of 0..9999 is very unlikely to sit in one half
+    assert any(r < 5000 for r in reservoir.records)
+    assert any(r >= 5000 for r in reservoir.records)
+
+
+def test_exact_record_reservoir_ignores_evicted_duplicates():
+    approximate = metrics.RecordReservoir(2, random.Random(5))
+    exact = metrics.RecordReservoir(2, random.Random(5), exact=True)
+    # e.g. SO_REUSEPORT workers listening on the same ports
+    for _ in range(3):
+        for port in range(100):
+            approximate.add(metrics.ListeningPort(port, "eth0"))
+            exact.add(metrics.ListeningPort(port, "eth0"))
+
+    assert len(approximate) > 100
+    assert len(exact) == 100
+    assert len(exact.records) == 2
+
+
+def test_reservoir_metrics_report_exact_totals():
+    t = tags.Tags()
+    m = metrics.Metrics(rng=random.Random(1), reservoir_size=20)
+    for i in range(5000):
+        m.add_network_connection("10.0.%d.%d" % (i // 256, i % 256), 443, "eth0", 1000 + i % 50000)
+        m.add_listening_ports("UDP", [{"port": i}])
+
+    assert len(m._net_connections.records) == 20
+    assert len(m.network_connections) == 20
+
+    metric_block = json.loads(m.to_json_string())[t.metrics]
+    connections = metric_block[t.tcp_conn][t.established_connections]
+    assert connections[t.total] == 5000
+    assert len(connections[t.connections]) == 20
+    assert metric_block[t.listening_udp_ports][t.total] == 5000
+    assert len(metric_block[t.listening_udp_ports][t.ports]) == 20
+
+    m.max_list_size = 5
+    metric_block = json.loads(m.to_json_string())[t.metrics]
+    assert len(metric_block[t.tcp_conn][t.established_connections][t.connections]) == 5
+
+
+def test_change_tracking_between_metrics():
+    m1 = metrics.Metrics(track_changes=True)
+    m1.add_network_connection("10.0.0.1", 443, "eth0", 5000)
+    m1.add_network_connection("10.0.0.2", 443, "eth0", 5001)
+    m1.add_listening_ports("TCP", [{"port": 22}])
+
+    changes = m1.changes
+    assert len(changes.connections.added) == 2
+    assert changes.connections.removed == ()
+    assert changes.tcp_ports.added == (metrics.ListeningPort(22, None),)
+
+    m2 = metrics.Metrics(last_metric=m1, track_changes=True)
+    m2.add_network_connection("10.0.0.2", 443, "eth0", 5001)
+    m2.add_network_connection("10.0.0.2", 443, "eth0", 5001)
+    m2.add_network_connection("10.0.0.3", 443, "eth0", 5002)
+    m2.add_listening_ports("TCP", [{"port": 22}])
+
+    changes = m2.changes
+    assert changes.connections.added == (metrics.NetworkConnection("10.0.0.3", 443, "eth0", 5002),)
+    assert changes.connections.removed == (metrics.NetworkConnection("10.0.0.1", 443, "eth0", 5000),)
+    assert changes.tcp_ports == metrics.ChangeSet((), ())
+    assert changes.udp_ports == metrics.ChangeSet((), ())
+
+    # unchanged records are the instances of the previous collection
+    previous = next(c for c in m1._net_connections if c.local_port == 5001)
+    assert next(c for c in m2._net_connections if c.local_port == 5001) is previous
+    assert len(m2.network_connections) == 2
+
+
+def test_change_tracking_record_set_moves_records_from_previous():
+    previous = metrics.ChangeTrackingRecordSet()
+    for port in range(5):
+        previous.add(metrics.ListeningPort(port, None))
+    snapshot = list(previous)
+
+    records = metrics.ChangeTrackingRecordSet(previous)
+    for port in range(1, 6):
+        records.add(metrics.ListeningPort(port, None))
+    records.add(metrics.ListeningPort(3, None))
+
+    assert records.changes() == metrics.ChangeSet((metrics.ListeningPort(5, None),),
+                                                  (metrics.ListeningPort(0, None),))
+    assert list(records) == [metrics.ListeningPort(port, None) for port in range(1, 6)]
+    # the previous collection still lists its records
+    assert list(previous) == snapshot
+
+    # the next collection releases the previous one, keeping its changes
+    unchanged = metrics.ChangeTrackingRecordSet(records)
+    for port in range(1, 6):
+        unchanged.add(metrics.ListeningPort(port, None))
+    assert unchanged.changes() == metrics.ChangeSet((), ())
+    assert records.changes().removed == (metrics.ListeningPort(0, None),)
+    assert records._previous is None
+
+
+def test_describe_changes():
+    m1 = metrics.Metrics(track_changes=True)
+    m1.add_network_connection("10.0.0.1", 443, "eth0", 5000)
+    m2 = metrics.Metrics(last_metric=m1, track_changes=True)
+    m2.add_network_connection("10.0.0.2", 443, "eth0", 5001)
+    m2.add_listening_ports("UDP", [{"port": 53}])
+
+    assert metrics.describe_changes(m2.changes) == "connections +1 -1, tcp ports +0 -0, udp ports +1 -0"
+
+
+def test_change_tracking_disabled_by_default():
+    assert metrics.Metrics().changes is None
+    with pytest.raises(ValueError):
+        metrics.Metrics(reservoir_size=10, track_changes=True)
+
+
+def test_fingerprint_covers_ports_and_connections_only():
+    def build(remote, cpu):
+        m = metrics.Metrics()
+        m.add_network_stats(100, 10, 200, 20)
+        m.add_network_connection(remote, 443, "eth0", 5000)
+        m.add_listening_ports("UDP", [{"port": 53}, {"port": 68}])
+        m.add_cpu_usage(cpu)
+        return m
+
+    assert build("10.0.0.1", 1.0).fingerprint() == build("10.0.0.1", 99.0).fingerprint()
+    assert build("10.0.0.1", 1.0).fingerprint() != build("10.0.0.2", 1.0).fingerprint()
@@ -0,0 +1,101 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+import pytest
+from AWSIoTDeviceDefenderAgentSDK import netdev, collector, metrics
+
+PROC_NET_DEV = """\
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo: 26606075    4919    0    0    0     0          0         0 26606075    4919    0    0    0     0       0          0
+  eth0: 12025930     503    0    0    0     0          0         0    32318     392    0    0    0     0       0          0
+"""
+
+
+def test_proc_net_dev_parses_table(tmp_path):
+    (tmp_path / "net").mkdir()
+    (tmp_path / "net" / "dev").write_text(PROC_NET_DEV)
+
+    assert netdev.proc_net_dev(str(tmp_path)) == [
+        ("lo", 26606075, 4919, 26606075, 4919),
+        ("eth0", 12025930, 503, 32318, 392),
+    ]
+
+
+def _deltas(counters):
+    return {name: tuple(deltas) for name, deltas in counters.update().items()}
+
+
+def test_interface_counters_deltas():
+    readings = [
+        [("eth0", 100, 10, 200, 20), ("lo", 5, 1, 5, 1)],
+        [("eth0", 150, 15, 260, 26), ("lo", 5, 1, 5, 1)],
+    ]
+    counters = netdev.InterfaceCounters(read=lambda: readings.pop(0))
+
+    assert _deltas(counters) == {}
+    assert _deltas(counters) == {"eth0": (50, 5, 60, 6), "lo": (0, 0, 0, 0)}
+
+
+def test_interface_counters_reuse_their_buffers():
+    readings = [[("eth%d" % i, 10 * n, n, 10 * n, n) for i in range(count)]
+                for n, count in enumerate((1, 1, 3, 3), 1)]
+    counters = netdev.InterfaceCounters(capacity=1, read=lambda: readings.pop(0))
+
+    counters.update()
+    first = counters.update()
+    assert tuple(first["eth0"]) == (10, 1, 10, 1)
+    # more interfaces than rows, the arrays grow
+    assert _deltas(counters) == {"eth0": (10, 1, 10, 1)}
+    last = counters.update()
+    assert last is first
+    assert {name: tuple(deltas) for name, deltas in last.items()} == {
+        "eth0": (10, 1, 10, 1), "eth1": (10, 1, 10, 1), "eth2": (10, 1, 10, 1)}
+
+
+def test_interface_counters_interfaces_come_and_go():
+    readings = [
+        [("eth0", 100, 10, 100, 10), ("veth1", 7, 7, 7, 7)],
+        [("eth0", 110, 11, 110, 11), ("veth2", 1, 1, 1, 1)],
+        [("eth0", 120, 12, 120, 12), ("veth2", 4, 2, 3, 2), ("veth3", 0, 0, 0, 0)],
+        # veth2 was recreated, its counters restart
+        [("eth0", 130, 13, 130, 13), ("veth2", 2, 1, 2, 1)],
+    ]
+    counters = netdev.InterfaceCounters(capacity=2, read=lambda: readings.pop(0))
+
+    counters.update()
+    # veth1 went away, and veth2 gets no deltas before its second collection
+    assert _deltas(counters) == {"eth0": (10, 1, 10, 1)}
+    assert _deltas(counters) == {"eth0": (10, 1, 10, 1), "veth2": (3, 1, 2, 1)}
+    assert _deltas(counters) == {"eth0": (10, 1, 10, 1), "veth2": (2, 1, 2, 1)}
+
+
+def test_interface_counters_wraparound():
+    readings = [
+        [("eth0", metrics.COUNTER_WRAP - 5, 1, 1, 1)],
+        [("eth0", 5, 1, 1, 1)],
+    ]
+    counters = netdev.InterfaceCounters(read=lambda: readings.pop(0))
+
+    counters.update()
+    assert _deltas(counters) == {"eth0": (10, 0, 0, 0)}
+
+
+@pytest.mark.skipif(not netdev.proc_net_dev_available(), reason="requires Linux procfs")
+def test_collector_per_interface_stats():
+    new_collector = collector.Collector(use_custom_metrics=False, per_interface_stats=True)
+
+    assert new_collector.collect_metrics().interface_network_stats == {}
+    second = new_collector.collect_metrics()
+
+    assert "lo" in second.interface_network_stats
+    assert set(second.interface_network_stats["lo"]) == {"bytes_in", "bytes_out", "packets_in", "packets_out"}
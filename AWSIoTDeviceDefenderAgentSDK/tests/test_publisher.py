@@ -0,0 +1,99 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from awscrt import mqtt5
+import pytest
+from AWSIoTDeviceDefenderAgentSDK import publisher
+
+TOPIC = "$aws/things/thing/defender/metrics/json"
+
+Puback = namedtuple("Puback", "reason_code")
+PublishCompletion = namedtuple("PublishCompletion", "puback")
+
+
+class FakeClient(object):
+    """Leaves publishes outstanding until the test completes them."""
+
+    def __init__(self):
+        self.futures = []
+        self.qos = []
+
+    def publish(self, topic, payload, qos=mqtt5.QoS.AT_MOST_ONCE):
+        future = Future()
+        self.futures.append((payload, future))
+        self.qos.append(qos)
+        return future
+
+    def ack(self, index, reason_code=mqtt5.PubackReasonCode.SUCCESS):
+        self.futures[index][1].set_result(PublishCompletion(Puback(reason_code)))
+
+
+def test_pipeline_window_applies_backpressure():
+    client = FakeClient()
+    pipeline = publisher.PublishPipeline(client, window=2)
+
+    assert pipeline.submit(TOPIC, "a")
+    assert pipeline.submit(TOPIC, "b")
+    assert pipeline.in_flight == 2
+    assert not pipeline.submit(TOPIC, "c", timeout=0.01)
+    assert len(client.futures) == 2
+
+    client.ack(0)
+    assert pipeline.submit(TOPIC, "c", timeout=0.01)
+    assert client.qos == [mqtt5.QoS.AT_LEAST_ONCE] * 3
+
+    client.ack(1)
+    client.ack(2)
+    assert pipeline.flush(timeout=1)
+    assert pipeline.published == 3
+    assert pipeline.latency.count == 3
+
+
+def test_pipeline_retries_with_backoff_then_gives_up():
+    client = FakeClient()
+    failures = []
+    pipeline = publisher.PublishPipeline(
+        client, window=1, max_retries=2, backoff=0.01, on_failure=lambda topic, payload: failures.append(payload)
+    )
+
+    pipeline.submit(TOPIC, "report")
+    client.futures[0][1].set_exception(RuntimeError("offline"))
+    # the rejected retry keeps its place in the window
+    for attempt in (1, 2):
+        deadline = time.monotonic() + 5
+        while len(client.futures) <= attempt and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert pipeline.in_flight == 1
+        client.ack(attempt, mqtt5.PubackReasonCode.NOT_AUTHORIZED)
+
+    assert pipeline.flush(timeout=1)
+    assert pipeline.retries == 2
+    assert pipeline.failed == 1
+    assert pipeline.published == 0
+    assert failures == ["report"]
+
+
+def test_latency_histogram():
+    histogram = publisher.LatencyHistogram(bounds=(0.1, 1.0))
+    for seconds in (0.05, 0.05, 0.5, 5.0):
+        histogram.record(seconds)
+
+    assert histogram.buckets == [(0.1, 2), (1.0, 1), (float("inf"), 1)]
+    assert histogram.percentile(0.5) == 0.1
+    assert histogram.percentile(0.75) == 1.0
+    assert histogram.percentile(1.0) == float("inf")
+    assert histogram.mean == pytest.approx(1.4)
+    assert histogram.maximum == 5.0
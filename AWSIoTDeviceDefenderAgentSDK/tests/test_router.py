@@ -0,0 +1,119 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+import threading
+import pytest
+from AWSIoTDeviceDefenderAgentSDK.router import TopicRouter, validate_topic_filter
+
+
+def _callback(name):
+    def callback(topic, payload):
+        pass
+
+    callback.__name__ = name
+    return callback
+
+
+@pytest.fixture
+def router():
+    topic_router = TopicRouter()
+    yield topic_router
+    topic_router.close()
+
+
+def test_exact_and_wildcard_filters(router):
+    exact, single, multi, other = (_callback(n) for n in ("exact", "single", "multi", "other"))
+    router.subscribe("things/thing/metrics/accepted", exact)
+    router.subscribe("things/+/metrics/accepted", single)
+    router.subscribe("things/#", multi)
+    router.subscribe("things/thing/jobs", other)
+
+    assert sorted(c.__name__ for c in router.match("things/thing/metrics/accepted")) == ["exact", "multi", "single"]
+    assert router.match("things/other/metrics/accepted") == [multi, single]
+    assert router.match("things/thing/metrics/rejected") == [multi]
+    assert router.match("elsewhere/thing") == []
+
+
+def test_multi_level_wildcard_matches_parent_level(router):
+    callback = _callback("multi")
+    router.subscribe("things/thing/#", callback)
+
+    assert router.match("things/thing") == [callback]
+    assert router.match("things") == []
+
+
+def test_single_level_wildcard_matches_one_level(router):
+    callback = _callback("single")
+    router.subscribe("things/+", callback)
+
+    assert router.match("things/thing") == [callback]
+    assert router.match("things/") == [callback]
+    assert router.match("things/thing/metrics") == []
+
+
+def test_wildcards_do_not_match_reserved_topics(router):
+    multi, single, aws = _callback("multi"), _callback("single"), _callback("aws")
+    router.subscribe("#", multi)
+    router.subscribe("+/things/thing", single)
+    router.subscribe("$aws/#", aws)
+
+    assert router.match("$aws/things/thing") == [aws]
+    assert router.match("any/things/thing") == [multi, single]
+
+
+def test_many_callbacks_per_filter_and_unsubscribe(router):
+    first, second = _callback("first"), _callback("second")
+    router.subscribe("a/b", first)
+    router.subscribe("a/b", second)
+    assert router.match("a/b") == [first, second]
+
+    router.unsubscribe("a/b", first)
+    assert router.match("a/b") == [second]
+    router.unsubscribe("a/b")
+    assert router.match("a/b") == []
+    # nodes left empty are pruned
+    assert not router._root.children
+
+
+@pytest.mark.parametrize("topic_filter", ["", "a/#/b", "a/b#", "a/+b", "a+/b"])
+def test_invalid_filters_are_rejected(topic_filter):
+    with pytest.raises(ValueError):
+        validate_topic_filter(topic_filter)
+
+
+def test_dispatch_runs_callbacks_on_workers_and_survives_errors(router):
+    release = threading.Event()
+    done = threading.Event()
+    threads = []
+
+    def slow(topic, payload):
+        threads.append(threading.current_thread())
+        release.wait(5)
+
+    def failing(topic, payload):
+        raise RuntimeError("broken handler")
+
+    def recorder(topic, payload):
+        threads.append(threading.current_thread())
+        done.set()
+
+    router.subscribe("a/+", slow)
+    router.subscribe("a/b", failing)
+    router.subscribe("a/#", recorder)
+
+    # returns without waiting for the slow callback
+    assert router.dispatch("a/b", b"payload") == 3
+    assert done.wait(5)
+    release.set()
+    router.close()
+    assert threading.current_thread() not in threads
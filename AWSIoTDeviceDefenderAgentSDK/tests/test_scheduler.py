@@ -0,0 +1,87 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+import random
+import pytest
+from AWSIoTDeviceDefenderAgentSDK.scheduler import Scheduler
+
+
+class FakeTime(object):
+    """Monotonic clock whose sleep advances it, optionally oversleeping by a fixed amount."""
+
+    def __init__(self, now=100.0, oversleep=0.0):
+        self.now = now
+        self.oversleep = oversleep
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds + self.oversleep
+
+
+def test_deadlines_do_not_drift_with_work_time():
+    fake = FakeTime()
+    scheduler = Scheduler(10, clock=fake.clock, sleep=fake.sleep)
+
+    for _ in range(5):
+        fake.now += 3  # time spent collecting and publishing
+        assert scheduler.wait() == 0
+
+    assert fake.sleeps == [7, 7, 7, 7, 7]
+    assert fake.now == 150
+    assert scheduler.tick == 5
+
+
+def test_overrun_skips_missed_deadlines():
+    fake = FakeTime()
+    scheduler = Scheduler(10, clock=fake.clock, sleep=fake.sleep)
+
+    fake.now += 25  # deadlines at 110 and 120 are missed
+    assert scheduler.wait() == 2
+    assert fake.now == 130
+    assert scheduler.missed == 2
+
+    fake.now += 1
+    assert scheduler.wait() == 0
+    assert fake.now == 140
+
+
+def test_lateness_stats():
+    fake = FakeTime(oversleep=0.5)
+    scheduler = Scheduler(10, clock=fake.clock, sleep=fake.sleep)
+
+    scheduler.wait()
+    fake.now += 1
+    scheduler.wait()
+
+    assert scheduler.lateness.count == 2
+    assert scheduler.lateness.maximum == pytest.approx(0.5)
+    assert scheduler.lateness.mean == pytest.approx(0.5)
+
+
+def test_jitter_stays_on_grid():
+    fake = FakeTime()
+    scheduler = Scheduler(10, jitter=2, clock=fake.clock, sleep=fake.sleep, rng=random.Random(7))
+
+    for tick in range(1, 20):
+        scheduler.wait()
+        assert 100 + tick * 10 <= fake.now < 100 + tick * 10 + 2
+
+
+@pytest.mark.parametrize("interval, jitter", [(0, 0), (10, -1), (10, 10)])
+def test_invalid_settings(interval, jitter):
+    with pytest.raises(ValueError):
+        Scheduler(interval, jitter)
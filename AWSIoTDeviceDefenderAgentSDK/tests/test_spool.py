@@ -0,0 +1,148 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+import pytest
+from AWSIoTDeviceDefenderAgentSDK import spool
+
+TOPIC = "$aws/things/thing/defender/metrics/cbor"
+
+
+def _drain(report_spool):
+    reports = []
+    while True:
+        report = report_spool.peek()
+        if report is None:
+            return reports
+        reports.append(report)
+        report_spool.pop()
+
+
+def test_spool_is_fifo(tmp_path):
+    report_spool = spool.ReportSpool(str(tmp_path), segment_bytes=256)
+    for i in range(20):
+        report_spool.append(TOPIC, b"report %d" % i)
+
+    assert len(report_spool) == 20
+    assert _drain(report_spool) == [(TOPIC, b"report %d" % i) for i in range(20)]
+    assert len(report_spool) == 0
+    # forwarded segments are deleted, only the one still appended to remains
+    assert len([name for name in os.listdir(str(tmp_path)) if name.endswith(spool.SEGMENT_SUFFIX)]) == 1
+
+
+def test_spool_drops_oldest_segments_when_full(tmp_path):
+    report_spool = spool.ReportSpool(str(tmp_path), max_bytes=1024, segment_bytes=256)
+    for i in range(100):
+        report_spool.append(TOPIC, b"report %03d" % i)
+
+    assert report_spool.size <= 1024
+    assert report_spool.dropped > 0
+    reports = _drain(report_spool)
+    assert len(reports) == 100 - report_spool.dropped
+    assert reports[-1] == (TOPIC, b"report 099")
+
+
+def test_spool_recovers_cursor_and_truncates_torn_tail(tmp_path):
+    report_spool = spool.ReportSpool(str(tmp_path), segment_bytes=256)
+    for i in range(10):
+        report_spool.append(TOPIC, b"report %d" % i)
+    for _ in range(3):
+        report_spool.peek()
+        report_spool.pop()
+    tail = report_spool._path(report_spool._segments[-1][0])
+    report_spool.close()
+
+    # a crash while appending leaves half a frame behind
+    with open(tail, "ab") as segment_file:
+        segment_file.write(spool.FRAME_HEADER.pack(100, 0) + b"torn")
+
+    reopened = spool.ReportSpool(str(tmp_path), segment_bytes=256)
+    assert len(reopened) == 7
+    reopened.append(TOPIC, b"report 10")
+    assert [payload for _, payload in _drain(reopened)] == [b"report %d" % i for i in range(3, 11)]
+
+
+def test_spool_reopened_after_everything_was_forwarded(tmp_path):
+    report_spool = spool.ReportSpool(str(tmp_path), segment_bytes=64)
+    for i in range(5):
+        report_spool.append(TOPIC, b"report %d" % i)
+    _drain(report_spool)
+    report_spool.close()
+
+    reopened = spool.ReportSpool(str(tmp_path), segment_bytes=64)
+    reopened.append(TOPIC, b"late")
+    reopened.close()
+
+    assert _drain(spool.ReportSpool(str(tmp_path), segment_bytes=64)) == [(TOPIC, b"late")]
+
+
+def test_spool_rejects_oversized_reports(tmp_path):
+    report_spool = spool.ReportSpool(str(tmp_path), max_bytes=128, segment_bytes=64)
+    with pytest.raises(ValueError):
+        report_spool.append(TOPIC, b"x" * 100)
+
+
+def test_token_bucket():
+    now = [0.0]
+    bucket = spool.TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+
+    for _ in range(2):
+        assert bucket.delay() == 0
+        bucket.take()
+    assert bucket.delay() == pytest.approx(0.5)
+    now[0] += 0.5
+    assert bucket.delay() == 0
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.connected = threading.Event()
+        self.published = []
+
+    def publish(self, topic, payload):
+        future = Future()
+        if self.connected.is_set():
+            self.published.append(payload)
+            future.set_result(None)
+        else:
+            future.set_exception(RuntimeError("offline"))
+        return future
+
+
+def test_store_and_forward(tmp_path):
+    client = FakeClient()
+    forwarder = spool.StoreAndForward(client, spool.ReportSpool(str(tmp_path)), rate=100, burst=100)
+    forwarder.start()
+    try:
+        # offline, reports are spooled
+        forwarder.publish(TOPIC, b"first")
+        forwarder.publish(TOPIC, b"second")
+        assert client.published == []
+        assert len(forwarder.spool) == 2
+
+        client.connected.set()
+        # the backlog keeps new reports in order behind it
+        forwarder.publish(TOPIC, b"third")
+
+        deadline = time.monotonic() + 5
+        while forwarder.forwarded < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.published == [b"first", b"second", b"third"]
+
+        forwarder.publish(TOPIC, b"fourth")
+        assert client.published[-1] == b"fourth"
+    finally:
+        forwarder.stop()
@@ -0,0 +1,40 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+import pytest
+from AWSIoTDeviceDefenderAgentSDK import metrics, tags
+
+
+@pytest.mark.parametrize("short_names", [False, True])
+def test_tag_table_matches_tags(short_names):
+    t = tags.Tags(short_names)
+    table = tags.get_tags(short_names)
+
+    for name in tags.TAG_FIELDS:
+        assert getattr(table, name) == getattr(t, name)
+    assert table.get(tags.Tags.PORT) == t.get(tags.Tags.PORT)
+
+
+def test_tag_tables_are_shared_singletons():
+    assert tags.get_tags(False) is tags.LONG_TAGS
+    assert tags.get_tags(True) is tags.SHORT_TAGS
+    assert metrics.Metrics(short_names=True).t is tags.SHORT_TAGS
+    assert metrics.Metrics().t is tags.LONG_TAGS
+
+
+def test_tag_table_is_immutable():
+    with pytest.raises(AttributeError):
+        tags.LONG_TAGS.header = "hed"
+    with pytest.raises(AttributeError):
+        del tags.SHORT_TAGS.header
+    assert tags.LONG_TAGS.header == "header"
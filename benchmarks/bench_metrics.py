@@ -0,0 +1,134 @@
+# Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+
+"""
+Benchmarks for building metrics reports from large connection tables.
+
+Run from the repository root with ``python -m benchmarks.bench_metrics``. Building a report should scale linearly with the
+number of connections, so the time per connection should stay roughly flat between sizes.
+"""
+
+import argparse
+import time
+import tracemalloc
+from AWSIoTDeviceDefenderAgentSDK import metrics
+
+SIZES = (10000, 100000)
+
+
+def _connections(count):
+    for i in range(count):
+        yield "10.%d.%d.%d" % ((i >> 16) & 0xFF, (i >> 8) & 0xFF, i & 0xFF), 443, "eth0", 1024 + i % 60000
+
+
+def bench_add_network_connection(count):
+    """Time adding count distinct connections, each twice, to a fresh Metrics object."""
+    conns = list(_connections(count))
+    m = metrics.Metrics()
+    start = time.perf_counter()
+    for conn in conns:
+        m.add_network_connection(*conn)
+    for conn in conns:
+        m.add_network_connection(*conn)
+    elapsed = time.perf_counter() - start
+    assert len(m.network_connections) == count
+    return elapsed
+
+
+def bench_add_listening_ports(count):
+    """Time adding count distinct listening ports, one call per port, then all again in one call."""
+    ports = [{"port": i % 65536, "interface": "eth%d" % (i // 65536)} for i in range(count)]
+    m = metrics.Metrics()
+    start = time.perf_counter()
+    for port in ports:
+        m.add_listening_ports("TCP", [port])
+    m.add_listening_ports("TCP", ports)
+    elapsed = time.perf_counter() - start
+    assert len(m.listening_tcp_ports) == count
+    return elapsed
+
+
+def bench_connection_memory(count):
+    """Measure the memory held by a Metrics object with count connections, returned in bytes."""
+    conns = list(_connections(count))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    m = metrics.Metrics()
+    for conn in conns:
+        m.add_network_connection(*conn)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert len(m.network_connections) == count
+    return held
+
+
+def _serialize(m, fmt, streaming):
+    if streaming:
+        return m.write_cbor() if fmt == "cbor" else m.write_json()
+    return m.to_cbor() if fmt == "cbor" else m.to_json_string()
+
+
+def bench_serialization(count, fmt, streaming):
+    """
+    Serialize an unsampled report of count connections, returned as (seconds, peak traced bytes, output bytes).
+    """
+    m = metrics.Metrics()
+    m.max_list_size = None
+    for conn in _connections(count):
+        m.add_network_connection(*conn)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = _serialize(m, fmt, streaming)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, len(output)
+
+
+BENCHMARKS = (
+    ("add_network_connection", bench_add_network_connection),
+    ("add_listening_ports", bench_add_listening_ports),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES, help="Connection counts to run at")
+    args = parser.parse_args()
+
+    for name, bench in BENCHMARKS:
+        per_item = []
+        for size in args.sizes:
+            elapsed = bench(size)
+            per_item.append(elapsed / size)
+            print("%-24s n=%-8d %8.3f s  %6.2f us/item" % (name, size, elapsed, elapsed / size * 1e6))
+        # linear scaling keeps the per item cost flat, quadratic scaling grows it with n
+        print("%-24s per item cost ratio, largest/smallest: %.2f" % (name, per_item[-1] / per_item[0]))
+
+    for size in args.sizes:
+        held = bench_connection_memory(size)
+        print("%-24s n=%-8d %8.1f MB  %6d bytes/connection" % ("connection_memory", size, held / 1e6, held // size))
+
+    # peak memory of the full report path holds the report dict and output, streaming only the output
+    for fmt in ("json", "cbor"):
+        for size in args.sizes:
+            for streaming in (False, True):
+                elapsed, peak, output_size = bench_serialization(size, fmt, streaming)
+                name = "%s_%s" % ("write" if streaming else "to", fmt)
+                print("%-24s n=%-8d %8.3f s  peak %6.1f MB  output %6.1f MB"
+                      % (name, size, elapsed, peak / 1e6, output_size / 1e6))
+
+
+if __name__ == "__main__":
+    main()